@@ -0,0 +1,127 @@
+"""
+benchmarks/common.py
+Timing harness, sample inputs and result storage shared by the benchmark scripts.
+Results are stored as one JSON file per git commit in RESULTS_DIR.
+"""
+
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import time
+from datetime import datetime
+
+RESULTS_DIR = os.path.join("data", "logs", "benchmarks")
+
+
+def time_call(fn, repeat: int = 5, number: int = 1, warmup: int = 1) -> dict:
+    """
+    Runs fn `number` times per sample, `repeat` samples, after `warmup` untimed runs.
+    Returns per-call seconds (min / median / mean) and calls per second.
+    """
+    for _ in range(warmup):
+        fn()
+
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) / number)
+
+    median = statistics.median(samples)
+    return {
+        "min_s": min(samples),
+        "median_s": median,
+        "mean_s": statistics.fmean(samples),
+        "ops_per_s": 1 / median if median > 0 else float("inf"),
+        "repeat": repeat,
+        "number": number,
+    }
+
+
+def poppler_available() -> bool:
+    """
+    Whether pdf2image can find poppler (on PATH or at the Windows path used by get_images_from_pdf).
+    """
+    return bool(shutil.which("pdftoppm")) or os.path.isdir(r"C:/Program Files (x86)/poppler-24.08.0/Library/bin")
+
+
+def make_sample_pdf(num_pages: int = 10, text_every: int = 0) -> bytes:
+    """
+    Small in-memory report: drawn "scanned-looking" pages, and a text page every
+    `text_every` pages (0 = image-only).
+    """
+    import fitz
+
+    doc = fitz.open()
+    for i in range(num_pages):
+        page = doc.new_page()
+        if text_every and i % text_every == 0:
+            page.insert_textbox(
+                fitz.Rect(50, 50, 550, 800),
+                "Besiktningsprotokoll för fastigheten Stockholm Marevik 23. "
+                "Taket uppvisar slitage och bör åtgärdas inom fem år. " * 12,
+            )
+        else:
+            for row in range(12):
+                page.draw_rect(fitz.Rect(60, 60 + row * 60, 540 - (row * 17) % 200, 90 + row * 60),
+                               color=(0, 0, 0), fill=(0.2, 0.2, 0.2))
+    pdf_bytes = doc.tobytes()
+    doc.close()
+    return pdf_bytes
+
+
+def git_commit() -> tuple[str, bool]:
+    """
+    Short HEAD commit and whether the working tree has uncommitted changes.
+    """
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+        dirty = bool(subprocess.check_output(["git", "status", "--porcelain", "--untracked-files=no"], text=True).strip())
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", False
+    return commit, dirty
+
+
+def results_path(commit: str) -> str:
+    return os.path.join(RESULTS_DIR, f"{commit}.json")
+
+
+def save_results(suite: str, results: dict, results_dir: str = RESULTS_DIR) -> str:
+    """
+    Merges one suite's results into the JSON file of the current commit.
+    """
+    commit, dirty = git_commit()
+    path = os.path.join(results_dir, f"{commit}.json")
+    data = {}
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+
+    data.update({
+        "commit": commit,
+        "dirty": dirty,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.platform(),
+    })
+    data.setdefault("suites", {})[suite] = results
+
+    os.makedirs(results_dir, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    return path
+
+
+def print_results(title: str, results: dict):
+    print(f"\n⏱️  {title}")
+    for name, r in results.items():
+        if "skipped" in r:
+            print(f"    {name:<32} skipped ({r['skipped']})")
+        elif "median_s" in r:
+            print(f"    {name:<32} median {r['median_s']*1000:10.3f} ms   {r['ops_per_s']:12.1f} ops/s")
+        else:
+            print(f"    {name:<32} " + ",  ".join(f"{k} {v:.2f}" for k, v in r.items() if isinstance(v, (int, float))))
@@ -0,0 +1,100 @@
+"""
+benchmarks/compare.py
+Compares stored benchmark results of two commits and flags regressions.
+
+    python -m benchmarks.compare                 # latest other commit vs HEAD
+    python -m benchmarks.compare a1b2c3d e4f5g6h --threshold 0.05
+
+Exits with status 1 if any benchmark regressed by more than the threshold.
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+
+from benchmarks.common import RESULTS_DIR, git_commit, results_path
+
+# Metric used per result, and whether higher is better
+LOWER_IS_BETTER = ("median_s",)
+HIGHER_IS_BETTER = ("pdfs_per_min", "pages_per_s")
+
+
+def load(ref: str) -> dict:
+    path = ref if os.path.exists(ref) else results_path(ref)
+    if not os.path.exists(path):
+        sys.exit(f"❌  No benchmark results for '{ref}' ({path})")
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def latest_other(commit: str) -> str | None:
+    candidates = []
+    for path in glob.glob(os.path.join(RESULTS_DIR, "*.json")):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("commit") != commit:
+            candidates.append((data.get("timestamp", ""), path))
+    return max(candidates)[1] if candidates else None
+
+
+def compare(base: dict, head: dict, threshold: float) -> list[dict]:
+    """
+    One row per metric present in both runs. `change` is the relative change in the
+    "better" direction (negative = worse); regressions are changes below -threshold.
+    """
+    rows = []
+    for suite, results in head.get("suites", {}).items():
+        base_results = base.get("suites", {}).get(suite, {})
+        for name, head_result in results.items():
+            base_result = base_results.get(name)
+            if not base_result:
+                continue
+            for metric in LOWER_IS_BETTER + HIGHER_IS_BETTER:
+                if metric not in head_result or metric not in base_result:
+                    continue
+                old, new = base_result[metric], head_result[metric]
+                if not old:
+                    continue
+                change = (old - new) / old if metric in LOWER_IS_BETTER else (new - old) / old
+                rows.append({
+                    "suite": suite,
+                    "name": name,
+                    "metric": metric,
+                    "base": old,
+                    "head": new,
+                    "change": change,
+                    "regression": change < -threshold,
+                })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare benchmark results between commits")
+    parser.add_argument("base", nargs="?", help="Base commit or results file (default: latest other commit)")
+    parser.add_argument("head", nargs="?", help="Head commit or results file (default: HEAD)")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative slowdown counted as regression")
+    args = parser.parse_args()
+
+    head_ref = args.head or git_commit()[0]
+    base_ref = args.base or latest_other(head_ref)
+    if base_ref is None:
+        sys.exit("❌  No other benchmark results to compare against")
+
+    base, head = load(base_ref), load(head_ref)
+    rows = compare(base, head, args.threshold)
+    print(f"\n📊  {base.get('commit')} → {head.get('commit')}  (threshold {args.threshold:.0%})")
+    for r in rows:
+        flag = "❌ REGRESSION" if r["regression"] else ("✅" if r["change"] > args.threshold else "")
+        print(f"    {r['name']:<40} {r['metric']:<13} {r['base']:>12.5g} → {r['head']:<12.5g} {r['change']:+7.1%}  {flag}")
+
+    regressions = [r for r in rows if r["regression"]]
+    if regressions:
+        print(f"\n❌  {len(regressions)} regression(s) beyond {args.threshold:.0%}")
+        sys.exit(1)
+    print("\n✅  No regressions")
+
+
+if __name__ == "__main__":
+    main()
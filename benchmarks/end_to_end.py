@@ -0,0 +1,151 @@
+"""
+benchmarks/end_to_end.py
+End-to-end throughput of run_pdf_tests against the replay transport with injected
+API latency. Generated PDFs are served from a local HTTP server and every output
+is written inside a temporary working directory, so nothing in data/ is touched.
+
+    python -m benchmarks.end_to_end --pdfs 5 --pages 8 --latency 0.2
+"""
+
+import argparse
+import csv
+import functools
+import importlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+# Never talk to the live API from a benchmark
+os.environ.setdefault("EXTRACTION_TRANSPORT", "replay")
+
+from benchmarks.common import make_sample_pdf, poppler_available, print_results, save_results
+from utils.transport import FaultInjector, ReplayClient, ReplayStore
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_directory(directory: str) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(_QuietHandler, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def pages_examined(tracer) -> int:
+    """
+    Distinct pages that were rasterized or checked for appendix, including pages
+    answered from the page dedup index.
+    """
+    pages = set()
+    with open(tracer.trace_path, encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            if record["stage"] == "rasterize" or record.get("call_type") == "appendix":
+                pages.add((record.get("pdf_id"), record.get("page")))
+    return len(pages)
+
+
+def run_pipeline(pdf_dir: str, pdf_ids: list[str], store: ReplayStore, latency_s: float = 0.0,
+                 rate_429: float = 0.0, page_dedup: bool = False, ground_truth_dir: str | None = None) -> dict:
+    """
+    Serves pdf_dir over HTTP and runs run_pdf_tests on pdf_ids with a replay client,
+    inside a temporary working directory. Returns elapsed time, PDFs and pages processed.
+    With ground_truth_dir (evaluation JSONs), the outputs are also scored against it.
+    """
+    repo_dir = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="bench_run_")
+    if ground_truth_dir:
+        shutil.copytree(ground_truth_dir, os.path.join(workdir, "data", "evaluation"))
+    server = serve_directory(pdf_dir)
+    csv_path = os.path.join(workdir, "inspection_urls.csv")
+    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "url"])
+        for pdf_id in pdf_ids:
+            writer.writerow([pdf_id, f"http://127.0.0.1:{server.server_port}/{pdf_id}.pdf"])
+
+    os.chdir(workdir)
+    try:
+        import utils.helpers as helpers
+        import extraction.extraction_script as es
+        es = importlib.reload(es)  # page hash index and result store are opened relative to the working directory
+        helpers.client = ReplayClient(store, FaultInjector(latency_s, rate_429=rate_429, seed=0))
+        es.PAGE_DEDUP = page_dedup
+
+        start = time.perf_counter()
+        run = es.run_pdf_tests(len(pdf_ids), False, csv_path, False)
+        elapsed = time.perf_counter() - start
+
+        stats = {"elapsed_s": elapsed, "pdfs": run.num_pdfs, "pages": pages_examined(es.tracing.get_tracer())}
+        if ground_truth_dir:
+            from evaluation.evaluate_outputs import compute_summary_stats, evaluate_field_level, load_eval_files
+            stats["f1_score"] = compute_summary_stats(evaluate_field_level(load_eval_files()))["f1_score"]
+    finally:
+        os.chdir(repo_dir)
+        server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return stats
+
+
+def run(num_pdfs: int = 5, pages: int = 8, latency_s: float = 0.2, rate_429: float = 0.0,
+        text_every: int | None = None, page_dedup: bool = False) -> dict:
+    repo_dir = os.getcwd()
+    store = ReplayStore(
+        cassette_path=None,
+        page_logs_dir=os.path.join(repo_dir, "data", "page_logs"),
+        evaluation_dir=os.path.join(repo_dir, "data", "evaluation"),
+    )
+    if text_every is None:
+        # Without poppler only text-layer pages can be processed
+        text_every = 0 if poppler_available() else 1
+
+    pdf_dir = tempfile.mkdtemp(prefix="bench_pdfs_")
+    pdf_bytes = make_sample_pdf(num_pages=pages, text_every=text_every)
+    pdf_ids = [store.seeded_ids[i % len(store.seeded_ids)] for i in range(num_pdfs)]
+    for pdf_id in pdf_ids:
+        with open(os.path.join(pdf_dir, f"{pdf_id}.pdf"), "wb") as f:
+            f.write(pdf_bytes)
+
+    try:
+        stats = run_pipeline(pdf_dir, pdf_ids, store, latency_s, rate_429, page_dedup)
+    finally:
+        shutil.rmtree(pdf_dir, ignore_errors=True)
+
+    return {
+        f"run_pdf_tests[{num_pdfs}x{pages}p, {latency_s}s latency]": {
+            "pdfs_per_min": stats["pdfs"] / stats["elapsed_s"] * 60,
+            "pages_per_s": stats["pages"] / stats["elapsed_s"],
+            **stats,
+            "text_every": text_every,
+            "latency_s": latency_s,
+            "rate_429": rate_429,
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end extraction throughput against a mocked API")
+    parser.add_argument("--pdfs", type=int, default=5)
+    parser.add_argument("--pages", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.2, help="Mean seconds per API call")
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--text-every", type=int, default=None, help="Text page every N pages (0 = image-only)")
+    parser.add_argument("--page-dedup", action="store_true")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    results = run(args.pdfs, args.pages, args.latency, args.rate_429, args.text_every, args.page_dedup)
+    print_results("End-to-end", results)
+    if not args.no_save:
+        print(f"\n💾 Saved to {save_results('end_to_end', results)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+benchmarks/micro.py
+Microbenchmarks of the extraction and evaluation hot paths.
+
+    python -m benchmarks.micro [--quick]
+"""
+
+import argparse
+import json
+import os
+
+# Never talk to the live API from a benchmark
+os.environ.setdefault("EXTRACTION_TRANSPORT", "replay")
+
+from benchmarks.common import make_sample_pdf, poppler_available, print_results, save_results, time_call
+from evaluation.bootstrap import BOOTSTRAP_RESAMPLES, bootstrap_intervals, count_matrix, paired_test
+from evaluation.evaluate_outputs import (
+    document_counts,
+    evaluate_field_level,
+    load_eval_files,
+    samples_to_table,
+    score_table,
+)
+from utils.helpers import (
+    build_synthesis_prompt,
+    encode_image,
+    get_images_from_pdf,
+    get_page_texts_from_pdf,
+    normalize_model_output,
+)
+
+
+def load_page_logs(limit: int = 20) -> list[list]:
+    page_logs = []
+    folder = os.path.join("data", "page_logs")
+    for name in sorted(os.listdir(folder))[:limit]:
+        with open(os.path.join(folder, name), encoding="utf-8") as f:
+            page_logs.append(json.load(f))
+    return page_logs
+
+
+def run(quick: bool = False) -> dict:
+    repeat = 3 if quick else 7
+    results = {}
+    pdf_bytes = make_sample_pdf(num_pages=10)
+
+    if poppler_available():
+        results["get_images_from_pdf[10p@200dpi]"] = time_call(
+            lambda: get_images_from_pdf(pdf_bytes, dpi=200), repeat=max(2, repeat // 2)
+        )
+        page_img = get_images_from_pdf(pdf_bytes, dpi=200, first_page=1, last_page=1)[0]
+        results["get_images_from_pdf[1p@200dpi]"] = time_call(
+            lambda: get_images_from_pdf(pdf_bytes, dpi=200, first_page=1, last_page=1), repeat=repeat
+        )
+    else:
+        results["get_images_from_pdf[10p@200dpi]"] = {"skipped": "poppler not found"}
+        from PIL import Image, ImageDraw
+        page_img = Image.new("RGB", (1654, 2339), "white")
+        draw = ImageDraw.Draw(page_img)
+        for y in range(100, 2200, 60):
+            draw.rectangle((120, y, 1500 - (y % 400), y + 24), fill="black")
+
+    results["get_page_texts_from_pdf[10p]"] = time_call(lambda: get_page_texts_from_pdf(pdf_bytes), repeat=repeat)
+    results["encode_image[A4@200dpi]"] = time_call(lambda: encode_image(page_img), repeat=repeat)
+
+    samples = load_eval_files()
+    outputs = [s["model_output"] for s in samples]
+    results[f"normalize_model_output[x{len(outputs)}]"] = time_call(
+        lambda: [normalize_model_output(o) for o in outputs], repeat=repeat, number=10
+    )
+
+    page_logs = load_page_logs()
+    results[f"build_synthesis_prompt[x{len(page_logs)}]"] = time_call(
+        lambda: [build_synthesis_prompt(p) for p in page_logs], repeat=repeat, number=5
+    )
+
+    results[f"evaluate_field_level[{len(samples)} docs]"] = time_call(
+        lambda: evaluate_field_level(samples), repeat=repeat, number=10
+    )
+
+    _, fields, counts = count_matrix(document_counts(score_table(samples_to_table(samples))))
+    results[f"bootstrap_intervals[{len(samples)} docs, {BOOTSTRAP_RESAMPLES} resamples]"] = time_call(
+        lambda: bootstrap_intervals(counts, fields), repeat=repeat
+    )
+    results[f"paired_test[{len(samples)} docs, {BOOTSTRAP_RESAMPLES} resamples]"] = time_call(
+        lambda: paired_test(counts, counts[::-1], fields), repeat=repeat
+    )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks for extraction/evaluation hot paths")
+    parser.add_argument("--quick", action="store_true", help="Fewer repetitions")
+    parser.add_argument("--no-save", action="store_true", help="Don't store results for this commit")
+    args = parser.parse_args()
+
+    results = run(args.quick)
+    print_results("Microbenchmarks", results)
+    if not args.no_save:
+        print(f"\n💾 Saved to {save_results('micro', results)}")
+
+
+if __name__ == "__main__":
+    main()
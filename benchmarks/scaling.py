@@ -0,0 +1,145 @@
+"""
+benchmarks/scaling.py
+Time and memory scaling of the extraction pipeline across document size and corpus
+size, on synthetic image-only reports (benchmarks/synthetic_reports.py) answered by
+a mocked model (replay transport seeded from the corpus' planted values).
+
+    python -m benchmarks.scaling --pages 5,30,150 --docs 5
+    python -m benchmarks.scaling --pages 10 --docs 10,100,1000 --filler-pool 16
+
+Every configuration runs in a fresh child process so peak RSS is per configuration.
+Reports under 4 pages are skipped by the pipeline, so keep --pages at 4 or more.
+Since the mocked model answers perfectly, an F1 below 1.0 means documents were lost,
+and a page_coverage below 1.0 that pages before the appendix were never examined.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# Never talk to the live API from a benchmark
+os.environ.setdefault("EXTRACTION_TRANSPORT", "replay")
+
+from benchmarks.common import poppler_available, print_results, save_results
+from benchmarks.synthetic_reports import generate_corpus
+
+RESULT_MARKER = "SCALING_RESULT "
+
+
+def run_child(corpus_dir: str, latency_s: float, page_dedup: bool) -> dict:
+    """
+    Runs the pipeline on one corpus (inside the child process) and returns its stats.
+    """
+    from benchmarks.end_to_end import run_pipeline
+    from utils.tracing import peak_rss_mb
+    from utils.transport import ReplayStore
+
+    store = ReplayStore(
+        cassette_path=None,
+        page_logs_dir=os.path.join(corpus_dir, "page_logs"),
+        evaluation_dir=os.path.join(corpus_dir, "mock_outputs"),
+    )
+    import extraction.extraction_script  # noqa: F401  count import overhead in the baseline
+    baseline_rss = peak_rss_mb()
+
+    stats = run_pipeline(
+        pdf_dir=os.path.join(corpus_dir, "pdfs"),
+        pdf_ids=store.seeded_ids,
+        store=store,
+        latency_s=latency_s,
+        page_dedup=page_dedup,
+        ground_truth_dir=os.path.join(corpus_dir, "evaluation"),
+    )
+    with open(os.path.join(corpus_dir, "manifest.json"), encoding="utf-8") as f:
+        reports = json.load(f)["reports"]
+    # Every page up to and including the first appendix page gets examined
+    expected_pages = sum(r["pages"] if r["appendix_at"] is None else r["appendix_at"] + 1 for r in reports)
+    stats["page_coverage"] = stats["pages"] / expected_pages if expected_pages else 0.0
+    stats["baseline_rss_mb"] = baseline_rss
+    stats["peak_rss_mb"] = peak_rss_mb()
+    return stats
+
+
+def run_config(pages: int, docs: int, dpi: int, latency_s: float, page_dedup: bool,
+               filler_pool: int, seed: int) -> dict:
+    corpus_dir = tempfile.mkdtemp(prefix="bench_corpus_")
+    try:
+        start = time.perf_counter()
+        generate_corpus(corpus_dir, num_docs=docs, pages=pages, dpi=dpi, seed=seed, filler_pool=filler_pool)
+        generate_s = time.perf_counter() - start
+        corpus_mb = sum(
+            os.path.getsize(os.path.join(corpus_dir, "pdfs", name)) for name in os.listdir(os.path.join(corpus_dir, "pdfs"))
+        ) / 1e6
+
+        cmd = [sys.executable, "-m", "benchmarks.scaling", "--child", corpus_dir, "--latency", str(latency_s)]
+        if page_dedup:
+            cmd.append("--page-dedup")
+        proc = subprocess.run(cmd, capture_output=True, text=True, encoding="utf-8")
+    finally:
+        shutil.rmtree(corpus_dir, ignore_errors=True)
+
+    lines = [line for line in proc.stdout.splitlines() if line.startswith(RESULT_MARKER)]
+    if proc.returncode != 0 or not lines:
+        return {"skipped": f"child failed ({proc.returncode}): {proc.stderr.strip().splitlines()[-1:] or ''}"}
+
+    stats = json.loads(lines[-1][len(RESULT_MARKER):])
+    return {
+        "pdfs_per_min": stats["pdfs"] / stats["elapsed_s"] * 60,
+        "pages_per_s": stats["pages"] / stats["elapsed_s"],
+        "s_per_pdf": stats["elapsed_s"] / max(stats["pdfs"], 1),
+        **stats,
+        "rss_growth_mb": (stats["peak_rss_mb"] or 0) - (stats["baseline_rss_mb"] or 0),
+        "corpus_mb": corpus_mb,
+        "generate_s": generate_s,
+    }
+
+
+def run(pages_list: list[int], docs_list: list[int], dpi: int = 150, latency_s: float = 0.0,
+        page_dedup: bool = False, filler_pool: int = 0, seed: int = 0) -> dict:
+    if not poppler_available():
+        return {"scaling": {"skipped": "poppler not found (synthetic reports are image-only)"}}
+
+    results = {}
+    for docs in docs_list:
+        for pages in pages_list:
+            name = f"scaling[{docs}x{pages}p@{dpi}dpi]"
+            print(f"▶️  {name}")
+            results[name] = run_config(pages, docs, dpi, latency_s, page_dedup, filler_pool, seed)
+    return results
+
+
+def _int_list(value: str) -> list[int]:
+    return [int(v) for v in value.split(",") if v]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time/memory scaling on synthetic reports with a mocked model")
+    parser.add_argument("--pages", type=_int_list, default=[5, 30, 150], help="Comma-separated page counts")
+    parser.add_argument("--docs", type=_int_list, default=[5], help="Comma-separated corpus sizes")
+    parser.add_argument("--dpi", type=int, default=150)
+    parser.add_argument("--latency", type=float, default=0.0, help="Mean seconds per mocked API call")
+    parser.add_argument("--page-dedup", action="store_true")
+    parser.add_argument("--filler-pool", type=int, default=0, help="Reuse N pre-rendered filler pages when generating")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-save", action="store_true")
+    parser.add_argument("--child", metavar="CORPUS_DIR", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        stats = run_child(args.child, args.latency, args.page_dedup)
+        print(RESULT_MARKER + json.dumps(stats))
+        return
+
+    results = run(args.pages, args.docs, args.dpi, args.latency, args.page_dedup, args.filler_pool, args.seed)
+    print_results("Scaling", results)
+    if not args.no_save:
+        print(f"\n💾 Saved to {save_results('scaling', results)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+benchmarks/startup.py
+Startup-time check for the CLI and the modules every tool imports. Each command runs
+in a fresh interpreter inside an empty directory, and three things are checked:
+
+  - the median time over the bare interpreter stays within its budget,
+  - heavy dependencies (openai, pandas, fitz, ...) are not imported,
+  - nothing is written to the working directory.
+
+    python -m benchmarks.startup            # exits with status 1 if a check fails
+    python -m cli bench startup --repeat 15
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import print_results, save_results
+
+# name -> (python arguments, budget in seconds over `python -c pass`, modules that must not be imported)
+CHECKS = {
+    "cli --help": (
+        ["-m", "cli", "--help"], 0.15,
+        ["openai", "pandas", "numpy", "fitz", "pymupdf", "pdf2image", "PIL", "requests"],
+    ),
+    "cli summary --help": (
+        ["-m", "cli", "summary", "--help"], 0.2,
+        ["openai", "pandas", "numpy", "fitz", "pymupdf", "pdf2image", "PIL", "requests"],
+    ),
+    "import utils.helpers": (
+        ["-c", "import utils.helpers"], 0.25,
+        ["openai", "pandas", "fitz", "pymupdf", "pdf2image", "PIL", "requests"],
+    ),
+    "import extraction.extraction_script": (
+        ["-c", "import extraction.extraction_script"], 0.6,
+        ["openai", "pandas", "fitz", "pymupdf", "pdf2image"],
+    ),
+}
+
+# Appended to each command: reports which of the watched modules ended up imported
+_MODULES_PROBE = "import sys, json; print('STARTUP_MODULES ' + json.dumps(sorted(sys.modules)))"
+
+
+def _env(repo_dir: str) -> dict:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = repo_dir + os.pathsep + env.get("PYTHONPATH", "")
+    # Any API client built at import time would fail here instead of going unnoticed
+    env.pop("OPENAI_API_KEY", None)
+    env.pop("EXTRACTION_TRANSPORT", None)
+    return env
+
+
+def time_command(args: list[str], cwd: str, env: dict, repeat: int) -> list[float]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *args], cwd=cwd, env=env, capture_output=True)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def imported_modules(args: list[str], cwd: str, env: dict) -> tuple[set, str]:
+    """
+    Top-level modules imported by a command (run via runpy so the probe sees them), and its stderr.
+    """
+    if args[0] == "-m":
+        code = f"import runpy, sys; sys.argv = {[args[1], *args[2:]]!r}\ntry:\n    runpy.run_module({args[1]!r}, run_name='__main__')\nexcept SystemExit:\n    pass\n"
+    else:
+        code = args[1] + "\n"
+    proc = subprocess.run([sys.executable, "-c", code + _MODULES_PROBE], cwd=cwd, env=env, capture_output=True, text=True)
+    for line in proc.stdout.splitlines():
+        if line.startswith("STARTUP_MODULES "):
+            return {name.split(".")[0] for name in json.loads(line[len("STARTUP_MODULES "):])}, proc.stderr
+    return set(), proc.stderr
+
+
+def run(repeat: int = 7) -> tuple[dict, list[str]]:
+    repo_dir = os.getcwd()
+    env = _env(repo_dir)
+    results, failures = {}, []
+
+    with tempfile.TemporaryDirectory(prefix="startup_") as cwd:
+        baseline = statistics.median(time_command(["-c", "pass"], cwd, env, repeat))
+        for name, (args, budget, forbidden) in CHECKS.items():
+            samples = time_command(args, cwd, env, repeat)
+            median = statistics.median(samples)
+            modules, stderr = imported_modules(args, cwd, env)
+            heavy = sorted(set(forbidden) & modules)
+
+            results[name] = {
+                "median_s": median,
+                "ops_per_s": 1 / median if median > 0 else float("inf"),
+                "overhead_s": median - baseline,
+                "budget_s": budget,
+                "repeat": repeat,
+            }
+            if median - baseline > budget:
+                failures.append(f"{name}: {(median - baseline)*1000:.0f} ms over the bare interpreter (budget {budget*1000:.0f} ms)")
+            if heavy:
+                failures.append(f"{name}: imports {', '.join(heavy)}")
+            if not modules:
+                failures.append(f"{name}: failed to run ({stderr.strip().splitlines()[-1:] or ''})")
+
+        written = sorted(os.listdir(cwd))
+        if written:
+            failures.append(f"files created at import time: {', '.join(written)}")
+
+    results["python -c pass"] = {"median_s": baseline, "ops_per_s": 1 / baseline if baseline > 0 else float("inf")}
+    return results, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup-time and import-side-effect check")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    results, failures = run(args.repeat)
+    print_results("Startup", results)
+    if not args.no_save:
+        print(f"\n💾 Saved to {save_results('startup', results)}")
+
+    if failures:
+        print("\n❌ Startup check failed:")
+        for failure in failures:
+            print(f"  - {failure}")
+        sys.exit(1)
+    print("\n✅ Startup within budget, no heavy imports or files created at import time")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+"""
+benchmarks/synthetic_reports.py
+Generates synthetic image-only inspection reports for scaling tests, together with
+ground truth in the data/evaluation format and mocked model answers for the replay
+transport.
+
+    python -m benchmarks.synthetic_reports --out data/synthetic/demo --docs 20 --pages 30 --dpi 150
+
+Corpus layout:
+    <out>/pdfs/<id>.pdf                  scanned-looking pages, no text layer
+    <out>/evaluation/<id>.json           {"pdf_id", "model_output", "ground_truth"}
+    <out>/page_logs/<id>_pages.json      mocked per-page answers (ReplayStore page_logs_dir)
+    <out>/mock_outputs/<id>.json         mocked synthesis answers (ReplayStore evaluation_dir)
+    <out>/manifest.json                  generation parameters and per-document specs
+"""
+
+import argparse
+import copy
+import functools
+import io
+import json
+import os
+import random
+import time
+from dataclasses import asdict, dataclass, field
+
+from PIL import Image, ImageDraw, ImageFilter
+
+from schema.compiled import SCHEMA
+
+# A4 in PDF points
+PAGE_SIZE_PT = (595, 842)
+MARGIN_PT = 65
+FONT_SIZE_PT = 11
+JPEG_QUALITY = 70
+
+KOMMUNER = ["Stockholm", "Uppsala", "Sundbyberg", "Nacka", "Solna", "Huddinge", "Täby", "Lidingö"]
+TRAKTER = ["Heden", "Marevik", "Terränglöparen", "Björken", "Solrosen", "Kvarnen", "Ekbacken", "Lärkan"]
+
+FILLER_SENTENCES = [
+    "Besiktningen omfattar en okulär kontroll av tillgängliga utrymmen.",
+    "Fönster och dörrar fungerar normalt vid besiktningstillfället.",
+    "Ytskikt i kök och vardagsrum bedöms vara i normalt skick för husets ålder.",
+    "Elinstallationer har inte kontrollerats inom ramen för denna besiktning.",
+    "Ventilationen sker genom självdrag via kanaler i kök och badrum.",
+    "Uppvärmning sker med vattenburen värme och radiatorer under fönster.",
+    "Dränering och markförhållanden har inte undersökts närmare.",
+    "Utvändiga ytor besiktigades från marknivå.",
+    "Inga anmärkningar noterades avseende trappor och räcken.",
+    "Protokollet ska läsas i sin helhet tillsammans med bilagor.",
+    "Köpare rekommenderas att själv undersöka fastigheten noggrant.",
+    "Tvättstugan är utrustad med golvbrunn och tätskikt av plastmatta.",
+]
+
+# Planted phrases per schema field and subkey; each mentions only its own location
+FINDING_PHRASES = {
+    "MoistureDamage": {
+        "mentions_garage": "Fuktskador noterades i garagets väggar och golv.",
+        "mentions_källare": "Förhöjd fuktkvot uppmättes i källarens ytterväggar.",
+        "mentions_roof": "Fuktfläckar på takets undersida tyder på läckage.",
+        "mentions_balcony": "Fuktskador noterades på balkongplattornas undersida.",
+        "mentions_bjälklag": "Fuktskadat träbjälklag konstaterades i krypgrunden.",
+        "mentions_facade": "Fukt har trängt in bakom fasadens puts.",
+    },
+    "RenovationNeeds": {
+        "roof": "Takets tätskikt är uttjänt och bör bytas inom fem år.",
+        "garage": "Garagets port och tak är i dåligt skick och behöver renoveras.",
+        "facade": "Fasaden bör renoveras och ommålas inom de närmaste åren.",
+        "balcony": "Balkongerna har sprickor och bör renoveras.",
+        "källare": "Källarens ytskikt är slitna och bör renoveras.",
+        "bjälklag": "Bjälklaget bör förstärkas och renoveras.",
+    },
+    "AsbestosPresence": {
+        "Measured": "Asbestinventering har utförts av ackrediterat laboratorium.",
+        "presence": "Asbest påträffades i äldre rörisolering.",
+    },
+}
+
+APPENDIX_HEADINGS = ["Bilaga 1 – Allmänna villkor", "Bilaga – Besiktningsmannens ansvar", "Allmänna villkor för överlåtelsebesiktning"]
+
+
+@dataclass
+class ReportSpec:
+    """
+    Everything planted in one synthetic report. appendix_at is the 0-based index of
+    the first appendix page (None = no appendix); placements maps "Field.subkey" to
+    the page the phrase is printed on.
+    """
+    pdf_id: str
+    pages: int
+    dpi: int
+    appendix_at: int | None
+    cadastral: str
+    inspection_date: str
+    findings: dict = field(default_factory=dict)
+    placements: dict = field(default_factory=dict)
+    seed: int = 0
+
+
+def random_spec(pdf_id: str, rng: random.Random, pages: int = 20, dpi: int = 150,
+                appendix_at: float | int | None = 0.8, finding_rate: float = 0.3) -> ReportSpec:
+    """
+    Draws planted values for one report. A float appendix_at is a fraction of the
+    page count, an int an exact page index.
+    """
+    if isinstance(appendix_at, float):
+        appendix_at = max(1, int(pages * appendix_at)) if pages > 1 else None
+    if appendix_at is not None:
+        # The cover page is never an appendix
+        appendix_at = max(1, appendix_at) if appendix_at < pages else None
+
+    cadastral = f"{rng.choice(KOMMUNER)} {rng.choice(TRAKTER)} {rng.randint(1, 40)}:{rng.randint(1, 300)}"
+    inspection_date = f"{rng.randint(2005, 2025)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+
+    findings = {
+        name: {subkey: rng.random() < finding_rate for subkey in SCHEMA.subfields[name]}
+        for name in FINDING_PHRASES
+    }
+    # Asbestos can only be found if it was measured
+    findings["AsbestosPresence"]["Measured"] |= findings["AsbestosPresence"]["presence"]
+
+    body_end = appendix_at if appendix_at is not None else pages
+    body_pages = range(1, body_end) if body_end > 1 else range(1)
+    placements = {
+        f"{name}.{subkey}": rng.choice(body_pages)
+        for name, values in findings.items()
+        for subkey, planted in values.items() if planted
+    }
+    return ReportSpec(pdf_id, pages, dpi, appendix_at, cadastral, inspection_date,
+                      findings, placements, rng.randint(0, 2**31))
+
+
+def ground_truth(spec: ReportSpec) -> dict:
+    """
+    Ground truth as annotated in data/evaluation: dates at month precision.
+    """
+    truth = SCHEMA.default_ground_truth()
+    truth["CadastralDesignation"] = spec.cadastral
+    truth["InspectionDate"] = spec.inspection_date[:7]
+    for name, values in spec.findings.items():
+        truth[name] = dict(values)
+    return truth
+
+
+def page_phrases(spec: ReportSpec) -> dict[int, list[tuple[str, str, str]]]:
+    by_page = {}
+    for path, page in spec.placements.items():
+        name, subkey = path.split(".", 1)
+        by_page.setdefault(page, []).append((name, subkey, FINDING_PHRASES[name][subkey]))
+    return by_page
+
+
+def mock_answers(spec: ReportSpec) -> tuple[list[dict], dict]:
+    """
+    Answers a perfect model would give: one page result per page before the appendix,
+    and the synthesized final output.
+    """
+    by_page = page_phrases(spec)
+    blank = SCHEMA.default_ground_truth()
+    page_results = []
+    for i in range(spec.appendix_at if spec.appendix_at is not None else spec.pages):
+        result = copy.deepcopy(blank)
+        if i == 0:
+            result["CadastralDesignation"] = spec.cadastral
+            result["InspectionDate"] = spec.inspection_date[:7]
+        phrases = by_page.get(i, [])
+        for name, subkey, _ in phrases:
+            result[name][subkey] = True
+        result["SummaryInsights"] = " ".join(p for _, _, p in phrases) or None
+        page_results.append(result)
+
+    final = ground_truth(spec)
+    final["SummaryInsights"] = " ".join(p for _, phrases in sorted(by_page.items()) for _, _, p in phrases) or None
+    return page_results, SCHEMA.normalize(final)
+
+
+def render_page(lines: list[str], dpi: int, rng: random.Random) -> Image.Image:
+    """
+    Typesets lines of text on an A4 page, rasterizes it in grayscale and makes it look
+    scanned: speckle noise, a slight skew and blur.
+    """
+    import fitz
+
+    doc = fitz.open()
+    page = doc.new_page(width=PAGE_SIZE_PT[0], height=PAGE_SIZE_PT[1])
+    y = MARGIN_PT
+    for line in lines:
+        if y > PAGE_SIZE_PT[1] - MARGIN_PT:
+            break
+        page.insert_text((MARGIN_PT, y), line, fontsize=FONT_SIZE_PT, fontname="helv", color=(0.1, 0.1, 0.1))
+        y += FONT_SIZE_PT * 1.6
+    pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+    img = Image.frombytes("L", (pix.width, pix.height), pix.samples)
+    doc.close()
+
+    draw = ImageDraw.Draw(img)
+    for _ in range(img.width * img.height // 4000):
+        draw.point((rng.randrange(img.width), rng.randrange(img.height)), fill=rng.randint(0, 160))
+
+    img = img.rotate(rng.uniform(-0.8, 0.8), resample=Image.BILINEAR, fillcolor=255)
+    return img.filter(ImageFilter.GaussianBlur(radius=dpi / 300))
+
+
+def wrap(text: str, width: int = 80) -> list[str]:
+    lines, line = [], ""
+    for word in text.split():
+        if line and len(line) + len(word) + 1 > width:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}".strip()
+    return lines + [line] if line else lines
+
+
+def page_lines(spec: ReportSpec, page: int, rng: random.Random) -> list[str]:
+    if spec.appendix_at is not None and page >= spec.appendix_at:
+        lines = [rng.choice(APPENDIX_HEADINGS), ""]
+    elif page == 0:
+        lines = [
+            "BESIKTNINGSPROTOKOLL",
+            "Överlåtelsebesiktning",
+            "",
+            f"Fastighetsbeteckning: {spec.cadastral}",
+            f"Besiktningsdatum: {spec.inspection_date}",
+            "",
+        ]
+    else:
+        lines = [f"{page + 1}. Iakttagelser", ""]
+
+    body = [rng.choice(FILLER_SENTENCES) for _ in range(rng.randint(14, 24))]
+    for _, _, phrase in page_phrases(spec).get(page, []):
+        body.insert(rng.randrange(len(body) + 1), phrase)
+    lines.extend(wrap(" ".join(body)))
+    lines.append("")
+    lines.append(f"Sida {page + 1} av {spec.pages}")
+    return lines
+
+
+def _jpeg(img: Image.Image) -> bytes:
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=JPEG_QUALITY)
+    return buffer.getvalue()
+
+
+@functools.lru_cache(maxsize=64)
+def _pooled_filler_page(dpi: int, variant: int) -> bytes:
+    rng = random.Random(variant)
+    lines = [f"{variant % 40 + 2}. Iakttagelser", ""] + wrap(" ".join(rng.choice(FILLER_SENTENCES) for _ in range(20)))
+    return _jpeg(render_page(lines, dpi, rng))
+
+
+def build_pdf(spec: ReportSpec, filler_pool: int = 0) -> bytes:
+    """
+    Renders every page of the report as a JPEG image in a PDF without a text layer.
+    With filler_pool > 0, body pages without planted phrases are drawn from that many
+    pre-rendered variants, which makes very large corpora cheap to generate (at the
+    price of many near-identical pages, which page dedup will pick up).
+    """
+    import fitz
+
+    rng = random.Random(spec.seed)
+    phrases = page_phrases(spec)
+    doc = fitz.open()
+    for i in range(spec.pages):
+        in_appendix = spec.appendix_at is not None and i >= spec.appendix_at
+        if filler_pool and i > 0 and not in_appendix and i not in phrases:
+            image_bytes = _pooled_filler_page(spec.dpi, rng.randrange(filler_pool))
+        else:
+            image_bytes = _jpeg(render_page(page_lines(spec, i, rng), spec.dpi, rng))
+        page = doc.new_page(width=PAGE_SIZE_PT[0], height=PAGE_SIZE_PT[1])
+        page.insert_image(page.rect, stream=image_bytes)
+    pdf_bytes = doc.tobytes(garbage=1, deflate=True)
+    doc.close()
+    return pdf_bytes
+
+
+def _write_json(path: str, data) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+
+
+def generate_corpus(out_dir: str, num_docs: int = 10, pages: int = 20, dpi: int = 150,
+                    appendix_at: float | int | None = 0.8, finding_rate: float = 0.3,
+                    seed: int = 0, filler_pool: int = 0, id_prefix: str = "syn") -> list[ReportSpec]:
+    """
+    Writes a synthetic corpus to out_dir (layout in the module docstring) and returns the specs.
+    Evaluation files start with an all-null model_output; an extraction run fills it in
+    and keeps the ground truth.
+    """
+    for sub in ("pdfs", "evaluation", "page_logs", "mock_outputs"):
+        os.makedirs(os.path.join(out_dir, sub), exist_ok=True)
+
+    rng = random.Random(seed)
+    specs = []
+    start = time.perf_counter()
+    for n in range(num_docs):
+        spec = random_spec(f"{id_prefix}{n:06d}", rng, pages, dpi, appendix_at, finding_rate)
+        with open(os.path.join(out_dir, "pdfs", f"{spec.pdf_id}.pdf"), "wb") as f:
+            f.write(build_pdf(spec, filler_pool))
+
+        page_results, final = mock_answers(spec)
+        _write_json(os.path.join(out_dir, "evaluation", f"{spec.pdf_id}.json"), {
+            "pdf_id": spec.pdf_id,
+            "model_output": SCHEMA.normalize({}),
+            "ground_truth": ground_truth(spec),
+        })
+        _write_json(os.path.join(out_dir, "page_logs", f"{spec.pdf_id}_pages.json"), page_results)
+        _write_json(os.path.join(out_dir, "mock_outputs", f"{spec.pdf_id}.json"),
+                    {"pdf_id": spec.pdf_id, "model_output": final})
+        specs.append(spec)
+
+        if (n + 1) % 100 == 0:
+            print(f"  {n + 1}/{num_docs} reports ({time.perf_counter() - start:.1f}s)")
+
+    _write_json(os.path.join(out_dir, "manifest.json"), {
+        "num_docs": num_docs,
+        "pages": pages,
+        "dpi": dpi,
+        "appendix_at": appendix_at,
+        "finding_rate": finding_rate,
+        "seed": seed,
+        "filler_pool": filler_pool,
+        "reports": [asdict(s) for s in specs],
+    })
+    return specs
+
+
+def _appendix_arg(value: str) -> float | int | None:
+    if value.lower() == "none":
+        return None
+    return float(value) if "." in value else int(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic image-only inspection reports")
+    parser.add_argument("--out", default=os.path.join("data", "synthetic", "corpus"))
+    parser.add_argument("--docs", type=int, default=10)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--dpi", type=int, default=150)
+    parser.add_argument("--appendix-at", type=_appendix_arg, default=0.8,
+                        help="First appendix page: fraction (0.8), page index (12) or 'none'")
+    parser.add_argument("--finding-rate", type=float, default=0.3, help="Probability each finding is planted")
+    parser.add_argument("--filler-pool", type=int, default=0, help="Reuse N pre-rendered filler pages (0 = all unique)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    generate_corpus(args.out, args.docs, args.pages, args.dpi, args.appendix_at,
+                    args.finding_rate, args.seed, args.filler_pool)
+    print(f"✅ {args.docs} reports × {args.pages} pages written to {args.out} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
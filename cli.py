@@ -0,0 +1,119 @@
+"""
+cli.py
+Single entry point for the pipeline:
+
+    python -m cli extract [--count N | --ids ID ...]    batch extraction (extraction/batch_extraction.py)
+    python -m cli serve [--port 8080]                   HTTP extraction service
+    python -m cli ingest [--once --batch-size N ...]    extract new CSV rows / dropped PDFs as they arrive
+    python -m cli reextract [--threshold T --execute]   plan/run selective page re-extraction
+    python -m cli evaluate [--run_name ... --notes ...] field-level evaluation of data/evaluation
+    python -m cli compare [RUN_DIR ...]                 compare output sets against the shared ground truth
+    python -m cli summary [--last N]                    recent runs and cost trade-offs from the run registry
+    python -m cli index {status,import}                 result store / run registry / page hash index
+    python -m cli bench {micro,end_to_end,scaling,compare,startup} [...]
+
+Everything after the subcommand is passed on to that tool, so `python -m cli summary --help`
+shows the summary options. Nothing beyond the standard library is imported until a
+subcommand needs it; `python -m cli bench startup` checks that this stays fast.
+"""
+
+import argparse
+import importlib
+import os
+import sys
+
+# subcommand -> (module with a main(), help)
+COMMANDS = {
+    "extract": ("extraction.batch_extraction", "Run a batch extraction or re-extract specific PDFs"),
+    "serve": ("extraction.service", "Start the local HTTP extraction service"),
+    "ingest": ("extraction.ingest_daemon", "Watch the URL CSV and data/inbox and extract new documents"),
+    "reextract": ("extraction.reextract_planner", "Plan or run re-extraction of low-confidence pages"),
+    "evaluate": ("evaluation.evaluate_outputs", "Evaluate data/evaluation and log the run"),
+    "compare": ("evaluation.compare_runs", "Compare several output sets on the same annotated PDFs"),
+    "summary": ("evaluation.log_summary", "Summarise recent evaluation runs and their cost"),
+}
+
+BENCHMARKS = {
+    "micro": "benchmarks.micro",
+    "end_to_end": "benchmarks.end_to_end",
+    "scaling": "benchmarks.scaling",
+    "compare": "benchmarks.compare",
+    "startup": "benchmarks.startup",
+}
+
+
+def run_module(module: str, prog: str, argv: list[str]) -> None:
+    """
+    Imports module and runs its main() as if it had been started with `python -m module argv...`.
+    """
+    sys.argv = [prog, *argv]
+    importlib.import_module(module).main()
+
+
+def index_status() -> None:
+    import json
+    import sqlite3
+
+    from extraction.extraction_script import PAGE_HASH_INDEX_PATH
+    from utils.result_store import STORE_PATH
+    from utils.run_registry import REGISTRY_PATH
+
+    if os.path.exists(PAGE_HASH_INDEX_PATH):
+        with open(PAGE_HASH_INDEX_PATH, encoding="utf-8") as f:
+            entries = len(json.load(f))
+        print(f"🖼️ Page hash index   {PAGE_HASH_INDEX_PATH}: {entries} pages")
+    else:
+        print(f"🖼️ Page hash index   {PAGE_HASH_INDEX_PATH}: missing")
+
+    for title, path, table in (
+        ("🗄️ Result store     ", STORE_PATH, "documents"),
+        ("🗃️ Run registry     ", REGISTRY_PATH, "evaluations"),
+    ):
+        if not os.path.exists(path):
+            print(f"{title} {path}: missing (build it with: python -m cli index import)")
+            continue
+        with sqlite3.connect(f"file:{path}?mode=ro", uri=True) as conn:
+            runs, rows = conn.execute(f"SELECT (SELECT COUNT(*) FROM runs), (SELECT COUNT(*) FROM {table})").fetchone()
+        print(f"{title} {path}: {runs} runs, {rows} {table}")
+
+
+def index_import() -> None:
+    from utils.result_store import ResultStore
+    from utils.run_registry import RunRegistry
+
+    with ResultStore() as store:
+        counts = store.import_data_dir()
+    print(f"🗄️ Result store: {', '.join(f'{run} {n}' for run, n in counts.items())}")
+    with RunRegistry() as registry:
+        counts = registry.imported or registry.import_csv_logs()
+    print(f"🗃️ Run registry: {counts['runs']} batches, {counts['evaluations']} evaluations imported")
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m cli", description="Inspection report extraction pipeline")
+    sub = parser.add_subparsers(dest="command", required=True, metavar="COMMAND")
+    for name, (_, help_text) in COMMANDS.items():
+        sub.add_parser(name, help=help_text, add_help=False)
+
+    p_index = sub.add_parser("index", help="Status of / import into the result store and run registry")
+    p_index.add_argument("action", choices=["status", "import"], nargs="?", default="status")
+
+    p_bench = sub.add_parser("bench", help="Benchmarks and the startup-time check", add_help=False)
+    p_bench.add_argument("suite", choices=list(BENCHMARKS), nargs="?")
+
+    args, rest = parser.parse_known_args(argv)
+
+    if args.command in COMMANDS:
+        run_module(COMMANDS[args.command][0], f"python -m cli {args.command}", rest)
+    elif args.command == "index":
+        if rest:
+            parser.error(f"unrecognized arguments: {' '.join(rest)}")
+        index_status() if args.action == "status" else index_import()
+    elif args.suite is None:
+        p_bench.print_help()
+    else:
+        run_module(BENCHMARKS[args.suite], f"python -m cli bench {args.suite}", rest)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+evaluation/bootstrap.py
+Bootstrap confidence intervals for the evaluation metrics, and paired significance
+tests between two runs. With a few dozen annotated PDFs, a one-point F1 change
+between runs is often within the noise; these tell the two apart.
+
+Everything works on a document-by-field count matrix (tp, fp, fn per document and
+field path, aggregates included, as document_counts returns them). A resample draws
+documents with replacement, and its totals are one matrix product of the per-document
+draw counts with that matrix, so all resamples are computed at once:
+
+    python -m evaluation.bootstrap                          # intervals for data/evaluation
+    python -m evaluation.bootstrap data/baseline_gpt_4_1_v1 data/evaluation   # paired test, first is the reference
+"""
+
+import argparse
+
+import numpy as np
+
+BOOTSTRAP_RESAMPLES = 10_000
+CONFIDENCE_LEVEL = 0.95
+OVERALL = "overall"  # field name of the metrics over all fields, as compute_summary_stats sums them
+METRICS = ("accuracy", "precision", "recall", "f1_score")
+
+
+def count_matrix(doc_counts: dict, docs: list | None = None, fields: list | None = None) -> tuple[list, list, np.ndarray]:
+    """
+    (docs, fields, counts) from {doc: {field: [tp, fp, fn]}}, where counts[d, f] holds
+    (tp, fp, fn) of docs[d] and fields[f]; fields missing from a document count as zero.
+    """
+    docs = list(doc_counts) if docs is None else docs
+    if fields is None:
+        fields = list(dict.fromkeys(field for doc in docs for field in doc_counts.get(doc, {})))
+    index = {field: i for i, field in enumerate(fields)}
+    counts = np.zeros((len(docs), len(fields), 3), dtype=np.float64)
+    for d, doc in enumerate(docs):
+        for field, c in doc_counts.get(doc, {}).items():
+            if field in index:
+                counts[d, index[field]] = c
+    return docs, fields, counts
+
+
+def _ratio(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(denominator > 0, numerator / denominator, 0.0)
+
+
+def metrics(totals: np.ndarray) -> dict:
+    """
+    {metric: array} from (..., 3) tp/fp/fn totals, with compute_summary_stats' definitions
+    (F1 = 2tp / (2tp + fp + fn) is the harmonic mean of precision and recall).
+    """
+    tp, fp, fn = totals[..., 0], totals[..., 1], totals[..., 2]
+    return {
+        "accuracy": _ratio(tp, tp + fp + fn),
+        "precision": _ratio(tp, tp + fp),
+        "recall": _ratio(tp, tp + fn),
+        "f1_score": _ratio(2 * tp, 2 * tp + fp + fn),
+    }
+
+
+def resample_weights(num_docs: int, resamples: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    (resamples, num_docs) matrix: how often each document is drawn in each resample.
+    """
+    draws = rng.integers(0, num_docs, size=(resamples, num_docs))
+    offsets = (np.arange(resamples) * num_docs)[:, None]
+    return np.bincount((draws + offsets).ravel(), minlength=resamples * num_docs).reshape(resamples, num_docs).astype(np.float64)
+
+
+def _resampled_totals(weights: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    # (resamples, docs) @ (docs, fields * 3) -> (resamples, fields, 3), plus the sum over fields
+    num_docs, num_fields, _ = counts.shape
+    totals = (weights @ counts.reshape(num_docs, num_fields * 3)).reshape(-1, num_fields, 3)
+    return np.concatenate([totals, totals.sum(axis=1, keepdims=True)], axis=1)
+
+
+def _interval(samples: np.ndarray, level: float) -> tuple[np.ndarray, np.ndarray]:
+    alpha = (1 - level) / 2
+    low, high = np.quantile(samples, [alpha, 1 - alpha], axis=0)
+    return low, high
+
+
+def bootstrap_intervals(counts: np.ndarray, fields: list, resamples: int = BOOTSTRAP_RESAMPLES,
+                        level: float = CONFIDENCE_LEVEL, seed: int | None = 0) -> dict:
+    """
+    Percentile intervals over documents resampled with replacement:
+    {field or OVERALL: {metric: {"estimate", "low", "high"}}}. Per field only F1 is
+    reported; OVERALL has every metric of compute_summary_stats.
+    """
+    rng = np.random.default_rng(seed)
+    full = np.concatenate([counts.sum(axis=0), counts.sum(axis=(0, 1))[None]], axis=0)
+    estimates = metrics(full)
+    resampled = metrics(_resampled_totals(resample_weights(len(counts), resamples, rng), counts))
+
+    intervals = {}
+    names = list(fields) + [OVERALL]
+    for metric in METRICS:
+        low, high = _interval(resampled[metric], level)
+        for i, name in enumerate(names):
+            if name == OVERALL or metric == "f1_score":
+                intervals.setdefault(name, {})[metric] = {
+                    "estimate": float(estimates[metric][i]), "low": float(low[i]), "high": float(high[i]),
+                }
+    return {OVERALL: intervals.pop(OVERALL), **intervals}
+
+
+def paired_test(counts_a: np.ndarray, counts_b: np.ndarray, fields: list, resamples: int = BOOTSTRAP_RESAMPLES,
+                level: float = CONFIDENCE_LEVEL, seed: int | None = 0, metric: str = "f1_score") -> dict:
+    """
+    Run B against run A on the same documents (counts aligned by document and field):
+    {field or OVERALL: {"a", "b", "delta", "low", "high", "p_value"}}.
+
+    The interval of the delta resamples documents for both runs together. The p-value
+    is a paired permutation test: under "no difference" each document's results could
+    belong to either run, so random swaps give the null distribution of the delta.
+    """
+    rng = np.random.default_rng(seed)
+    num_docs = len(counts_a)
+
+    def totals(counts):
+        return np.concatenate([counts.sum(axis=0), counts.sum(axis=(0, 1))[None]], axis=0)
+
+    a, b = metrics(totals(counts_a))[metric], metrics(totals(counts_b))[metric]
+    observed = b - a
+
+    weights = resample_weights(num_docs, resamples, rng)
+    deltas = metrics(_resampled_totals(weights, counts_b))[metric] - metrics(_resampled_totals(weights, counts_a))[metric]
+    low, high = _interval(deltas, level)
+
+    # Swapping document d moves (b - a)[d] from B's totals to A's
+    swaps = rng.integers(0, 2, size=(resamples, num_docs)).astype(np.float64)
+    moved = _resampled_totals(swaps, counts_b - counts_a)
+    total_a, total_b = totals(counts_a)[None], totals(counts_b)[None]
+    null = metrics(total_b - moved)[metric] - metrics(total_a + moved)[metric]
+    extreme = (np.abs(null) >= np.abs(observed) - 1e-12).sum(axis=0)
+    p_values = (extreme + 1) / (resamples + 1)
+
+    names = list(fields) + [OVERALL]
+    tests = {
+        name: {
+            "a": float(a[i]), "b": float(b[i]), "delta": float(observed[i]),
+            "low": float(low[i]), "high": float(high[i]), "p_value": float(p_values[i]),
+        }
+        for i, name in enumerate(names)
+    }
+    return {OVERALL: tests.pop(OVERALL), **tests}
+
+
+def aligned_matrices(scored: dict, pdf_ids: list) -> tuple[list, dict]:
+    """
+    (fields, {run name: counts}) for scored tables (score_table) of several runs, with the
+    same pdf_ids and fields in the same order for every run, as paired_test needs them.
+    """
+    from evaluation.evaluate_outputs import document_counts
+
+    doc_counts = {name: document_counts(table) for name, table in scored.items()}
+    fields = list(dict.fromkeys(
+        field for counts in doc_counts.values() for doc in counts.values() for field in doc
+    ))
+    return fields, {name: count_matrix(counts, pdf_ids, fields)[2] for name, counts in doc_counts.items()}
+
+
+def format_interval(interval: dict) -> str:
+    return f"{interval['estimate']*100:5.1f} % [{interval['low']*100:5.1f}, {interval['high']*100:5.1f}]"
+
+
+def format_test(test: dict) -> str:
+    return (f"Δ {test['delta']*100:+5.1f} pts [{test['low']*100:+5.1f}, {test['high']*100:+5.1f}]  "
+            f"p = {test['p_value']:.3f}{'  *' if test['p_value'] < 1 - CONFIDENCE_LEVEL else ''}")
+
+
+def print_intervals(intervals: dict, num_docs: int, level: float = CONFIDENCE_LEVEL):
+    print(f"\n🎲 Bootstrap {level:.0%} intervals over {num_docs} documents")
+    for metric, interval in intervals[OVERALL].items():
+        print(f"   {metric:<10} {format_interval(interval)}")
+    for field, field_intervals in intervals.items():
+        if field != OVERALL:
+            print(f"   {field:<36} F1 {format_interval(field_intervals['f1_score'])}")
+
+
+def main():
+    import time
+
+    from evaluation.compare_runs import align_runs, load_ground_truth, parse_run_spec, score_runs
+    from evaluation.evaluate_outputs import EVAL_FOLDER
+
+    parser = argparse.ArgumentParser(description="Bootstrap intervals for one output set, or a paired test between two")
+    parser.add_argument("runs", nargs="*", help="One or two run folders (name=folder); the first is the reference")
+    parser.add_argument("--truth", default=EVAL_FOLDER, help="Evaluation folder holding the shared ground truth")
+    parser.add_argument("--resamples", type=int, default=BOOTSTRAP_RESAMPLES)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if len(args.runs) > 2:
+        parser.error("give at most two runs")
+
+    runs = dict(parse_run_spec(spec) for spec in args.runs or [EVAL_FOLDER])
+    truth = load_ground_truth(args.truth)
+    pdf_ids, _ = align_runs(runs, truth)
+    scored = score_runs(runs, truth, pdf_ids)
+    fields, matrices = aligned_matrices(scored, pdf_ids)
+
+    start = time.perf_counter()
+    for name, counts in matrices.items():
+        print(f"\n📁 {name}")
+        print_intervals(bootstrap_intervals(counts, fields, args.resamples, seed=args.seed), len(pdf_ids))
+    if len(runs) == 2:
+        (name_a, counts_a), (name_b, counts_b) = matrices.items()
+        tests = paired_test(counts_a, counts_b, fields, args.resamples, seed=args.seed)
+        print(f"\n⚖️  {name_b} vs {name_a} (paired, {args.resamples} resamples / permutations)")
+        for field, test in tests.items():
+            print(f"   {field:<36} {format_test(test)}")
+    print(f"\n⏱️ {args.resamples} resamples in {time.perf_counter() - start:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,391 @@
+"""
+evaluation/compare_runs.py
+Scores several output sets (e.g. data/evaluation and the data/baseline_* snapshots)
+against one shared ground truth in a single pass and compares them: overall metrics
+with bootstrap intervals, per-field F1 deltas against a reference run with paired
+significance tests, per-document flips, cost/latency from the run registry, and
+cost-vs-quality Pareto fronts.
+
+    python -m evaluation.compare_runs                     # data/evaluation vs every data/baseline_*
+    python -m evaluation.compare_runs data/baseline_gpt_4_1_v1 gpt4o=data/baseline_gpt_4_o_v2
+    python -m evaluation.compare_runs data/evaluation gpt4o=data/baseline_gpt_4_o_v2 --run-id gpt4o=batch_2025-05-02_1412
+
+Registry costs belong to batches (batch_YYYY-MM-DD_HHMM), not folders. A folder is
+charged the batches that wrote its documents, found by matching its outputs against the
+result store, or the batches given with --run-id; runs without either show no cost.
+
+Documents are aligned by pdf_id: only PDFs present in every run and annotated in the
+ground truth folder are read and scored, so the runs are compared on the same set.
+Runs are scored in parallel, one worker per run.
+"""
+
+import argparse
+import glob
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from evaluation.bootstrap import (
+    CONFIDENCE_LEVEL,
+    OVERALL,
+    aligned_matrices,
+    bootstrap_intervals,
+    format_test,
+    paired_test,
+)
+from evaluation.evaluate_outputs import (
+    EVAL_FOLDER,
+    compute_summary_stats,
+    counts_to_results,
+    field_counts,
+    flatten_sample,
+    score_table,
+    to_table,
+)
+from evaluation.log_summary import pareto_front, pretty_interval, pretty_percent, pretty_usd
+from utils.result_store import STORE_PATH, open_readonly
+from utils.run_registry import REGISTRY_PATH, RunRegistry
+
+BASELINE_GLOB = os.path.join("data", "baseline_*")
+
+_shared_truth = {}
+
+
+def parse_run_spec(spec: str) -> tuple[str, str]:
+    """
+    "name=folder" or just "folder" (named after the folder).
+    """
+    name, sep, folder = spec.partition("=")
+    if not sep:
+        folder = spec
+        name = os.path.basename(os.path.normpath(spec))
+    return name, folder
+
+
+def load_ground_truth(folder: str = EVAL_FOLDER) -> dict:
+    """
+    {pdf_id: ground_truth} from an evaluation folder, the shared annotations every run is scored against.
+    """
+    truth = {}
+    for name in os.listdir(folder):
+        if name.endswith(".json"):
+            with open(os.path.join(folder, name), encoding="utf-8") as f:
+                sample = json.load(f)
+            if sample.get("ground_truth") is not None:
+                truth[str(sample.get("pdf_id", name[:-len(".json")]))] = sample["ground_truth"]
+    return truth
+
+
+def _init_worker(truth: dict):
+    global _shared_truth
+    _shared_truth = truth
+
+
+def _score_run(folder: str, pdf_ids: list[str]):
+    """
+    Scores the aligned documents of one run against the shared ground truth (runs in a worker process).
+    """
+    rows = []
+    for pdf_id in pdf_ids:
+        with open(os.path.join(folder, f"{pdf_id}.json"), encoding="utf-8") as f:
+            sample = json.load(f)
+        sample["ground_truth"] = _shared_truth[pdf_id]
+        rows.extend(flatten_sample(sample, pdf_id))
+    return score_table(to_table([rows], len(pdf_ids))).drop(columns=["pred", "actual"])
+
+
+def align_runs(runs: dict, truth: dict) -> tuple[list[str], dict]:
+    """
+    pdf_ids present in every run folder and in the ground truth, plus the number of
+    documents each run has outside that set.
+    """
+    ids = {
+        name: {f[:-len(".json")] for f in os.listdir(folder) if f.endswith(".json")}
+        for name, folder in runs.items()
+    }
+    common = set(truth).intersection(*ids.values())
+    return sorted(common), {name: len(run_ids - common) for name, run_ids in ids.items()}
+
+
+def score_runs(runs: dict, truth: dict, pdf_ids: list[str], workers: int | None = None) -> dict:
+    """
+    {run name: scored table} for every run, in parallel when there is more than one.
+    """
+    names, folders = list(runs), list(runs.values())
+    if len(runs) <= 1 or (workers or os.cpu_count() or 1) <= 1:
+        _init_worker(truth)
+        return {name: _score_run(folder, pdf_ids) for name, folder in zip(names, folders)}
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(truth,)) as pool:
+        return dict(zip(names, pool.map(_score_run, folders, [pdf_ids] * len(folders))))
+
+
+def f1(tp, fp, fn):
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    return 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+
+
+def field_f1_table(results: dict, reference: str) -> pd.DataFrame:
+    """
+    F1 per field (rows) and run (columns), plus the delta of every other run against the reference.
+    """
+    table = pd.DataFrame({
+        name: {field: f1(c["tp"], c["fp"], c["fn"]) for field, c in fields.items()}
+        for name, fields in results.items()
+    })
+    for name in results:
+        if name != reference:
+            table[f"Δ {name}"] = table[name] - table[reference]
+    deltas = [c for c in table.columns if c.startswith("Δ ")]
+    if deltas:
+        table = table.loc[table[deltas].abs().max(axis=1).sort_values(ascending=False, kind="stable").index]
+    return table
+
+
+def document_errors(scored: dict) -> pd.DataFrame:
+    """
+    Boolean frame indexed by (pdf_id, field), one column per run: True where the run got that field wrong.
+    """
+    return pd.concat(
+        {
+            name: pd.Series(
+                ((table["fp"] + table["fn"]) > 0).to_numpy(),
+                index=pd.MultiIndex.from_arrays(
+                    [table["pdf_id"].astype(str), table["field"].astype(str)], names=["pdf_id", "field"]
+                ),
+            )
+            for name, table in scored.items()
+        },
+        axis=1,
+    ).fillna(True).astype(bool)
+
+
+def document_flips(errors: pd.DataFrame, reference: str) -> dict:
+    """
+    Per run: fields the reference got wrong and the run got right ("fixed") and the
+    reverse ("broken"), grouped by pdf_id.
+    """
+    flips = {}
+    ref = errors[reference]
+    for name in errors.columns:
+        if name == reference:
+            continue
+        fixed = errors.index[ref & ~errors[name]]
+        broken = errors.index[~ref & errors[name]]
+        flips[name] = {
+            "fixed": _group_by_pdf(fixed),
+            "broken": _group_by_pdf(broken),
+        }
+    return flips
+
+
+def _group_by_pdf(index) -> dict:
+    grouped = {}
+    for pdf_id, field in index:
+        grouped.setdefault(str(pdf_id), []).append(str(field))
+    return grouped
+
+
+def match_batches(runs: dict, pdf_ids: list[str], batch_ids: set, store_path: str = STORE_PATH) -> dict:
+    """
+    {run name: {pdf_id: batch id}}: for each aligned document of a run folder, the registered
+    batch whose output in the result store is the one in the folder (the latest if several are).
+    Documents no registered batch produced (e.g. imported snapshots) are left out.
+    """
+    if not os.path.exists(store_path):
+        return {}
+    matched = {name: {} for name in runs}
+    with open_readonly(store_path) as store:
+        for pdf_id in pdf_ids:
+            stored = [
+                (run_id, json.loads(output))
+                for run_id, output in store.conn.execute(
+                    "SELECT run_id, model_output FROM documents WHERE pdf_id = ? ORDER BY created_at DESC", (pdf_id,)
+                )
+                if run_id in batch_ids
+            ]
+            for name, folder in runs.items():
+                with open(os.path.join(folder, f"{pdf_id}.json"), encoding="utf-8") as f:
+                    output = json.load(f).get("model_output")
+                batch = next((run_id for run_id, stored_output in stored if stored_output == output), None)
+                if batch is not None:
+                    matched[name][pdf_id] = batch
+    return matched
+
+
+def run_costs(runs: dict, pdf_ids: list[str], explicit: dict | None = None,
+              registry_path: str = REGISTRY_PATH, store_path: str = STORE_PATH) -> dict:
+    """
+    Cost and latency per run folder from the run registry. Folders are not batches, so each
+    folder is mapped to the batches that wrote its documents: the batch ids given in explicit
+    ({run name: [batch id, ...]}), else the batches found by match_batches. Per-PDF figures are
+    the batch averages, weighted by how many of the folder's documents each batch wrote.
+    """
+    if not os.path.exists(registry_path):
+        return {}
+    with RunRegistry(registry_path, readonly=True) as registry:
+        batches = {row["run_id"]: dict(row) for row in registry.conn.execute("SELECT * FROM runs")}
+    matched = match_batches({n: f for n, f in runs.items() if n not in (explicit or {})}, pdf_ids, set(batches), store_path)
+    for name, batch_ids in (explicit or {}).items():
+        unknown = [b for b in batch_ids if b not in batches]
+        if unknown:
+            raise SystemExit(f"❌  Unknown batch id(s) for {name}: {', '.join(unknown)}")
+        matched[name] = {i: b for i, b in enumerate(batch_ids)}
+
+    costs = {}
+    for name, documents in matched.items():
+        weights = {}
+        for batch_id in documents.values():
+            weights[batch_id] = weights.get(batch_id, 0) + 1
+        totals = {"cost": 0.0, "seconds": 0.0, "weight": 0, "api_s": 0.0, "api_calls": 0}
+        for batch_id, weight in weights.items():
+            run = batches[batch_id]
+            if not run["num_pdfs"] or run["cost_usd"] is None:
+                continue
+            totals["cost"] += run["cost_usd"] / run["num_pdfs"] * weight
+            totals["seconds"] += (run["elapsed_s"] or 0.0) / run["num_pdfs"] * weight
+            totals["weight"] += weight
+            totals["api_s"] += run["api_s"] or 0.0
+            totals["api_calls"] += run["api_calls"] or 0
+        if not totals["weight"]:
+            continue
+        costs[name] = {
+            "cost_per_pdf": totals["cost"] / totals["weight"],
+            "s_per_pdf": totals["seconds"] / totals["weight"],
+            "api_latency_s": totals["api_s"] / totals["api_calls"] if totals["api_calls"] else None,
+            "batches": sorted(weights),
+            "costed_docs": len(documents) if name not in (explicit or {}) else len(pdf_ids),
+        }
+    return costs
+
+
+def compare(runs: dict, truth_folder: str = EVAL_FOLDER, workers: int | None = None,
+            registry_path: str = REGISTRY_PATH, batch_ids: dict | None = None) -> dict:
+    """
+    Scores every run (first one is the reference) on the aligned documents and builds the comparison.
+    """
+    truth = load_ground_truth(truth_folder)
+    pdf_ids, unaligned = align_runs(runs, truth)
+    scored = score_runs(runs, truth, pdf_ids, workers)
+
+    reference = next(iter(runs))
+    results = {name: counts_to_results(field_counts(table)) for name, table in scored.items()}
+    costs = run_costs(runs, pdf_ids, batch_ids, registry_path)
+    fields, matrices = aligned_matrices(scored, pdf_ids)
+    f1_intervals = {name: bootstrap_intervals(counts, fields)[OVERALL]["f1_score"] for name, counts in matrices.items()}
+    summary = {
+        name: {
+            **compute_summary_stats(results[name]),
+            "f1_low": f1_intervals[name]["low"],
+            "f1_high": f1_intervals[name]["high"],
+            "unaligned_docs": unaligned[name],
+            **costs.get(name, {"cost_per_pdf": None, "s_per_pdf": None, "api_latency_s": None,
+                               "batches": [], "costed_docs": 0}),
+        }
+        for name in runs
+    }
+    return {
+        "reference": reference,
+        "num_docs": len(pdf_ids),
+        "summary": summary,
+        "field_f1": field_f1_table(results, reference),
+        "flips": document_flips(document_errors(scored), reference),
+        # Paired bootstrap interval and permutation p-value of each run's F1 change against the reference
+        "significance": {
+            name: paired_test(matrices[reference], counts, fields)
+            for name, counts in matrices.items() if name != reference
+        },
+        "pareto": {
+            metric: [r["run"] for r in pareto_front([{"run": n, **s} for n, s in summary.items()], metric)]
+            for metric in ("f1_score", "accuracy")
+        },
+    }
+
+
+def print_comparison(report: dict, limit: int = 10):
+    summary = pd.DataFrame(report["summary"]).T
+    table = summary[["tp", "fp", "fn", "accuracy", "precision", "recall", "f1_score", "unaligned_docs"]].copy()
+    for col in ["tp", "fp", "fn", "unaligned_docs"]:
+        table[col] = table[col].astype(int)
+    for col in ["accuracy", "precision", "recall", "f1_score"]:
+        table[col] = table[col].apply(pretty_percent)
+    table.insert(7, "f1_95%_ci", [pretty_interval(low, high) for low, high in zip(summary["f1_low"], summary["f1_high"])])
+    table["cost_per_pdf"] = summary["cost_per_pdf"].apply(pretty_usd)
+    table["s_per_pdf"] = summary["s_per_pdf"].map(lambda x: "–" if x is None or pd.isna(x) else f"{x:.1f}")
+
+    print(f"\n📊 {len(summary)} runs on {report['num_docs']} aligned documents (reference: {report['reference']})")
+    print(table.to_string())
+    for name, run in report["summary"].items():
+        if run["batches"]:
+            print(f"   💵 {name}: cost from {run['costed_docs']}/{report['num_docs']} documents, "
+                  f"batch{'es' if len(run['batches']) > 1 else ''} {', '.join(run['batches'])}")
+
+    field_f1 = report["field_f1"]
+    print(f"\n🔬 Per-field F1 (largest deltas first, top {limit})")
+    top = field_f1.head(limit).astype(object)
+    for col in top.columns:
+        fmt = "{:+.3f}" if col.startswith("Δ ") else "{:.3f}"
+        top[col] = top[col].map(lambda x: "–" if pd.isna(x) else fmt.format(x))
+    print(top.to_string())
+
+    for name, tests in report["significance"].items():
+        significant = [field for field, test in tests.items() if field != OVERALL and test["p_value"] < 1 - CONFIDENCE_LEVEL]
+        print(f"\n🎲 {name} vs {report['reference']}: F1 {format_test(tests[OVERALL])}")
+        for field in significant[:limit]:
+            print(f"  {'📈' if tests[field]['delta'] > 0 else '📉'} {field:<36} {format_test(tests[field])}")
+        if not significant:
+            print(f"  no field changed significantly (p < {1 - CONFIDENCE_LEVEL:.2f})")
+
+    for name, flips in report["flips"].items():
+        fixed = sum(len(f) for f in flips["fixed"].values())
+        broken = sum(len(f) for f in flips["broken"].values())
+        print(f"\n🔁 {name} vs {report['reference']}: {fixed} fields fixed in {len(flips['fixed'])} docs, "
+              f"{broken} broken in {len(flips['broken'])} docs")
+        worst = sorted(flips["broken"].items(), key=lambda item: len(item[1]), reverse=True)[:limit]
+        for pdf_id, fields in worst:
+            print(f"  📉 {pdf_id:<12} {', '.join(fields)}")
+
+    for metric, front in report["pareto"].items():
+        if front:
+            print(f"\n⚖️  {metric} vs. $/PDF Pareto front: {'  →  '.join(front)}")
+        else:
+            print(f"\n⚖️  No {metric} vs. $/PDF Pareto front (no run has a registered cost)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare several output sets against the shared ground truth")
+    parser.add_argument("runs", nargs="*", help="Run folders, optionally as name=folder (first is the reference)")
+    parser.add_argument("--truth", default=EVAL_FOLDER, help="Evaluation folder holding the shared ground truth")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--out", help="Also write the full report as JSON")
+    parser.add_argument("--run-id", action="append", default=[], metavar="NAME=BATCH_ID[,BATCH_ID]",
+                        help="Registry batch(es) whose cost a run folder is charged (default: found in the result store)")
+    args = parser.parse_args()
+
+    specs = args.runs or [EVAL_FOLDER] + sorted(glob.glob(BASELINE_GLOB))
+    runs = dict(parse_run_spec(spec) for spec in specs)
+    batch_ids = {}
+    for spec in args.run_id:
+        name, sep, ids = spec.partition("=")
+        if not sep or name not in runs:
+            parser.error(f"--run-id {spec}: expected NAME=BATCH_ID with NAME one of {', '.join(runs)}")
+        batch_ids[name] = [b for b in ids.split(",") if b]
+
+    report = compare(runs, args.truth, args.workers, batch_ids=batch_ids)
+    print_comparison(report, args.limit)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(json.dumps(
+                {**report, "field_f1": report["field_f1"].astype(object).where(report["field_f1"].notna()).to_dict()},
+                indent=2, ensure_ascii=False,
+            ))
+        print(f"\n💾 Saved to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""
+evaluation/eval_cache.py
+Per-document cache of evaluation results, keyed on each file's content hash and the
+evaluator version. Only new or changed evaluation files are re-scored; the global
+metrics are rebuilt from the cached per-document counts.
+
+Every run also records which documents changed and how, so the regressions since
+the previous run can be listed without re-scoring anything:
+
+    python -m evaluation.eval_cache                      # changes recorded by the last run
+    python -m evaluation.eval_cache --folder data/baseline_gpt_4_1_v1 --refresh
+"""
+
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+from evaluation.evaluate_outputs import (
+    EVAL_FOLDER,
+    EVALUATOR_VERSION,
+    document_counts,
+    flatten_sample,
+    score_table,
+    to_table,
+)
+from schema.compiled import SCHEMA
+
+CACHE_DIR = os.path.join("data", "logs", "eval_cache")
+
+
+def evaluator_fingerprint() -> str:
+    """
+    Evaluator version plus a hash of the evaluated schema: cached counts are only
+    valid for the exact rules and field set that produced them.
+    """
+    schema = json.dumps([SCHEMA.evaluated_fields, SCHEMA.subfields], sort_keys=True, ensure_ascii=False)
+    return f"{EVALUATOR_VERSION}:{hashlib.sha1(schema.encode('utf-8')).hexdigest()[:12]}"
+
+
+def default_cache_path(folder: str) -> str:
+    name = os.path.normpath(folder).strip(os.sep).replace(os.sep, "_").replace(":", "") or "root"
+    return os.path.join(CACHE_DIR, f"{name}.npz")
+
+
+def _hash_and_flatten(paths):
+    """
+    Hashes, parses and flattens a chunk of evaluation files (runs in a worker process).
+    Rows are keyed by file name so documents sharing a pdf_id stay apart.
+    """
+    out = []
+    for path in paths:
+        with open(path, "rb") as f:
+            raw = f.read()
+        sample = json.loads(raw)
+        name = os.path.basename(path)
+        rows = [(name,) + row[1:] for row in flatten_sample(sample, name[:-len(".json")])]
+        out.append((name, hashlib.sha1(raw).hexdigest(), str(sample.get("pdf_id", name[:-len(".json")])), rows))
+    return out
+
+
+def is_regression(before: list, after: list) -> bool:
+    return after[0] < before[0] or after[1] + after[2] > before[1] + before[2]
+
+
+class EvaluationCache:
+    """
+    Cached counts for one evaluation folder, stored as a single .npz file.
+    documents maps file name to its content hash, stat signature and pdf_id; counts
+    maps file name to an int32 array of (field index, tp, fp, fn) rows into fields.
+    last_run holds the changes found by the most recent refresh.
+    """
+
+    def __init__(self, folder: str = EVAL_FOLDER, path: str | None = None):
+        self.folder = folder
+        self.path = path or default_cache_path(folder)
+        self.version = evaluator_fingerprint()
+        self.fields = []
+        self.documents = {}
+        self.counts = {}
+        self.last_run = {}
+
+        if os.path.exists(self.path):
+            with np.load(self.path, allow_pickle=False) as data:
+                meta = json.loads(str(data["meta"]))
+                self.last_run = meta.get("last_run", {})
+                if meta.get("evaluator_version") != self.version:
+                    return
+                self.fields = data["fields"].tolist()
+                names = data["names"].tolist()
+                self.documents = {
+                    name: {"hash": h, "size": size, "mtime_ns": mtime, "pdf_id": pdf_id}
+                    for name, h, size, mtime, pdf_id in zip(
+                        names, data["hashes"].tolist(), data["sizes"].tolist(),
+                        data["mtimes"].tolist(), data["pdf_ids"].tolist(),
+                    )
+                }
+                self.counts = dict(zip(names, np.split(data["rows"], data["offsets"][1:-1])))
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        names = list(self.documents)
+        arrays = [self.counts[name] for name in names]
+        offsets = np.cumsum([0] + [len(a) for a in arrays])
+        meta = {"evaluator_version": self.version, "folder": self.folder, "last_run": self.last_run}
+
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                meta=np.array(json.dumps(meta, ensure_ascii=False)),
+                fields=np.array(self.fields, dtype=str),
+                names=np.array(names, dtype=str),
+                hashes=np.array([d["hash"] for d in self.documents.values()], dtype=str),
+                sizes=np.array([d["size"] for d in self.documents.values()], dtype=np.int64),
+                mtimes=np.array([d["mtime_ns"] for d in self.documents.values()], dtype=np.int64),
+                pdf_ids=np.array([d["pdf_id"] for d in self.documents.values()], dtype=str),
+                offsets=offsets.astype(np.int64),
+                rows=np.concatenate(arrays) if arrays else np.empty((0, 4), dtype=np.int32),
+            )
+        os.replace(tmp_path, self.path)
+
+    def _to_array(self, counts: dict) -> np.ndarray:
+        index = {field: i for i, field in enumerate(self.fields)}
+        for field in counts:
+            if field not in index:
+                index[field] = len(self.fields)
+                self.fields.append(field)
+        return np.array([[index[f], *c] for f, c in counts.items()], dtype=np.int32).reshape(-1, 4)
+
+    def _to_dict(self, rows: np.ndarray) -> dict:
+        return {self.fields[i]: [tp, fp, fn] for i, tp, fp, fn in rows.tolist()}
+
+    def refresh(self, workers: int | None = None, chunk_size: int = 256) -> dict:
+        """
+        Re-scores every file whose size/mtime changed and whose content hash differs
+        from the cached one, drops deleted files, and records the per-field changes.
+        Returns the last_run record.
+        """
+        names = [name for name in os.listdir(self.folder) if name.endswith(".json")]
+        stats = {name: os.stat(os.path.join(self.folder, name)) for name in names}
+
+        # Unchanged size and mtime: trust the cached hash without reading the file
+        candidates = [
+            name for name in names
+            if name not in self.documents
+            or self.documents[name]["size"] != stats[name].st_size
+            or self.documents[name]["mtime_ns"] != stats[name].st_mtime_ns
+        ]
+        paths = [os.path.join(self.folder, name) for name in candidates]
+        chunks = [paths[i:i + chunk_size] for i in range(0, len(paths), chunk_size)]
+        if len(chunks) <= 1 or (workers or os.cpu_count() or 1) <= 1:
+            parsed = [doc for chunk in map(_hash_and_flatten, chunks) for doc in chunk]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                parsed = [doc for chunk in pool.map(_hash_and_flatten, chunks) for doc in chunk]
+
+        changed = []
+        for name, digest, pdf_id, rows in parsed:
+            cached = self.documents.get(name)
+            if cached and cached["hash"] == digest:
+                cached["size"], cached["mtime_ns"] = stats[name].st_size, stats[name].st_mtime_ns
+            else:
+                changed.append((name, digest, pdf_id, rows))
+
+        new_counts = document_counts(score_table(to_table([rows for *_, rows in changed], len(changed)))) if changed else {}
+
+        rescored, regressions, improvements = [], [], []
+        for name, digest, pdf_id, _ in changed:
+            after = new_counts.get(name, {})
+            if name in self.counts:
+                before = self._to_dict(self.counts[name])
+                for field in dict.fromkeys(list(before) + list(after)):
+                    old, new = before.get(field, [0, 0, 0]), after.get(field, [0, 0, 0])
+                    if old == new:
+                        continue
+                    change = {"file": name, "pdf_id": pdf_id, "field": field, "before": old, "after": new}
+                    (regressions if is_regression(old, new) else improvements).append(change)
+            self.documents[name] = {
+                "hash": digest,
+                "size": stats[name].st_size,
+                "mtime_ns": stats[name].st_mtime_ns,
+                "pdf_id": pdf_id,
+            }
+            self.counts[name] = self._to_array(after)
+            rescored.append(name)
+
+        removed = sorted(set(self.documents) - set(names))
+
+        # Keep the folder's listing order so the rebuilt field order matches a full evaluation
+        self.documents = {name: self.documents[name] for name in names}
+        self.counts = {name: self.counts[name] for name in names}
+        self.last_run = {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "num_docs": len(names),
+            "rescored": rescored,
+            "removed": removed,
+            "regressions": regressions,
+            "improvements": improvements,
+        }
+        self.save()
+        return self.last_run
+
+    def results(self) -> dict:
+        """
+        Global {field: {"tp", "fp", "fn"}} rebuilt from the cached per-document counts,
+        fields in the order a full evaluation first encounters them.
+        """
+        if not self.counts:
+            return {}
+        rows = np.concatenate(list(self.counts.values()))
+        if not len(rows):
+            return {}
+        field_idx = rows[:, 0]
+        totals = [np.bincount(field_idx, weights=rows[:, c], minlength=len(self.fields)) for c in (1, 2, 3)]
+        present, first_seen = np.unique(field_idx, return_index=True)
+        return {
+            self.fields[i]: {"tp": int(totals[0][i]), "fp": int(totals[1][i]), "fn": int(totals[2][i])}
+            for i in present[np.argsort(first_seen)].tolist()
+        }
+
+    def count_matrix(self) -> tuple[list, list, np.ndarray]:
+        """
+        (file names, fields, counts) with counts[d, f] = (tp, fp, fn) of every cached document,
+        fields in the order of results(); the input of evaluation/bootstrap.py.
+        """
+        names = list(self.counts)
+        fields = list(self.results())
+        index = np.full(len(self.fields), -1, dtype=np.int64)
+        index[[self.fields.index(field) for field in fields]] = np.arange(len(fields))
+        counts = np.zeros((len(names), len(fields), 3), dtype=np.float64)
+        for d, name in enumerate(names):
+            rows = self.counts[name]
+            counts[d, index[rows[:, 0]]] = rows[:, 1:]
+        return names, fields, counts
+
+    def regressed_documents(self) -> dict:
+        """
+        pdf_ids that regressed in the last run, with the fields that got worse.
+        """
+        docs = {}
+        for change in self.last_run.get("regressions", []):
+            docs.setdefault(change["pdf_id"], []).append(change["field"])
+        return docs
+
+
+def evaluate_incremental(folder: str = EVAL_FOLDER, cache_path: str | None = None,
+                         workers: int | None = None) -> tuple[dict, dict]:
+    """
+    Refreshes the cache for folder and returns (results, last_run), where results has
+    the same shape as evaluate_field_level.
+    """
+    cache = EvaluationCache(folder, cache_path)
+    last_run = cache.refresh(workers)
+    return cache.results(), last_run
+
+
+def print_changes(last_run: dict, limit: int = 50):
+    if not last_run:
+        print("⚠️ No cached evaluation run yet.")
+        return
+
+    print(f"\n🗂️ Last run {last_run['timestamp']}: re-scored {len(last_run['rescored'])}/{last_run['num_docs']} "
+          f"documents, {len(last_run['removed'])} removed")
+    for title, key in (("📉 Regressions", "regressions"), ("📈 Improvements", "improvements")):
+        changes = last_run.get(key, [])
+        if not changes:
+            continue
+        print(f"\n{title} ({len({c['pdf_id'] for c in changes})} documents, {len(changes)} fields):")
+        for c in changes[:limit]:
+            print(f"  {c['pdf_id']:<12} {c['field']:<34} tp/fp/fn {c['before']} → {c['after']}")
+        if len(changes) > limit:
+            print(f"  ... {len(changes) - limit} more")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-document evaluation cache and drill-down")
+    parser.add_argument("--folder", default=EVAL_FOLDER)
+    parser.add_argument("--refresh", action="store_true", help="Re-score changed files before reporting")
+    parser.add_argument("--limit", type=int, default=50)
+    args = parser.parse_args()
+
+    cache = EvaluationCache(args.folder)
+    if args.refresh:
+        cache.refresh()
+    print_changes(cache.last_run, args.limit)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,15 @@
 import os
+import csv
 import json
-from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
 import datetime
+from schema.compiled import SCHEMA
 
 EVAL_FOLDER = "data/evaluation"
+# Bump when scoring rules change: invalidates every cached per-document result
+EVALUATOR_VERSION = "2"
 
 
 def compute_summary_stats(results_dict):
@@ -32,14 +37,14 @@ def compute_summary_stats(results_dict):
     }
 
 
-def log_run_to_csv(results, run_name, notes="", log_file="data/logs/evaluation_log.csv"):
+def log_run_to_csv(results, run_name, notes="", log_file="data/logs/evaluation_log.csv", timestamp=None):
     """
-    Logs the evaluation results to a CSV file.
+    Appends the evaluation results as one row to a CSV file (header written on creation).
     """
     summary = compute_summary_stats(results)
 
     new_row = {
-        "timestamp": datetime.datetime.now().isoformat(),
+        "timestamp": timestamp or datetime.datetime.now().isoformat(),
         "run_name": run_name,
         "notes": notes,
         "true_positives": summary["tp"],
@@ -51,105 +56,240 @@ def log_run_to_csv(results, run_name, notes="", log_file="data/logs/evaluation_l
         "f1_score": summary["f1_score"]
     }
 
-    # Append to CSV
-    try:
-        df = pd.read_csv(log_file)
-    except FileNotFoundError:
-        df = pd.DataFrame()
-
-    df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
-    df.to_csv(log_file, index=False)
+    # Append to CSV without reading back the history
+    os.makedirs(os.path.dirname(log_file) or ".", exist_ok=True)
+    file_exists = os.path.isfile(log_file)
+    with open(log_file, "a", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=list(new_row))
+        if not file_exists:
+            writer.writeheader()
+        writer.writerow(new_row)
     print(f"✅ Logged run to {log_file}")
+    return summary
 
 
-def norm(x):
+def canonical(value):
     """
-    Normalize the input by stripping whitespace and converting to lowercase.
-    This is useful for string comparisons.
+    Comparable stand-in for a field value, so equality can be checked on whole columns.
+    Mirrors Python equality after normalization: strings compare stripped and
+    lowercased, booleans and numbers by value (True == 1), None stays missing.
     """
-    return x.strip().lower() if isinstance(x, str) else x
+    if value is None:
+        return None
+    if isinstance(value, (bool, int, float)):
+        return f"n:{float(value)!r}"
+    if isinstance(value, str):
+        return "s:" + value.strip().lower()
+    return "o:" + json.dumps(value, sort_keys=True, ensure_ascii=False)
+
+
+TRUE, FALSE = canonical(True), canonical(False)
+TABLE_COLUMNS = ["pdf_id", "field", "aggregate", "pred", "actual"]
 
 
-def update_counts(key, pred, actual, results):
+def flatten_sample(sample, pdf_id=None):
     """
-    Updates TP, FP, FN counts for a single field.
+    Flattens one evaluation file into rows of (pdf_id, field, aggregate, pred, actual),
+    one per field path that has ground truth. Subfield rows also count towards their
+    aggregate field; fields missing from ground truth or annotated as null are skipped.
+    """
+    pdf_id = str(sample.get("pdf_id", pdf_id))
+    model = sample["model_output"]
+    truth = sample["ground_truth"]
+    rows = []
 
-    Note: We do NOT track true negatives (TN) because this is an information
-    extraction task. Fields with a correct "false" prediction are simply not
-    counted as errors — they are not meaningful TNs in this context.
+    # SummaryInsights is not in evaluated_fields: interesting for Booli but fuzzy to evaluate
+    for key in SCHEMA.evaluated_fields:
+        if key not in truth:
+            continue
 
-    Including TNs would distort precision/recall, since most fields are often false,
-    which would artificially inflate accuracy without improving extraction quality.
+        pred = model.get(key)
+        actual = truth.get(key)
+
+        if isinstance(actual, dict) and isinstance(pred, dict):
+            for subkey in SCHEMA.subfields.get(key, actual):
+                sub_actual = actual.get(subkey)
+                if sub_actual is not None:
+                    rows.append((pdf_id, f"{key}.{subkey}", key, canonical(pred.get(subkey)), canonical(sub_actual)))
+        elif actual is not None:
+            rows.append((pdf_id, key, None, canonical(pred), canonical(actual)))
+    return rows
+
+
+def _flatten_files(paths):
+    """
+    Reads and flattens a chunk of evaluation files (runs in a worker process).
     """
+    rows = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            rows.extend(flatten_sample(json.load(f), os.path.basename(path)[:-len(".json")]))
+    return rows, len(paths)
 
-    if actual is None:
-        return
 
-    if pred is None:
-        results[key]["fn"] += 1
-    elif norm(pred) == norm(actual):
-        results[key]["tp"] += 1
-    else:
-        pred_norm = norm(pred)
-        actual_norm = norm(actual)
+def to_table(row_chunks, num_docs):
+    table = pd.DataFrame.from_records(
+        (row for rows in row_chunks for row in rows), columns=TABLE_COLUMNS
+    )
+    for column in TABLE_COLUMNS:
+        table[column] = table[column].astype("category")
+    table.attrs["num_docs"] = num_docs
+    return table
 
-        if pred_norm == True and actual_norm == False:
-            results[key]["fp"] += 1
-        elif pred_norm == False and actual_norm == True:
-            results[key]["fn"] += 1
-        else:
-            results[key]["fp"] += 1
-            results[key]["fn"] += 1
 
+def _collect(results):
+    row_chunks, num_docs = [], 0
+    for rows, n in results:
+        row_chunks.append(rows)
+        num_docs += n
+    return row_chunks, num_docs
 
-def evaluate_field_level(samples):
-    results = defaultdict(lambda: {"tp": 0, "fp": 0, "fn": 0})
-    for sample in samples:
-        model = sample["model_output"]
-        truth = sample["ground_truth"]
 
-        for key in truth:
-            if key == "SummaryInsights":  # Skip because interesting for Booli but fuzzy to evaluate
-                continue
+def load_eval_table(folder=None, workers=None, chunk_size=256):
+    """
+    Streams every evaluation file in folder into a flattened table with one row per
+    document and field path. Files are parsed in chunks by a process pool, so only
+    the flattened rows are ever held in memory.
+    """
+    folder = folder or EVAL_FOLDER
+    paths = [os.path.join(folder, name) for name in os.listdir(folder) if name.endswith(".json")]
+    chunks = [paths[i:i + chunk_size] for i in range(0, len(paths), chunk_size)]
 
-            pred = model.get(key)
-            actual = truth.get(key)
+    if len(chunks) <= 1 or (workers or os.cpu_count() or 1) <= 1:
+        return to_table(*_collect(map(_flatten_files, chunks)))
 
-            if isinstance(actual, dict) and isinstance(pred, dict):
-                for subkey in actual:
-                    sub_pred = pred.get(subkey)
-                    sub_actual = actual.get(subkey)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return to_table(*_collect(pool.map(_flatten_files, chunks)))
 
-                    sub_field = f"{key}.{subkey}"
-                    update_counts(sub_field, sub_pred, sub_actual, results)
-                    update_counts(key, sub_pred, sub_actual, results)  # Aggregate
-            else:
-                update_counts(key, pred, actual, results)
-    return results
+
+def samples_to_table(samples):
+    """
+    Flattened table for evaluation samples already loaded in memory.
+    """
+    return to_table([flatten_sample(sample, i) for i, sample in enumerate(samples)], len(samples))
+
+
+def score_table(table):
+    """
+    Adds tp/fp/fn columns to a flattened table, one verdict per row:
+      - missing prediction                  -> FN
+      - prediction equals truth             -> TP
+      - predicted true, truth false         -> FP
+      - predicted false, truth true         -> FN
+      - any other mismatch (e.g. strings)   -> FP and FN
+
+    Note: We do NOT track true negatives (TN) because this is an information
+    extraction task. Fields with a correct "false" prediction are simply not
+    counted as errors — they are not meaningful TNs in this context.
+
+    Including TNs would distort precision/recall, since most fields are often false,
+    which would artificially inflate accuracy without improving extraction quality.
+    """
+    n = len(table)
+    codes, uniques = pd.factorize(np.concatenate([table["pred"].to_numpy(object), table["actual"].to_numpy(object)]))
+    pred, actual = codes[:n], codes[n:]
+    lookup = {value: code for code, value in enumerate(uniques)}
+    true_code, false_code = lookup.get(TRUE, -2), lookup.get(FALSE, -2)
+
+    missing = pred == -1
+    equal = ~missing & (pred == actual)
+    wrong = ~missing & ~equal
+    false_positive = wrong & (pred == true_code) & (actual == false_code)
+    false_negative = wrong & (pred == false_code) & (actual == true_code)
+    both = wrong & ~false_positive & ~false_negative
+
+    scored = table.copy()
+    scored["tp"] = equal.astype(np.int64)
+    scored["fp"] = (false_positive | both).astype(np.int64)
+    scored["fn"] = (missing | false_negative | both).astype(np.int64)
+    return scored
+
+
+def field_counts(scored):
+    """
+    TP/FP/FN per field path plus per aggregate field, in the order fields are first
+    encountered (subfield before its aggregate).
+    """
+    counts = ["tp", "fp", "fn"]
+    subfields = scored[scored["aggregate"].notna()]
+    per_field = pd.concat([
+        scored.groupby("field", sort=False, observed=True)[counts].sum(),
+        subfields.groupby("aggregate", sort=False, observed=True)[counts].sum(),
+    ])
+    per_field = per_field.groupby(level=0, sort=False).sum()
+
+    positions = np.arange(len(scored))
+    first_seen = pd.concat([
+        pd.Series(2 * positions, index=scored["field"].astype(object)),
+        pd.Series(2 * positions[scored["aggregate"].notna().to_numpy()] + 1, index=subfields["aggregate"].astype(object)),
+    ]).groupby(level=0).min().sort_values()
+    return per_field.reindex(first_seen.index)
+
+
+def document_counts(scored):
+    """
+    Per-document version of field_counts: {pdf_id: {field: [tp, fp, fn]}}, with each
+    document's fields in the order they are encountered.
+    """
+    fields = scored["field"].cat
+    aggregates = scored["aggregate"].cat
+    names = list(fields.categories) + list(aggregates.categories)
+    subfields = aggregates.codes.to_numpy() >= 0
+    positions = np.arange(len(scored))
+
+    # Every row counts for its field path; subfield rows also for their aggregate
+    docs = np.concatenate([scored["pdf_id"].cat.codes.to_numpy(), scored["pdf_id"].cat.codes.to_numpy()[subfields]]).astype(np.int64)
+    name_codes = np.concatenate([fields.codes.to_numpy(), aggregates.codes.to_numpy()[subfields] + len(fields.categories)])
+    order = np.concatenate([2 * positions, 2 * positions[subfields] + 1])
+    values = [np.concatenate([scored[c].to_numpy(), scored[c].to_numpy()[subfields]]) for c in ("tp", "fp", "fn")]
+
+    by_order = np.argsort(order, kind="stable")
+    keys = (docs * len(names) + name_codes)[by_order]
+    unique_keys, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    totals = [np.bincount(inverse, weights=v[by_order], minlength=len(unique_keys)).astype(np.int64) for v in values]
+
+    pdf_ids = scored["pdf_id"].cat.categories.tolist()
+    groups = np.argsort(first, kind="stable")
+    result = {}
+    for key, tp, fp, fn in zip(unique_keys[groups].tolist(), *(t[groups].tolist() for t in totals)):
+        doc, name = divmod(key, len(names))
+        result.setdefault(pdf_ids[doc], {})[names[name]] = [tp, fp, fn]
+    return result
+
+
+def counts_to_results(counts):
+    return {
+        field: {"tp": int(row.tp), "fp": int(row.fp), "fn": int(row.fn)}
+        for field, row in zip(counts.index, counts.itertuples(index=False))
+    }
+
+
+def evaluate_field_level(samples):
+    return counts_to_results(field_counts(score_table(samples_to_table(samples))))
 
 
 def build_results_table(results):
-    rows = []
-    for key, counts in results.items():
-        tp, fp, fn = counts["tp"], counts["fp"], counts["fn"]
-        total = tp + fp + fn
-        precision = tp / (tp + fp) if (tp + fp) > 0 else 0
-        recall = tp / (tp + fn) if (tp + fn) > 0 else 0
-        f1 = (2 * precision * recall) / (precision + recall) if (precision + recall) > 0 else 0
-        accuracy = tp / total if total > 0 else 0
-
-        rows.append({
-            "Field": key,
-            "Accuracy": round(accuracy, 2),
-            "Precision": round(precision, 2),
-            "Recall": round(recall, 2),
-            "F1 Score": round(f1, 2),
-            "TP": tp,
-            "FP": fp,
-            "FN": fn
-        })
-
-    return pd.DataFrame(rows).sort_values(by="F1 Score", ascending=False)
+    counts = pd.DataFrame.from_dict(results, orient="index", columns=["tp", "fp", "fn"])
+    tp, fp, fn = (counts[c].to_numpy(np.float64) for c in ("tp", "fp", "fn"))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.where(tp + fp > 0, tp / (tp + fp), 0)
+        recall = np.where(tp + fn > 0, tp / (tp + fn), 0)
+        f1 = np.where(precision + recall > 0, (2 * precision * recall) / (precision + recall), 0)
+        accuracy = np.where(tp + fp + fn > 0, tp / (tp + fp + fn), 0)
+
+    # Python's round (correctly rounded decimals) rather than np.round, so e.g. 0.925 -> 0.93 as before
+    table = pd.DataFrame({
+        "Field": counts.index,
+        "Accuracy": [round(x, 2) for x in accuracy.tolist()],
+        "Precision": [round(x, 2) for x in precision.tolist()],
+        "Recall": [round(x, 2) for x in recall.tolist()],
+        "F1 Score": [round(x, 2) for x in f1.tolist()],
+        "TP": counts["tp"].to_numpy(),
+        "FP": counts["fp"].to_numpy(),
+        "FN": counts["fn"].to_numpy(),
+    })
+    return table.sort_values(by="F1 Score", ascending=False)
 
 
 def load_eval_files():
@@ -163,8 +303,19 @@ def load_eval_files():
 
 
 def main():
-    samples = load_eval_files()
-    results = evaluate_field_level(samples)
+    import argparse
+    from evaluation.bootstrap import BOOTSTRAP_RESAMPLES, CONFIDENCE_LEVEL, bootstrap_intervals, print_intervals
+    from evaluation.eval_cache import EvaluationCache, print_changes
+
+    parser = argparse.ArgumentParser(description="Field-level evaluation of data/evaluation")
+    parser.add_argument("--run_name", default="baseline_GPT4.1_v3")
+    parser.add_argument("--notes", default="Fixed issue with 2 PDFs were missing ground truth")
+    args = parser.parse_args()
+
+    # Only new or changed files are re-scored; the rest comes from the per-document cache
+    cache = EvaluationCache(EVAL_FOLDER)
+    last_run = cache.refresh()
+    results = cache.results()
 
     if not results:
         print("⚠️ No evaluation results found — make sure evaluation JSONs exist and are formatted correctly.")
@@ -177,7 +328,7 @@ def main():
     print(table.to_string(index=False))
 
     print("\n\nEvaluation Summary:\n")
-    print(f"Total Samples: {len(samples)}")
+    print(f"Total Samples: {last_run['num_docs']}")
     print(f"Total Fields Evaluated: {len(results)}")
     print(f"Total True Positives: {summary['tp']}")
     print(f"Total False Positives: {summary['fp']}")
@@ -187,7 +338,29 @@ def main():
     print(f"Total Recall: {summary['recall']:.2f}")
     print(f"Total F1 Score: {summary['f1_score']:.2f}")
 
-    log_run_to_csv(results, run_name="baseline_GPT4.1_v3", notes="Fixed issue with 2 PDFs were missing ground truth")
+    # Resampling documents shows how much of a change between runs could be noise
+    _, fields, counts = cache.count_matrix()
+    intervals = bootstrap_intervals(counts, fields)
+    print_intervals(intervals, len(counts))
+
+    print_changes(last_run, limit=10)
+
+    run_name, notes = args.run_name, args.notes
+    evaluated_at = datetime.datetime.now().isoformat()
+
+    # The folder mixes the outputs of many batches, so its evaluation is not linked to any one
+    # batch's cost; `python -m utils.run_registry evaluate --run <batch_id>` scores a single batch.
+    # Recorded before the CSV row: a registry created here is backfilled from the CSV, and the
+    # shared timestamp lets a later import skip this row instead of duplicating it.
+    from utils.run_registry import RunRegistry
+
+    with RunRegistry() as registry:
+        registry.record_evaluation(summary, run_id=None, run_name=run_name, notes=notes,
+                                   source=EVAL_FOLDER, num_docs=last_run["num_docs"], evaluated_at=evaluated_at,
+                                   intervals=intervals, level=CONFIDENCE_LEVEL, resamples=BOOTSTRAP_RESAMPLES)
+    print("🗃️ Recorded evaluation in the run registry (unlinked; link a batch with: "
+          "python -m utils.run_registry evaluate --run <batch_id>)")
+    log_run_to_csv(results, run_name=run_name, notes=notes, timestamp=evaluated_at)
 
 
 if __name__ == "__main__":
@@ -1,99 +1,165 @@
 """
 evaluation/log_summary.py
-Summarise the evaluation_log.csv produced by evaluate_outputs.py
+Summarise evaluation runs and their cost trade-offs from the run registry
+(utils/run_registry.py). Every view is a bounded SQL query, so the full history
+is never loaded, and tables are formatted without pandas to keep startup fast.
 """
 
 import argparse
 import datetime as dt
-import os
-import sys
-import pandas as pd
 
-# ---------- CONFIG --------------------------------------------------------- #
-DEFAULT_LOG_PATH = os.path.join("data", "logs", "evaluation_log.csv")
-# -------------------------------------------------------------------------- #
+from utils.run_registry import REGISTRY_PATH, open_registry
 
+SCORE_COLS = ["accuracy", "precision", "recall", "f1_score"]
 
-def load_log(path: str) -> pd.DataFrame:
-    if not os.path.exists(path):
-        sys.exit(f"❌  No log file found at {path}")
-    df = pd.read_csv(path, parse_dates=["timestamp"])
-    # in case older logs lack some cols, add them with NaN/0
-    needed = ["accuracy", "precision", "recall", "f1_score"]
-    for col in needed:
-        if col not in df.columns:
-            df[col] = float("nan")
-    return df.sort_values("timestamp")
+
+def _missing(x) -> bool:
+    return x is None or x != x  # None or NaN
 
 
 def pretty_percent(x):
-    return f"{x*100:5.1f} %"
+    if _missing(x):
+        return "    – "
+    return f"{x*100:5.1f} %"
+
+
+def pretty_usd(x):
+    if _missing(x):
+        return "–"
+    return f"${x:.4f}"
+
+
+def pretty_interval(low, high):
+    if _missing(low) or _missing(high):
+        return "–"
+    return f"[{low*100:.1f}, {high*100:.1f}]"
+
 
+def format_table(rows: list[dict], columns: list[str]) -> str:
+    """
+    Right-aligned plain-text table, like DataFrame.to_string(index=False).
+    """
+    cells = [[str(row[col]) for col in columns] for row in rows]
+    widths = [max([len(col)] + [len(r[i]) for r in cells]) for i, col in enumerate(columns)]
+    lines = [" ".join(col.rjust(w) for col, w in zip(columns, widths))]
+    lines += [" ".join(cell.rjust(w) for cell, w in zip(r, widths)) for r in cells]
+    return "\n".join(lines)
 
-def print_recent(df: pd.DataFrame, n: int = 10):
-    recent = df.tail(n)[
-        ["timestamp", "run_name", "accuracy", "precision", "recall", "f1_score"]
-    ].copy()
 
-    recent["timestamp"] = recent["timestamp"].dt.strftime("%Y‑%m‑%d %H:%M")
-    for col in ["accuracy", "precision", "recall", "f1_score"]:
-        recent[col] = recent[col].apply(pretty_percent)
+def print_recent(registry, n: int = 10):
+    recent = registry.recent_evaluations(n)
+    if not recent:
+        print("\n🕑  No evaluation runs recorded yet")
+        return
 
+    rows = [
+        {
+            "evaluated_at": f"{dt.datetime.fromisoformat(r['evaluated_at']):%Y‑%m‑%d %H:%M}",
+            "run_name": r["run_name"],
+            "run_id": r["run_id"] or "–",
+            **{col: pretty_percent(r[col]) for col in SCORE_COLS},
+            "f1_95%_ci": pretty_interval(r["f1_low"], r["f1_high"]),
+        }
+        for r in recent
+    ]
     print("\n🕑  Recent runs")
-    print(recent.to_string(index=False))
+    print(format_table(rows, ["evaluated_at", "run_name", "run_id"] + SCORE_COLS + ["f1_95%_ci"]))
 
 
-def print_best(df: pd.DataFrame):
-    best = df.loc[df["f1_score"].idxmax()]
+def print_best(registry):
+    best = registry.best_evaluation()
+    if best is None:
+        return
     print(
         f"\n🏆  Best run so far:  {best['run_name']}  "
-        f"({best['timestamp']:%Y‑%m‑%d %H:%M})  –  "
-        f"F1 {pretty_percent(best['f1_score'])},  "
+        f"({dt.datetime.fromisoformat(best['evaluated_at']):%Y‑%m‑%d %H:%M})  –  "
+        f"F1 {pretty_percent(best['f1_score'])},  "
         f"P {pretty_percent(best['precision'])},  "
         f"R {pretty_percent(best['recall'])}"
     )
 
 
-def print_rolling(df: pd.DataFrame, window: int = 5):
-    """Print rolling‑window averages for numeric score columns only."""
-    numeric_cols = ["accuracy", "precision", "recall", "f1_score"]
-    rolling = (
-        df.set_index("timestamp")[numeric_cols]      # keep only numbers
-          .rolling(f"{window}D")
-          .mean()
-          .tail(1)
-    )
-    if rolling.empty:
+def print_rolling(registry, window: int = 5):
+    """Print averages over the evaluations of the last `window` days."""
+    since = (dt.datetime.now() - dt.timedelta(days=window)).isoformat()
+    r = registry.mean_metrics_since(since)
+    if r is None:
         return
-    r = rolling.iloc[0]
     print(
-        f"\n📈  Rolling {window}‑day avg – "
-        f"F1 {pretty_percent(r['f1_score'])},  "
+        f"\n📈  Rolling {window}‑day avg ({r['n']} runs) – "
+        f"F1 {pretty_percent(r['f1_score'])},  "
         f"P {pretty_percent(r['precision'])},  "
         f"R {pretty_percent(r['recall'])}"
     )
 
 
+def pareto_front(runs: list[dict], metric: str = "f1_score") -> list[dict]:
+    """
+    Runs not beaten by a cheaper-or-equal run on metric: sorted by cost per PDF, keeps
+    each run whose metric is higher than every cheaper one.
+    """
+    front, best = [], float("-inf")
+    priced = [r for r in runs if r.get("cost_per_pdf") is not None and r.get(metric) is not None]
+    for run in sorted(priced, key=lambda r: (r["cost_per_pdf"], -r[metric])):
+        if run[metric] > best:
+            front.append(run)
+            best = run[metric]
+    return front
+
+
+def print_cost_tradeoffs(registry, n: int = 10):
+    """
+    Cost per correct field and F1 per dollar for the most recent evaluated batches,
+    and the F1-versus-cost Pareto front among them.
+    """
+    runs = registry.run_metrics(n)
+    if not runs:
+        print("\n💸  No evaluated batches yet (link one with: python -m utils.run_registry evaluate)")
+        return
+
+    rows = [
+        {
+            "run_id": r["run_id"],
+            "model": r["model"],
+            "num_pdfs": r["num_pdfs"],
+            "cost_per_pdf": pretty_usd(r["cost_per_pdf"]),
+            "f1_score": pretty_percent(r["f1_score"]),
+            "cost_per_correct_field": pretty_usd(r["cost_per_correct_field"]),
+            "f1_per_usd": "–" if _missing(r["f1_per_usd"]) else f"{r['f1_per_usd']:.2f}",
+        }
+        for r in runs
+    ]
+    print("\n💸  Cost vs. quality (latest evaluation per batch)")
+    print(format_table(rows, list(rows[0])))
+
+    front = pareto_front(runs)
+    print("\n⚖️  F1 vs. $/PDF Pareto front: " + "  →  ".join(
+        f"{r['run_id']} ({pretty_usd(r['cost_per_pdf'])}, F1 {pretty_percent(r['f1_score']).strip()})" for r in front
+    ))
+
 
 def main():
     parser = argparse.ArgumentParser(description="Summarise evaluation runs")
-    parser.add_argument("--log", default=DEFAULT_LOG_PATH, help="CSV log path")
+    parser.add_argument("--registry", default=REGISTRY_PATH, help="Run registry path")
     parser.add_argument("--last", type=int, default=10, help="Show last‑N runs")
     parser.add_argument("--window", type=int, default=5, help="Rolling days")
     parser.add_argument("--plot", action="store_true", help="Show F1 chart")
     args = parser.parse_args()
 
-    df = load_log(args.log)
-    print_recent(df, args.last)
-    print_best(df)
-    print_rolling(df, args.window)
+    with open_registry(args.registry) as registry:
+        print_recent(registry, args.last)
+        print_best(registry)
+        print_rolling(registry, args.window)
+        print_cost_tradeoffs(registry, args.last)
+        history = registry.f1_history() if args.plot else []
 
     if args.plot:
         try:
             import matplotlib.pyplot as plt
 
+            timestamps = [dt.datetime.fromisoformat(t) for t, _ in history]
             plt.figure(figsize=(8, 3))
-            plt.plot(df["timestamp"], df["f1_score"], marker="o")
+            plt.plot(timestamps, [f1 for _, f1 in history], marker="o")
             plt.title("F1‑score over time")
             plt.ylabel("F1")
             plt.xlabel("Run timestamp")
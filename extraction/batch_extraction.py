@@ -1,13 +1,21 @@
+import argparse
 import os
-from extraction.extraction_script import run_pdf_tests
+from extraction.extraction_script import extract_specific_pdfs, run_pdf_tests
 
 def main():
-    inspection_urls_path = os.path.join("data", "inspection_urls.csv")
-    test_amount = 43
-    skip_existing = False
-    reextract_already_extracted_only = True
+    parser = argparse.ArgumentParser(description="Batch extraction over the inspection URL CSV")
+    parser.add_argument("--count", type=int, default=43, help="Number of PDFs to process")
+    parser.add_argument("--skip-existing", action="store_true", help="Skip PDFs that already have an evaluation file")
+    parser.add_argument("--all-pdfs", action="store_true", help="Don't restrict the batch to data/image_pdf_ids.txt")
+    parser.add_argument("--ids", nargs="+", help="Re-extract only these PDF IDs")
+    parser.add_argument("--csv", default=os.path.join("data", "inspection_urls.csv"))
+    args = parser.parse_args()
 
-    run_pdf_tests(test_amount, skip_existing, inspection_urls_path, reextract_already_extracted_only)
+    if args.ids:
+        extract_specific_pdfs(list(dict.fromkeys(args.ids)), args.csv)
+        return
+
+    run_pdf_tests(args.count, args.skip_existing, args.csv, not args.all_pdfs)
 
 if __name__ == "__main__":
     print("📦 Running batch extraction...")
@@ -2,49 +2,182 @@ import os
 import csv
 import json
 import random
+import threading
 import time
 import requests
-from schema.schema import FIELDS, FIELD_DEFINITIONS
+from schema.compiled import SCHEMA
+from utils.confidence import document_confidence, field_confidence
 from utils.helpers import (
     call_openai_image_json,
+    call_openai_text_json,
     get_images_from_pdf,
-    is_text_pdf,
+    get_page_texts_from_pdf,
+    is_text_page,
     is_appendix_page_gpt,
+    is_appendix_page_text_gpt,
     normalize_model_output,
     generate_default_ground_truth,
     synthesize_final_json,
+    parse_model_json,
     cost_usd,
-    log_pdf_usage,
-    log_batch_summary,
-    load_image_pdf_ids
+    load_image_pdf_ids,
+    APPENDIX_FILTER_PROMPT,
+    SYNTHESIS_INSTRUCTIONS,
+    SYNTHESIS_LIST_HEADER,
+    SYNTHESIS_PROMPT_PREFIX,
 )
+from utils.page_hash import PageHashIndex, page_hash
+from utils.prompt_layout import build_prefix, task_line
+from utils.result_store import STORE_PATH, ResultStore
+from utils.run_context import PdfMeter, RunContext
+from utils.run_registry import REGISTRY_PATH, RunRegistry, prompt_hash
+from utils import tracing
+from utils.tracing import span
+from utils.transport import set_context
 from utils.pricing import PRICES #ta bort om usd grejen fungerar
-from collections import defaultdict
-from datetime import datetime
 
 # === Constants ===
 MODEL_NAME = "gpt-4.1"
 EXTRACTION_STRATEGY = "page-by-page"
+TEXT_EXTRACTION_STRATEGY = "text-layer"
+HYBRID_EXTRACTION_STRATEGY = "hybrid"
+SELECTIVE_EXTRACTION_STRATEGY = "selective"  # only some pages re-extracted (extraction/reextract_planner.py)
+PAGE_DPI = 200  # rasterization resolution for scanned pages
+
+# Structured outputs: the API enforces the JSON schema compiled from schema/schema.py
+STRUCTURED_OUTPUTS = True
+RESPONSE_FORMAT = SCHEMA.response_format if STRUCTURED_OUTPUTS else None
+
+# Near-duplicate page reuse of the appendix check (scanned pages only)
+PAGE_DEDUP = True
+PAGE_HASH_INDEX_PATH = "data/logs/page_hash_index.json"
+PAGE_HASH_MAX_DISTANCE = 6  # max differing bits out of 256 to count as the same page
+
+# Also append outputs and page results to the consolidated result store, under the batch id
+RESULT_STORE = True
+RESULT_STORE_PATH = STORE_PATH
+
+# Every finished batch is registered with its config, cost and latency totals
+RUN_REGISTRY_PATH = REGISTRY_PATH
+
+# Prompt caching: page extraction and synthesis calls open with one shared system message holding
+# both tasks' static instructions, so every call after the first reuses it from the provider's cache.
+# The appendix check keeps its own short prompt: it sends no response_format, and the schema is part
+# of the cached prefix, so it could not share the cache entry anyway.
+# Off by default: each call then also sees the other task's instructions, and that has only been
+# costed offline (replay cache simulation), not checked for accuracy. Turn it on after a live A/B
+# run shows no F1 regression (compare_runs / the bootstrap paired test).
+SHARED_PROMPT_PREFIX = False
+
+# Field confidence: page and synthesis calls request token logprobs, and the confidence of every
+# field (utils/confidence.py) is stored in the result store for the re-extraction planner
+FIELD_CONFIDENCE = True
+
+# Page-level extraction prompt, built once from the compiled schema
+PAGE_EXTRACTION_PROMPT = (
+    "You are analyzing a page from a Swedish housing inspection report. "
+    "Extract the following fields if they are clearly visible. "
++   "If a field is not mentioned or not applicable, set it to false."
+
+    "Field definitions:\n"
+    + SCHEMA.field_lines + "\n\n"
+
+    "Instructions:\n"
+    "- Return the extracted values in **exactly** the JSON format shown below.\n"
+    "- For all fields, use false if the information is not present or readable.\n\n"
+
+    "- For InspectionDate:\n"
+    "  • Only extract the **year and month**, in the format YYYY-MM.\n\n"
+
+    "- For MoistureDamage:\n"
+    "    • Use the object format with fixed keys:\n"
+    "        - " + ", ".join(SCHEMA.subfields["MoistureDamage"]) + ".\n"
+    "    • Each value must be true if water damage or moisture issues are clearly mentioned in that location, else false.\n\n"
+
+
+    "- For RenovationNeeds:\n"
+    "   • Only use the following fixed keys: " + ", ".join(f"'{key}'" for key in SCHEMA.subfields["RenovationNeeds"]) + ".\n"
+    "   • Set each value to true only if there is a **clear and direct statement** indicating the need for renovation in that area.\n"
+    "   • Use true for phrases like 'slitage', 'dåligt skick', 'bör åtgärdas', or specific plans/timelines for future renovation.\n"
+    "   • If the area is mentioned but no issue is present, or if it is not mentioned at all, set to false.\n\n"
+
+
+    "- For AsbestosPresence:\n"
+    "  • 'presence': true if asbestos is mentioned, false if unmentioned.\n"
+    "  • 'Measured': true if there is explicit mention of measurement or testing.\n\n"
+
+    "- For SummaryInsights:\n"
+    "  • Write a short free-text summary of 1–3 clearly stated renovation actions.\n"
+    "  • Use plain Swedish, max 1–2 sentences.\n"
+    "  • Only include this if specific, actionable renovations are mentioned.\n"
+    "  • Set to null if nothing actionable is described.\n"
+
+    "Return exactly the following JSON format:\n"
+    "```json\n" + SCHEMA.json_template + "\n```"
+)
+
+# What each call sends, built once per process: the shared system prefix (or None) and the user prompt
+if SHARED_PROMPT_PREFIX:
+    PROMPT_PREFIX = build_prefix({"page": PAGE_EXTRACTION_PROMPT, "synthesis": SYNTHESIS_INSTRUCTIONS})
+    PAGE_PROMPT = task_line("page")
+    SYNTHESIS_PROMPT_HEAD = task_line("synthesis") + "\n" + SYNTHESIS_LIST_HEADER
+else:
+    PROMPT_PREFIX = None
+    PAGE_PROMPT = PAGE_EXTRACTION_PROMPT
+    SYNTHESIS_PROMPT_HEAD = SYNTHESIS_PROMPT_PREFIX
 
 # === Variables ===
-token_meter = defaultdict(lambda: {"prompt": 0, "completion": 0, "cached": 0})
-batch_token_meter = {"prompt": 0, "completion": 0, "cached": 0}
-num_pdfs_processed = 0
+# Token/cost counters, batch id and log paths of the current batch (utils/run_context.py).
+# A run starts on first use and ends with finish_batch(), so the next batch gets fresh counters.
+run_context = None
+_run_lock = threading.Lock()
+# Opened on first use; their own lock so opening the store can take _run_lock for the batch id
+page_hash_index = None
+result_store = None
+_resource_lock = threading.Lock()
+
+# One pooled HTTP session for every PDF download
+http_session = requests.Session()
+
+
+def _new_run(batch_id: str | None = None) -> RunContext:
+    run = RunContext(MODEL_NAME, batch_id)
+    # Per-stage spans for this batch (the file appears once the first span finishes)
+    tracing.configure(os.path.join(run.batch_dir, "trace.jsonl"))
+    if result_store is not None:
+        result_store.ensure_run(run.batch_id, source=f"{MODEL_NAME} {EXTRACTION_STRATEGY}")
+    return run
+
+
+def start_run(batch_id: str | None = None) -> RunContext:
+    """
+    Starts a new batch: fresh counters, its own per_pdf_costs folder and trace file.
+    """
+    global run_context
+    with _run_lock:
+        run_context = _new_run(batch_id)
+        return run_context
 
-# === Batch metadata ===
 
-start_time = datetime.now()
-batch_id = start_time.strftime("batch_%Y-%m-%d_%H%M")
-batch_pdf_dir = f"data/logs/per_pdf_costs/{batch_id}"
-batch_pdf_csv = os.path.join(batch_pdf_dir, "per_pdf_costs.csv")
-batch_summary_csv = "data/logs/batch_summaries.csv"
+def get_run_context() -> RunContext:
+    """
+    The current batch, started on first use.
+    """
+    global run_context
+    with _run_lock:
+        if run_context is None:
+            run_context = _new_run()
+        return run_context
 
-# Create folders
-os.makedirs(batch_pdf_dir, exist_ok=True)
 
 def save_evaluation_json(pdf_id: str, model_output: dict, output_folder="data/evaluation"):
     """
     Saves model_output to a JSON file in the data/evaluation/ directory with ground_truth set to null.
+
+    The JSON file stays the source of truth, with the store an append-only copy: annotators
+    edit ground_truth in these files, and the result store only holds the annotations as of
+    its last import, so regenerating the file from the store could drop unimported edits.
+    The ground truth is therefore read back and the file replaced atomically.
     """
     os.makedirs(output_folder, exist_ok=True)
     out_path = os.path.join(output_folder, f"{pdf_id}.json")
@@ -53,9 +186,9 @@ def save_evaluation_json(pdf_id: str, model_output: dict, output_folder="data/ev
     if os.path.exists(out_path):
         with open(out_path, "r", encoding="utf-8") as f:
             existing_data = json.load(f)
-        existing_gt = existing_data.get("ground_truth", generate_default_ground_truth(model_output))
+        existing_gt = existing_data.get("ground_truth", generate_default_ground_truth())
     else:
-        existing_gt = generate_default_ground_truth(model_output)
+        existing_gt = generate_default_ground_truth()
 
 
     evaluation_data = {
@@ -64,193 +197,327 @@ def save_evaluation_json(pdf_id: str, model_output: dict, output_folder="data/ev
         "ground_truth": existing_gt
     }
 
-    with open(out_path, "w", encoding="utf-8") as f:
+    tmp_path = out_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
         json.dump(evaluation_data, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, out_path)
 
     print(f"Saved evaluation file: {out_path}")
 
+    if RESULT_STORE:
+        get_result_store().append_document(get_run_context().batch_id, pdf_id, model_output)
 
-def extract_fields_from_pdf_multipage(pdf_id: str, url: str) -> dict:
+
+def get_page_hash_index() -> PageHashIndex:
     """
-    Extracts structured data from all pages of an image-based PDF:
-      1. Convert each page to image.
-      2. Query GPT-4o for field extraction per page.
-      3. Combine page-level JSON outputs into one.
-    Returns a merged dictionary with the best guess for each field.
+    Loads the page hash index on first use and keeps it for the rest of the process.
     """
-    global num_pdfs_processed
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
-    except requests.RequestException as error:
-        print(f"Error fetching PDF: {error}")
-        return {}
+    global page_hash_index
+    with _resource_lock:
+        if page_hash_index is None:
+            page_hash_index = PageHashIndex(PAGE_HASH_INDEX_PATH, max_distance=PAGE_HASH_MAX_DISTANCE)
+        return page_hash_index
 
-    pdf_bytes = response.content
-    images = get_images_from_pdf(pdf_bytes, dpi=200)
-    if not images:
-        print("No images extracted from PDF.")
-        return {}
-    elif len(images) < 4:
-        print(f"Skipping PDF with ID {pdf_id}: too short ({len(images)} pages).")
-        return {}
-
-    field_lines = [f'- "{key}": {FIELD_DEFINITIONS[key]}' for key in FIELDS]
-    json_template = "{\n" + ",\n".join([f'  "{key}": null' for key in FIELDS]) + "\n}"
 
-    prompt_text = (
-        "You are analyzing a page from a Swedish housing inspection report. "
-        "Extract the following fields if they are clearly visible. "
-+       "If a field is not mentioned or not applicable, set it to false."
-
-        "Field definitions:\n"
-        + "\n".join(field_lines) + "\n\n"
+def get_result_store() -> ResultStore:
+    """
+    Opens the result store on first use and registers this batch as a run.
+    """
+    global result_store, run_context
+    with _resource_lock:
+        if result_store is None:
+            store = ResultStore(RESULT_STORE_PATH)
+            # Published under _run_lock so a batch started meanwhile is registered by _new_run
+            with _run_lock:
+                if run_context is None:
+                    run_context = _new_run()
+                store.ensure_run(run_context.batch_id, source=f"{MODEL_NAME} {EXTRACTION_STRATEGY}")
+                result_store = store
+        return result_store
+
+
+def record_call(meter: PdfMeter, call_type: str, usage, label: str) -> dict:
+    """
+    Adds an API call to the PDF's totals and prints its cost next to the PDF's running total.
+    Returns the call's token counts.
+    """
+    tokens = meter.add(call_type, usage)
+    print(f"   🧮 {label} cost: ${cost_usd(tokens, model=meter.model):.6f} "
+          f"(Prompt={tokens['prompt']}, Completion={tokens['completion']}, Cached={tokens['cached']})")
+    print(f"   📈 Cumulative usage for {meter.pdf_id}: {meter.tokens} (Total cost: ${meter.cost():.6f})")
+    print("-" * 80)
+    return tokens
 
-        "Instructions:\n"
-        "- Return the extracted values in **exactly** the JSON format shown below.\n"
-        "- For all fields, use false if the information is not present or readable.\n\n"
 
-        "- For InspectionDate:\n"
-        "  • Only extract the **year and month**, in the format YYYY-MM.\n\n"
+def download_pdf(pdf_id: str, url: str) -> bytes | None:
+    """
+    Fetches a PDF over the pooled HTTP session. Returns None if the download fails.
+    """
+    with span("download", pdf_id=pdf_id) as s:
+        try:
+            response = http_session.get(url)
+            response.raise_for_status()
+        except requests.RequestException as error:
+            print(f"Error fetching PDF: {error}")
+            return None
+        s.add_bytes(len(response.content))
+    return response.content
 
-        "- For MoistureDamage:\n"
-        "    • Use the object format with fixed keys:\n"
-        "        - mentions_garage, mentions_källare, mentions_roof, mentions_balcony, mentions_bjälklag, mentions_facade.\n"
-        "    • Each value must be true if water damage or moisture issues are clearly mentioned in that location, else false.\n\n"
 
+def extract_fields_from_pdf_multipage(pdf_id: str, url: str) -> dict:
+    """
+    Extracts structured data from all pages of a PDF:
+      1. Read the text layer of each page; pages with enough text are sent as text,
+         the rest (scanned pages) are converted to images.
+      2. Query GPT-4o for field extraction per page.
+      3. Combine page-level JSON outputs into one.
+    Returns a merged dictionary with the best guess for each field.
+    """
+    pdf_bytes = download_pdf(pdf_id, url)
+    if pdf_bytes is None:
+        return {}
 
-        "- For RenovationNeeds:\n"
-        "   • Only use the following fixed keys: 'roof', 'garage', 'facade', 'balcony', 'källare', 'bjälklag'.\n"
-        "   • Set each value to true only if there is a **clear and direct statement** indicating the need for renovation in that area.\n"
-        "   • Use true for phrases like 'slitage', 'dåligt skick', 'bör åtgärdas', or specific plans/timelines for future renovation.\n"
-        "   • If the area is mentioned but no issue is present, or if it is not mentioned at all, set to false.\n\n"
+    return extract_fields_from_pdf_bytes(pdf_id, pdf_bytes)
 
 
-        "- For AsbestosPresence:\n"
-        "  • 'presence': true if asbestos is mentioned, false if unmentioned.\n"
-        "  • 'Measured': true if there is explicit mention of measurement or testing.\n\n"
+def read_page_texts(pdf_id: str, pdf_bytes: bytes) -> list[str] | None:
+    """
+    Text layer of every page, or None if the PDF cannot be read.
+    """
+    with span("text_layer", pdf_id=pdf_id) as s:
+        try:
+            page_texts = get_page_texts_from_pdf(pdf_bytes)
+        except Exception as error:
+            print(f"Error reading PDF: {error}")
+            return None
+        s.add_bytes(sum(len(t) for t in page_texts))
+    return page_texts
 
-        "- For SummaryInsights:\n"
-        "  • Write a short free-text summary of 1–3 clearly stated renovation actions.\n"
-        "  • Use plain Swedish, max 1–2 sentences.\n"
-        "  • Only include this if specific, actionable renovations are mentioned.\n"
-        "  • Set to null if nothing actionable is described.\n"
 
-        "Return exactly the following JSON format:\n"
-        "```json\n" + json_template + "\n```"
-    )
+def rasterize_page(pdf_id: str, pdf_bytes: bytes, i: int):
+    """
+    Page i rendered at PAGE_DPI (scanned pages only).
+    """
+    with span("rasterize", pdf_id=pdf_id, page=i) as s:
+        page_img = get_images_from_pdf(pdf_bytes, dpi=PAGE_DPI, first_page=i+1, last_page=i+1)[0]
+        s.add_bytes(page_img.width * page_img.height * len(page_img.getbands()))
+    return page_img
 
-    all_results = []
 
-    for i, page_img in enumerate(images):
-        print(f"Checking if page {i+1} is an appendix...")
-        is_appendix, usage = is_appendix_page_gpt(page_img, MODEL_NAME)
+def extract_fields_from_pdf_bytes(pdf_id: str, pdf_bytes: bytes) -> dict:
+    """
+    Steps 1-3 of extract_fields_from_pdf_multipage for a PDF that is already in memory
+    (e.g. uploaded to the extraction service).
+    """
+    page_texts = read_page_texts(pdf_id, pdf_bytes)
+    if page_texts is None:
+        return {}
 
-        # Update cumulative totals
-        token_meter[pdf_id]["prompt"] += usage.prompt_tokens
-        token_meter[pdf_id]["completion"] += usage.completion_tokens
-        token_meter[pdf_id]["cached"] += usage.prompt_tokens_details.cached_tokens
+    num_pages = len(page_texts)
+    if not page_texts:
+        print("No pages found in PDF.")
+        return {}
+    elif num_pages < 4:
+        print(f"Skipping PDF with ID {pdf_id}: too short ({num_pages} pages).")
+        return {}
 
-        # Calculate step cost
-        step_tokens = {
-            "prompt": usage.prompt_tokens,
-            "completion": usage.completion_tokens,
-            "cached": usage.prompt_tokens_details.cached_tokens,
-        }
-        step_cost = cost_usd(step_tokens, MODEL_NAME)
-        cumulative_cost = cost_usd(token_meter[pdf_id], model=MODEL_NAME)
+    text_pages = {i for i, page_text in enumerate(page_texts) if is_text_page(page_text)}
+    if not text_pages:
+        extraction_strategy = EXTRACTION_STRATEGY
+    elif len(text_pages) == num_pages:
+        extraction_strategy = TEXT_EXTRACTION_STRATEGY
+    else:
+        extraction_strategy = HYBRID_EXTRACTION_STRATEGY
+    print(f"{len(text_pages)}/{num_pages} pages have a text layer — strategy: {extraction_strategy}")
 
-        # Appendix cost and cumulative tokens
-        print(f"🧮 Appendix cost: ${step_cost:.6f}")
-        print(f"📊 Cumulative usage for {pdf_id}: {token_meter[pdf_id]} (Total cost: ${cumulative_cost:.6f})")
-        print("-" * 70)  # nice separator
 
+    run = get_run_context()
+    meter = run.start_pdf(pdf_id)
+    all_results = []
+    page_confidences = []
+    hash_index = get_page_hash_index() if PAGE_DEDUP else None
+
+    for i in range(num_pages):
+        set_context(pdf_id=pdf_id, page=i)
+        page_phash = known_page = None
+        page_text = page_img = None
+        if i in text_pages:
+            page_text = page_texts[i]
+            print(f"Checking if page {i+1} is an appendix (text layer)...")
+            with span("api_call", call_type="appendix", modality="text", pdf_id=pdf_id, page=i):
+                is_appendix, usage = is_appendix_page_text_gpt(page_text, MODEL_NAME)
+        else:
+            # Only scanned pages are rasterized
+            page_img = rasterize_page(pdf_id, pdf_bytes, i)
+
+            if hash_index is not None:
+                with span("page_hash", pdf_id=pdf_id, page=i):
+                    page_phash = page_hash(page_img)
+                    known_page = hash_index.lookup(page_phash)
+            if known_page is not None:
+                # Only the classification is reused: pages sharing a layout can differ in their fields
+                print(f"♻️ Page {i+1} matches page {known_page['page']+1} of PDF {known_page['pdf_id']} — reusing its appendix check.")
+                is_appendix = known_page["is_appendix"]
+            else:
+                print(f"Checking if page {i+1} is an appendix...")
+                with span("api_call", call_type="appendix", modality="image", pdf_id=pdf_id, page=i):
+                    is_appendix, usage = is_appendix_page_gpt(page_img, MODEL_NAME)
+        if known_page is None:
+            step_tokens = record_call(meter, "appendix", usage, f"Appendix check page {i+1}")
+            if page_phash is not None:
+                hash_index.add(page_phash, pdf_id, i, is_appendix, step_tokens["prompt"] + step_tokens["completion"])
 
         if is_appendix:
             print(f"Page {i+1} flagged as appendix. Skipping the rest of PDF {pdf_id}.")
             break
 
-        print(f"Processing page {i+1}/{len(images)}...")
-        raw, usage = call_openai_image_json(page_img, prompt_text, MODEL_NAME)
+        result, _, _, confidence = extract_page(meter, i, num_pages, page_text, page_img)
+        all_results.append(result)
+        page_confidences.append(confidence)
 
-        # Update cumulative totals
-        token_meter[pdf_id]["prompt"] += usage.prompt_tokens
-        token_meter[pdf_id]["completion"] += usage.completion_tokens
-        token_meter[pdf_id]["cached"] += usage.prompt_tokens_details.cached_tokens
 
-        # Calculate step cost
-        step_tokens = {
-            "prompt": usage.prompt_tokens,
-            "completion": usage.completion_tokens,
-            "cached": usage.prompt_tokens_details.cached_tokens,
-        }
-        step_cost = cost_usd(step_tokens, model=MODEL_NAME)
-        cumulative_cost = cost_usd(token_meter[pdf_id], model=MODEL_NAME)
+    final_json = synthesize_pdf(meter, all_results, page_confidences)
 
-        # Print step cost + cumulative tokens
-        print(f"🧩 Step complete for page {i+1}/{len(images)}")
-        print(f"   🧮 Step cost: ${step_cost:.6f}")
-        print(f"   📊 Tokens this step: Prompt={usage.prompt_tokens}, Completion={usage.completion_tokens}, Cached={usage.prompt_tokens_details.cached_tokens}")
-        print(f"   📈 Cumulative usage and cost for {pdf_id}: ${token_meter[pdf_id]} ${cumulative_cost:.6f}")
-        print("-" * 80)
+    # Stream this PDF's row to the batch's per_pdf_costs.csv
+    total_cost = run.finish_pdf(meter, extraction_strategy, num_pages)
+    print(f"   💰 Final total cost for {pdf_id}: ${total_cost:.6f}")
+    print("=" * 80)
 
+    return final_json
 
-        if raw.startswith("```json"):
-            raw = raw.strip("```json").strip("```").strip()
 
-        try:
-            parsed = json.loads(raw)
-            all_results.append(parsed)
-        except json.JSONDecodeError:
-            print(f"Page {i+1}: Could not parse JSON. Raw output:\n{raw}")
-            all_results.append({"error": "Could not parse", "raw_output": raw})
+def extract_page(meter: PdfMeter, i: int, num_pages: int, page_text: str | None = None,
+                 page_img=None) -> tuple[dict, bool, dict, dict | None]:
+    """
+    Page-level extraction of page i from its text layer (page_text) or its image, requested
+    again once if the response cannot be parsed. Returns the page result (an error entry if
+    it still could not be parsed), whether it parsed, the first call's token counts and the
+    field confidences (None without FIELD_CONFIDENCE).
+    """
+    run, pdf_id = meter.run, meter.pdf_id
+    modality = "text" if page_text is not None else "image"
+
+    def call():
+        if page_text is not None:
+            return call_openai_text_json(page_text, PAGE_PROMPT, MODEL_NAME, response_format=RESPONSE_FORMAT,
+                                         system_prefix=PROMPT_PREFIX, logprobs=FIELD_CONFIDENCE)
+        return call_openai_image_json(page_img, PAGE_PROMPT, MODEL_NAME, response_format=RESPONSE_FORMAT,
+                                      system_prefix=PROMPT_PREFIX, logprobs=FIELD_CONFIDENCE)
+
+    print(f"Processing page {i+1}/{num_pages}...")
+    with span("api_call", call_type="page", modality=modality, pdf_id=pdf_id, page=i):
+        raw, usage, logprobs = call()
+    print(f"🧩 Step complete for page {i+1}/{num_pages}")
+    step_tokens = record_call(meter, "page", usage, "Step")
+
+    with span("parse", pdf_id=pdf_id, page=i) as s:
+        parsed, repaired = parse_model_json(raw)
+        s.add_bytes(len(raw))
+    if parsed is None:
+        # Only this page is requested again, once
+        print(f"Page {i+1}: Could not parse JSON, retrying page once...")
+        run.count("page_retries")
+        with span("api_call", call_type="page_retry", modality=modality, pdf_id=pdf_id, page=i):
+            raw, retry_usage, logprobs = call()
+        meter.add("page_retry", retry_usage)
+        parsed, repaired = parse_model_json(raw)
+
+    if parsed is None:
+        run.count("page_failures")
+        print(f"Page {i+1}: Could not parse JSON. Raw output:\n{raw}")
+        return {"error": "Could not parse", "raw_output": raw}, False, step_tokens, None
+
+    if repaired:
+        run.count("page_repaired")
+    return parsed, True, step_tokens, field_confidence(raw, logprobs)
+
+
+def synthesize_pdf(meter: PdfMeter, all_results: list, page_confidences: list) -> dict:
+    """
+    Saves the page-level results, synthesizes them into the final JSON (retried once if
+    unusable) and stores the page and field confidences. Returns the final JSON.
+    """
+    run, pdf_id = meter.run, meter.pdf_id
 
     # ✅ NEW: Save per-page logs to disk
-    os.makedirs("data/page_logs", exist_ok=True)
-    with open(f"data/page_logs/{pdf_id}_pages.json", "w", encoding="utf-8") as f:
-        json.dump(all_results, f, indent=2, ensure_ascii=False)
-
-    final_json, usage = synthesize_final_json(all_results, MODEL_NAME)
-
-    # Update cumulative totals
-    token_meter[pdf_id]["prompt"] += usage.prompt_tokens
-    token_meter[pdf_id]["completion"] += usage.completion_tokens
-    token_meter[pdf_id]["cached"] += usage.prompt_tokens_details.cached_tokens
-
-    # Calculate step cost
-    step_tokens = {
-        "prompt": usage.prompt_tokens,
-        "completion": usage.completion_tokens,
-        "cached": usage.prompt_tokens_details.cached_tokens,
-    }
-    step_cost = cost_usd(step_tokens, model=MODEL_NAME)
-    cumulative_cost = cost_usd(token_meter[pdf_id], model=MODEL_NAME)
+    with span("save_page_logs", pdf_id=pdf_id):
+        os.makedirs("data/page_logs", exist_ok=True)
+        with open(f"data/page_logs/{pdf_id}_pages.json", "w", encoding="utf-8") as f:
+            json.dump(all_results, f, indent=2, ensure_ascii=False)
+        if RESULT_STORE:
+            get_result_store().append_pages(run.batch_id, pdf_id, all_results)
+
+    set_context(pdf_id=pdf_id)
+    call_type = "synthesis"
+    with span("api_call", call_type=call_type, modality="text", pdf_id=pdf_id):
+        final_json, usage, confidence = synthesize_final_json(
+            all_results, MODEL_NAME, response_format=RESPONSE_FORMAT, head=SYNTHESIS_PROMPT_HEAD,
+            system_prefix=PROMPT_PREFIX, logprobs=FIELD_CONFIDENCE
+        )
+    if not final_json and usage is not None:
+        print("Retrying synthesis once...")
+        run.count("synthesis_retries")
+        meter.add(call_type, usage)
+        call_type = "synthesis_retry"
+        with span("api_call", call_type=call_type, modality="text", pdf_id=pdf_id):
+            final_json, usage, confidence = synthesize_final_json(
+                all_results, MODEL_NAME, response_format=RESPONSE_FORMAT, head=SYNTHESIS_PROMPT_HEAD,
+                system_prefix=PROMPT_PREFIX, logprobs=FIELD_CONFIDENCE
+            )
+    if not final_json:
+        run.count("synthesis_failures")
 
-    # Print total token usage and cost
     print("🧪 Final synthesis step completed!")
-    print(f"   🧮 Synthesis cost: ${step_cost:.6f}")
-    print(f"   📈 Final cumulative usage for {pdf_id}: {token_meter[pdf_id]}")
-    print(f"   💰 Final total cost: ${cumulative_cost:.6f}")
-    print("=" * 80)
+    if usage is not None:
+        record_call(meter, call_type, usage, "Synthesis")
 
-    # Save usage data to CSV
-    log_pdf_usage(
-        csv_path=batch_pdf_csv,
-        pdf_id=pdf_id,
-        model=MODEL_NAME,
-        extraction_strategy=EXTRACTION_STRATEGY,  # or "page-by-page", "field-by-field"
-        prompt_tokens=token_meter[pdf_id]["prompt"],
-        completion_tokens=token_meter[pdf_id]["completion"],
-        cached_tokens=token_meter[pdf_id]["cached"],
-        total_cost_usd=cumulative_cost,
-        pages_extracted=len(images),
-    )
+    if final_json and FIELD_CONFIDENCE:
+        score = document_confidence(confidence)
+        if score is not None:
+            print(f"   🎯 Document confidence for {pdf_id}: {score:.3f}")
+        if RESULT_STORE:
+            get_result_store().append_confidences(run.batch_id, pdf_id, page_confidences, confidence, score)
+
+    return final_json
 
-    # Add total prompt, completion and cached tokens as well as total cost for the whole batch
-    batch_token_meter["prompt"] += token_meter[pdf_id]["prompt"]
-    batch_token_meter["completion"] += token_meter[pdf_id]["completion"]
-    batch_token_meter["cached"] += token_meter[pdf_id]["cached"]
-    num_pdfs_processed += 1
+
+def reextract_pages(pdf_id: str, url: str, pages: list[int], page_results: list,
+                    page_confidences: dict[int, dict] | None = None) -> dict:
+    """
+    Selective re-extraction: runs the page-level extraction again for the given pages only,
+    keeps the stored results (and confidences) of every other page, and synthesizes the final
+    JSON again. No appendix checks: the pages kept from the earlier extraction already end
+    where it found the appendix. Returns the final JSON like extract_fields_from_pdf_multipage.
+    """
+    pdf_bytes = download_pdf(pdf_id, url)
+    if pdf_bytes is None:
+        return {}
+    page_texts = read_page_texts(pdf_id, pdf_bytes)
+    if page_texts is None:
+        return {}
+
+    page_confidences = page_confidences or {}
+    pages = sorted(i for i in set(pages) if i < min(len(page_results), len(page_texts)))
+    print(f"Re-extracting {len(pages)}/{len(page_results)} pages of PDF {pdf_id}: {[i+1 for i in pages]}")
+
+    run = get_run_context()
+    meter = run.start_pdf(pdf_id)
+    all_results = list(page_results)
+    confidences = [page_confidences.get(i) for i in range(len(page_results))]
+    for i in pages:
+        set_context(pdf_id=pdf_id, page=i)
+        if is_text_page(page_texts[i]):
+            result, _, _, confidence = extract_page(meter, i, len(page_texts), page_text=page_texts[i])
+        else:
+            result, _, _, confidence = extract_page(meter, i, len(page_texts), page_img=rasterize_page(pdf_id, pdf_bytes, i))
+        all_results[i] = result
+        confidences[i] = confidence
+
+    final_json = synthesize_pdf(meter, all_results, confidences)
+
+    total_cost = run.finish_pdf(meter, SELECTIVE_EXTRACTION_STRATEGY, len(pages))
+    print(f"   💰 Final total cost for {pdf_id}: ${total_cost:.6f}")
+    print("=" * 80)
 
     return final_json
 
@@ -259,10 +526,6 @@ def process_single_pdf(pdf_id: str, url: str, skip: bool) -> bool:
     """
     Process a single PDF and return whether it was successfully processed.
     """
-    if is_text_pdf(url):
-        print(f"Skipping text-based PDF: {pdf_id}")
-        return False
-
     if skip:
         # Skip if already evaluated for testing purposes
         evaluation_path = os.path.join("data/evaluation", f"{pdf_id}.json")
@@ -271,20 +534,23 @@ def process_single_pdf(pdf_id: str, url: str, skip: bool) -> bool:
             return False
 
     print(f"\nExtracting fields from PDF ID: {pdf_id} with url: {url}")
-    model_output = extract_fields_from_pdf_multipage(pdf_id, url)
+    with span("pdf", pdf_id=pdf_id):
+        model_output = extract_fields_from_pdf_multipage(pdf_id, url)
 
-    if model_output:
-        normalized_output = normalize_model_output(model_output)
-        save_evaluation_json(pdf_id, normalized_output)
-        return True
-    else:
-        print(f"Extraction failed or empty for ID {pdf_id}")
-        return False
+        if model_output:
+            with span("save_evaluation", pdf_id=pdf_id):
+                normalized_output = normalize_model_output(model_output)
+                save_evaluation_json(pdf_id, normalized_output)
+            return True
+
+    print(f"Extraction failed or empty for ID {pdf_id}")
+    return False
 
 
 def run_pdf_tests(test_amount: int, skip: bool, inspection_urls_path: str, reextract_already_extracted_only: bool) -> None:
     """
-    Runs extraction on a set of image-based PDFs and saves evaluation-ready JSON files.
+    Runs extraction on a set of PDFs and saves evaluation-ready JSON files.
+    Text-based pages go through the text-layer path, scanned pages through images.
     """
     image_pdf_ids = load_image_pdf_ids() if reextract_already_extracted_only else []
 
@@ -305,33 +571,109 @@ def run_pdf_tests(test_amount: int, skip: bool, inspection_urls_path: str, reext
             if process_single_pdf(pdf_id, url, skip):
                 pdfs_read += 1
 
-    # Calculate final batch cost
-    batch_total_cost = cost_usd(batch_token_meter, model=MODEL_NAME)
-
-    # Save batch summary
-    log_batch_summary(
-        csv_path=batch_summary_csv,
-        batch_id=batch_id,
-        model=MODEL_NAME,
-        extraction_strategy="multipage",
-        num_pdfs=num_pdfs_processed,
-        prompt_tokens=batch_token_meter["prompt"],
-        completion_tokens=batch_token_meter["completion"],
-        cached_tokens=batch_token_meter["cached"],
-        total_cost_usd=batch_total_cost,
-    )
+    return finish_batch()
+
+
+def finish_batch() -> RunContext:
+    """
+    Logs the batch summary row, registers the batch, prints its totals and ends the run.
+    Returns the finished run.
+    """
+    global run_context
+    with _run_lock:
+        run, run_context = run_context, None
+    if run is None:
+        run = RunContext(MODEL_NAME)
+
+    # Registered before the CSV row: a registry created here is backfilled from the CSV,
+    # which would otherwise record this batch without its config
+    register_batch(run, run.cost())
+    batch_total_cost = run.write_summary()
 
     # Final printout
+    tokens = run.tokens
     print("=" * 80)
-    print(f"📦 Batch completed: {num_pdfs_processed} PDFs processed")
-    print(f"🧮 Batch Total Prompt tokens: {batch_token_meter['prompt']}")
-    print(f"🧮 Batch Total Completion tokens: {batch_token_meter['completion']}")
-    print(f"🧮 Batch Total Cached tokens: {batch_token_meter['cached']}")
+    print(f"📦 Batch completed: {run.num_pdfs} PDFs processed")
+    print(f"🧮 Batch Total Prompt tokens: {tokens['prompt']}")
+    print(f"🧮 Batch Total Completion tokens: {tokens['completion']}")
+    print(f"🧮 Batch Total Cached tokens: {tokens['cached']}")
     print(f"💰 Batch Total Cost: ${batch_total_cost:.6f}")
+    latency_s = {
+        call_type: hist["sum"] / hist["count"]
+        for (stage, call_type), hist in list(tracing.get_tracer().batch_histograms.items())
+        if stage == "api_call" and hist["count"]
+    }
+    for call_type, calls in run.write_call_costs(latency_s).items():
+        latency = f"{latency_s[call_type]:6.2f}s" if call_type in latency_s else "     –"
+        print(
+            f"   {call_type:<16} {calls['calls']:>5} calls  prompt {calls['prompt']:>9}  completion {calls['completion']:>7}  "
+            f"cached {calls['cached']:>8} ({calls['cache_hit_ratio']*100:5.1f} %, saved ${calls['cached_savings_usd']:.4f})  "
+            f"mean latency {latency}"
+        )
+    parse_stats = run.parse_stats
+    print(
+        f"🧾 Parse failures: pages {parse_stats['page_failures']} "
+        f"(retried {parse_stats['page_retries']}, repaired locally {parse_stats['page_repaired']}), "
+        f"synthesis {parse_stats['synthesis_failures']} (retried {parse_stats['synthesis_retries']})"
+    )
+    if PAGE_DEDUP:
+        hash_index = get_page_hash_index()
+        print(
+            f"♻️ Page dedup: {hash_index.stats['hits']}/{hash_index.stats['lookups']} appendix checks reused "
+            f"({hash_index.hit_rate()*100:.1f} %), ~{hash_index.stats['tokens_saved']} tokens saved"
+        )
+        hash_index.reset_stats()
+        # Saved once per batch rather than after every PDF
+        hash_index.save()
+    metrics_path = os.path.join(run.batch_dir, "metrics.prom")
+    tracing.get_tracer().write_prometheus(metrics_path, batch=True)
+    print(f"⏱️ Stage metrics: {metrics_path} (summary: python -m utils.tracing {os.path.join(run.batch_dir, 'trace.jsonl')})")
     print("=" * 80)
+    return run
 
 
 
+def register_batch(run: RunContext, batch_total_cost: float) -> None:
+    """
+    Records the batch's config, token/cost totals and latency in the run registry.
+    """
+    api_calls, api_s = 0, 0.0
+    for (stage, _), hist in list(tracing.get_tracer().batch_histograms.items()):
+        if stage == "api_call":
+            api_calls += hist["count"]
+            api_s += hist["sum"]
+
+    with RunRegistry(RUN_REGISTRY_PATH) as registry:
+        registry.record_batch(
+            run_id=run.batch_id,
+            model=MODEL_NAME,
+            extraction_strategy="multipage",
+            dpi=PAGE_DPI,
+            prompt_hashes={
+                "page_extraction": prompt_hash(PAGE_EXTRACTION_PROMPT),
+                "appendix_filter": prompt_hash(APPENDIX_FILTER_PROMPT),
+                "synthesis": prompt_hash(SYNTHESIS_PROMPT_PREFIX),
+                "schema": prompt_hash(json.dumps(SCHEMA.response_format, sort_keys=True)),
+                **({"shared_prefix": prompt_hash(PROMPT_PREFIX)} if PROMPT_PREFIX else {}),
+            },
+            config={
+                "structured_outputs": STRUCTURED_OUTPUTS,
+                "page_dedup": PAGE_DEDUP,
+                "page_hash_max_distance": PAGE_HASH_MAX_DISTANCE,
+                "shared_prompt_prefix": PROMPT_PREFIX is not None,
+                "field_confidence": FIELD_CONFIDENCE,
+                "transport": os.environ.get("EXTRACTION_TRANSPORT", "live"),
+            },
+            num_pdfs=run.num_pdfs,
+            pages=run.pages,
+            tokens=run.tokens,
+            cost_usd=batch_total_cost,
+            elapsed_s=run.elapsed_s(),
+            api_calls=api_calls,
+            api_s=api_s,
+        )
+
+
 def extract_specific_pdfs(pdf_ids: list[str], inspection_urls_path: str) -> None:
     """
     Re-runs extraction only for specific PDF IDs (regardless of existing files).
@@ -345,10 +687,12 @@ def extract_specific_pdfs(pdf_ids: list[str], inspection_urls_path: str) -> None
 
             url = row["url"]
             print(f"\nRe-extracting PDF ID: {pdf_id} with url: {url}")
-            model_output = extract_fields_from_pdf_multipage(pdf_id, url)
-
-            if model_output:
-                normalized_output = normalize_model_output(model_output)
-                save_evaluation_json(pdf_id, normalized_output)
-            else:
+            with span("pdf", pdf_id=pdf_id):
+                model_output = extract_fields_from_pdf_multipage(pdf_id, url)
+
+                if model_output:
+                    with span("save_evaluation", pdf_id=pdf_id):
+                        normalized_output = normalize_model_output(model_output)
+                        save_evaluation_json(pdf_id, normalized_output)
+            if not model_output:
                 print(f"❌ Extraction failed or was skipped for ID {pdf_id}")
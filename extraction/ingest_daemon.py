@@ -0,0 +1,362 @@
+"""
+extraction/ingest_daemon.py
+Continuous ingestion: watches data/inspection_urls.csv for appended rows and a drop
+directory for new PDF files, and extracts them as they arrive.
+
+    python -m extraction.ingest_daemon                        # follow the CSV and data/inbox
+    python -m extraction.ingest_daemon --once                 # one poll, flush, exit (e.g. from cron)
+    python -m extraction.ingest_daemon --backfill             # also take the rows already in the CSV
+    python -m extraction.ingest_daemon --batch-size 8 --max-wait 120 --workers 2
+
+The CSV is read from a persisted high-water mark (a byte offset in INGEST_STATE_PATH),
+so each poll only parses the rows appended since the last one. A rewritten or truncated
+file is read again from the start. Drop-directory PDFs use their file name as pdf_id
+and are moved to done/ (or failed/) once handled.
+
+New documents are deduplicated by pdf_id and by the SHA-1 of the PDF bytes (the same
+report under a new id is not extracted again), queued, and flushed as a micro-batch once
+--batch-size documents are waiting or the oldest has waited --max-wait seconds. Each
+micro-batch is its own run: per_pdf_costs folder, run registry row and trace.
+"""
+
+import argparse
+import csv
+import hashlib
+import io
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from extraction import extraction_script as es
+from utils.helpers import normalize_model_output
+from utils.tracing import span
+
+INSPECTION_URLS_PATH = os.path.join("data", "inspection_urls.csv")
+DROP_DIR = os.path.join("data", "inbox")
+INGEST_STATE_PATH = "data/logs/ingest_state.json"
+
+POLL_INTERVAL_S = 30
+BATCH_SIZE = 10
+MAX_WAIT_S = 300
+# Same trade-off as SERVICE_WORKERS in extraction/service.py: more workers only trade API rate limits for latency
+INGEST_WORKERS = 2
+# Failed downloads and errors are retried in later batches, after an exponential backoff
+# (5, 10, 20, 40, 80 minutes), so an outage of a couple of hours does not drop a document
+MAX_ATTEMPTS = 6
+RETRY_BACKOFF_S = 300
+RETRY_BACKOFF_MAX_S = 6 * 3600
+RETRY_STATUSES = ("download_failed", "error")
+SETTLE_S = 5  # drop-directory files younger than this may still be being written
+
+
+def load_state(path: str = INGEST_STATE_PATH) -> dict:
+    """
+    Persisted ingest state: the CSV high-water mark, every pdf_id seen with its status
+    and content hash, and the hashes already extracted.
+    """
+    state = {"csv": {}, "documents": {}, "hashes": {}}
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            state.update(json.load(f))
+    return state
+
+
+def save_state(state: dict, path: str = INGEST_STATE_PATH) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def read_new_rows(path: str, mark: dict) -> tuple[list[dict], dict]:
+    """
+    Rows ({"pdf_id", "url"}) appended to the CSV since mark ({"inode", "offset", "header"})
+    and the updated mark. Only complete lines are read; a row still being written is
+    picked up by the next poll.
+    """
+    if not os.path.exists(path):
+        return [], mark
+    stat = os.stat(path)
+    if mark.get("inode") != stat.st_ino or stat.st_size < mark.get("offset", 0):
+        if mark:
+            print(f"📄 {path} was replaced or truncated — reading it from the start (known ids are skipped).")
+        mark = {"inode": stat.st_ino, "offset": 0, "header": None}
+    if stat.st_size == mark["offset"]:
+        return [], mark
+
+    with open(path, "rb") as f:
+        f.seek(mark["offset"])
+        chunk = f.read(stat.st_size - mark["offset"])
+    end = chunk.rfind(b"\n") + 1
+    if end == 0:
+        return [], mark
+
+    mark = dict(mark)
+    rows, offset = [], mark["offset"]
+    for line in io.BytesIO(chunk[:end]):
+        offset += len(line)
+        values = next(csv.reader([line.decode("utf-8-sig")]), [])
+        if not values:
+            continue
+        if mark["header"] is None:
+            mark["header"] = values
+            continue
+        # The header repeats "documentType", so look the two columns up by name instead of DictReader
+        header = mark["header"]
+        if len(values) < len(header):
+            continue
+        rows.append({"pdf_id": values[header.index("id")], "url": values[header.index("url")]})
+    mark["offset"] = offset
+    return rows, mark
+
+
+def scan_drop_dir(drop_dir: str, settle_s: float = SETTLE_S) -> list[dict]:
+    """
+    PDF files in drop_dir that have not changed for settle_s seconds.
+    """
+    if not os.path.isdir(drop_dir):
+        return []
+    now = time.time()
+    files = []
+    for entry in sorted(os.scandir(drop_dir), key=lambda e: e.name):
+        if entry.is_file() and entry.name.lower().endswith(".pdf") and now - entry.stat().st_mtime >= settle_s:
+            files.append({"pdf_id": os.path.splitext(entry.name)[0], "path": entry.path})
+    return files
+
+
+def _move(path: str, folder: str) -> None:
+    target_dir = os.path.join(os.path.dirname(path), folder)
+    os.makedirs(target_dir, exist_ok=True)
+    shutil.move(path, os.path.join(target_dir, os.path.basename(path)))
+
+
+class IngestDaemon:
+    """
+    Queue of new documents, flushed as micro-batches through a bounded worker pool.
+    The CSV high-water mark is only advanced past rows whose batch has finished, so a
+    crash re-reads (and id-dedupes) at most the rows that were still queued.
+    """
+
+    def __init__(self, csv_path: str = INSPECTION_URLS_PATH, drop_dir: str | None = DROP_DIR,
+                 state_path: str = INGEST_STATE_PATH, batch_size: int = BATCH_SIZE,
+                 max_wait_s: float = MAX_WAIT_S, workers: int = INGEST_WORKERS, backfill: bool = False):
+        self.csv_path = csv_path
+        self.drop_dir = drop_dir
+        self.state_path = state_path
+        self.batch_size = batch_size
+        self.max_wait_s = max_wait_s
+        self.workers = workers
+        self.state = load_state(state_path)
+        self.read_mark = dict(self.state["csv"])
+        self.pending = []
+        self.queued_ids = set()
+        self.processing = set()  # pdf_ids of the batch being flushed
+        self.oldest = None
+        self._lock = threading.Lock()
+
+        if not self.state["csv"] and not backfill and os.path.exists(csv_path):
+            # First start: the rows already in the CSV are the backlog, not new documents
+            rows, self.read_mark = read_new_rows(csv_path, {})
+            self.state["csv"] = dict(self.read_mark)
+            save_state(self.state, self.state_path)
+            print(f"📍 High-water mark set at the end of {csv_path} ({len(rows)} existing rows; --backfill to extract them)")
+
+    def is_known(self, pdf_id: str) -> bool:
+        """
+        Whether pdf_id is queued, already ingested (or out of retries), waiting for its next
+        retry, or was extracted outside the daemon (it has an evaluation file).
+        """
+        if pdf_id in self.queued_ids:
+            return True
+        document = self.state["documents"].get(pdf_id)
+        if document is None:
+            return os.path.exists(os.path.join("data/evaluation", f"{pdf_id}.json"))
+        if document["status"] in RETRY_STATUSES and document["attempts"] < MAX_ATTEMPTS:
+            return time.time() < document.get("next_attempt_at", 0)
+        return True
+
+    def enqueue(self, item: dict) -> None:
+        self.pending.append(item)
+        self.queued_ids.add(item["pdf_id"])
+        if self.oldest is None:
+            self.oldest = time.monotonic()
+
+    def poll(self) -> int:
+        """
+        Reads new CSV rows and drop-directory files into the queue. Returns how many were queued.
+        """
+        queued = 0
+        rows, self.read_mark = read_new_rows(self.csv_path, self.read_mark)
+        for row in rows:
+            if self.is_known(row["pdf_id"]):
+                continue
+            self.enqueue({"pdf_id": row["pdf_id"], "url": row["url"]})
+            queued += 1
+        if not self.pending:
+            # Nothing in flight, so every row read so far is handled
+            self.state["csv"] = dict(self.read_mark)
+
+        # Their rows are behind the high-water mark, so failed downloads are retried from the state
+        for pdf_id, document in self.state["documents"].items():
+            if "url" in document and not self.is_known(pdf_id):
+                self.enqueue({"pdf_id": pdf_id, "url": document["url"]})
+                queued += 1
+
+        for file in scan_drop_dir(self.drop_dir) if self.drop_dir else []:
+            if file["pdf_id"] in self.queued_ids:
+                continue
+            if self.is_known(file["pdf_id"]):
+                print(f"Already ingested: {file['pdf_id']} — moving {file['path']} to done/.")
+                _move(file["path"], "done")
+                continue
+            self.enqueue({"pdf_id": file["pdf_id"], "path": file["path"]})
+            queued += 1
+        return queued
+
+    def due(self) -> bool:
+        if not self.pending:
+            return False
+        return len(self.pending) >= self.batch_size or time.monotonic() - self.oldest >= self.max_wait_s
+
+    def _claim(self, pdf_id: str, digest: str) -> str | None:
+        # The pdf_id extracted (or being extracted in this batch) from the same bytes, or None after
+        # claiming the hash for pdf_id. A claim whose extraction failed does not make a duplicate.
+        with self._lock:
+            owner = self.state["hashes"].get(digest)
+            if owner is not None and owner != pdf_id and (
+                owner in self.processing or self.state["documents"].get(owner, {}).get("status") == "extracted"
+            ):
+                return owner
+            self.state["hashes"][digest] = pdf_id
+            return None
+
+    def _process(self, item: dict) -> dict:
+        pdf_id = item["pdf_id"]
+        document = {"attempts": self.state["documents"].get(pdf_id, {}).get("attempts", 0) + 1}
+        if "path" in item:
+            with open(item["path"], "rb") as f:
+                pdf_bytes = f.read()
+            source = item["path"]
+        else:
+            pdf_bytes = es.download_pdf(pdf_id, item["url"])
+            source = item["url"]
+            if pdf_bytes is None:
+                return {**document, "status": "download_failed"}
+
+        digest = hashlib.sha1(pdf_bytes).hexdigest()
+        document["sha1"] = digest
+        owner = self._claim(pdf_id, digest)
+        if owner is not None:
+            print(f"♻️ PDF {pdf_id} has the same content as {owner} — not extracted again.")
+            return {**document, "status": "duplicate", "duplicate_of": owner}
+
+        print(f"\nExtracting fields from PDF ID: {pdf_id} ({source})")
+        with span("pdf", pdf_id=pdf_id):
+            model_output = es.extract_fields_from_pdf_bytes(pdf_id, pdf_bytes)
+            if model_output:
+                with span("save_evaluation", pdf_id=pdf_id):
+                    es.save_evaluation_json(pdf_id, normalize_model_output(model_output))
+        if not model_output:
+            print(f"Extraction failed or empty for ID {pdf_id}")
+            return {**document, "status": "empty"}
+        return {**document, "status": "extracted"}
+
+    def flush(self) -> dict:
+        """
+        Extracts the queued documents as one batch and persists the outcome and the new
+        high-water mark. Returns {status: count}.
+        """
+        batch, self.pending, self.oldest = self.pending, [], None
+        print(f"\n📥 Micro-batch of {len(batch)} new document(s), {self.workers} worker(s)")
+        es.start_run()
+        self.processing = {item["pdf_id"] for item in batch}
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ingest") as executor:
+            results = list(executor.map(self._safe_process, batch))
+        self.processing = set()
+        es.finish_batch()
+
+        counts = {}
+        now = time.strftime("%Y-%m-%dT%H:%M:%S")
+        outcomes = {item["pdf_id"]: document["status"] for item, document in zip(batch, results)}
+        for item, document in zip(batch, results):
+            owner = document.get("duplicate_of")
+            if owner in outcomes and outcomes[owner] != "extracted":
+                # Its twin in this batch failed, so this copy is retried rather than left without output
+                document = {"attempts": document["attempts"], "sha1": document["sha1"], "status": "error",
+                            "error": f"duplicate of {owner}, which was not extracted"}
+            if document["status"] in RETRY_STATUSES:
+                if "url" in item:
+                    document["url"] = item["url"]
+                backoff = min(RETRY_BACKOFF_S * 2 ** (document["attempts"] - 1), RETRY_BACKOFF_MAX_S)
+                document["next_attempt_at"] = round(time.time() + backoff)
+            self.state["documents"][item["pdf_id"]] = {**document, "ingested_at": now}
+            self.queued_ids.discard(item["pdf_id"])
+            counts[document["status"]] = counts.get(document["status"], 0) + 1
+            if "path" in item:
+                _move(item["path"], "done" if document["status"] in ("extracted", "duplicate") else "failed")
+        if not self.pending:
+            self.state["csv"] = dict(self.read_mark)
+        save_state(self.state, self.state_path)
+        print(f"📥 Micro-batch done: {', '.join(f'{n} {status}' for status, n in sorted(counts.items()))}")
+        return counts
+
+    def _safe_process(self, item: dict) -> dict:
+        try:
+            return self._process(item)
+        except Exception as error:
+            print(f"❌ Ingesting {item['pdf_id']} failed: {error}")
+            return {"attempts": self.state["documents"].get(item["pdf_id"], {}).get("attempts", 0) + 1,
+                    "status": "error", "error": str(error)}
+
+    def run(self, interval_s: float = POLL_INTERVAL_S, once: bool = False) -> None:
+        """
+        Polls every interval_s seconds and flushes due micro-batches; with once, polls a
+        single time and flushes whatever was found.
+        """
+        print(f"👀 Watching {self.csv_path} (from byte {self.read_mark.get('offset', 0)})"
+              f"{f' and {self.drop_dir}/' if self.drop_dir else ''} — batches of {self.batch_size} "
+              f"or every {self.max_wait_s:.0f}s")
+        while True:
+            queued = self.poll()
+            if queued:
+                print(f"📨 {queued} new document(s) queued ({len(self.pending)} waiting)")
+            if once:
+                if self.pending:
+                    self.flush()
+                else:
+                    save_state(self.state, self.state_path)
+                return
+            while self.due():
+                self.flush()
+            time.sleep(interval_s)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract new inspection URLs and dropped PDFs as they arrive")
+    parser.add_argument("--csv", default=INSPECTION_URLS_PATH, help="CSV to follow (ids and URLs)")
+    parser.add_argument("--drop-dir", default=DROP_DIR, help="Directory watched for PDF files ('' to disable)")
+    parser.add_argument("--state", default=INGEST_STATE_PATH, help="High-water mark and ingested ids")
+    parser.add_argument("--interval", type=float, default=POLL_INTERVAL_S, help="Seconds between polls")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Flush once this many documents wait")
+    parser.add_argument("--max-wait", type=float, default=MAX_WAIT_S, help="Flush once the oldest has waited this long (s)")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS, help="Concurrent extractions per batch")
+    parser.add_argument("--backfill", action="store_true", help="On first start, also extract the rows already in the CSV")
+    parser.add_argument("--once", action="store_true", help="Poll once, flush and exit")
+    args = parser.parse_args()
+
+    daemon = IngestDaemon(args.csv, args.drop_dir or None, args.state, args.batch_size,
+                          args.max_wait, args.workers, args.backfill)
+    try:
+        daemon.run(args.interval, args.once)
+    except KeyboardInterrupt:
+        # Queued documents are not lost: the high-water mark is still before their rows
+        print(f"\n🛑 Stopped with {len(daemon.pending)} document(s) queued.")
+        save_state(daemon.state, daemon.state_path)
+
+
+if __name__ == "__main__":
+    main()
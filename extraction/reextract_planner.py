@@ -0,0 +1,257 @@
+"""
+extraction/reextract_planner.py
+Plans selective re-extraction from the result store. For the latest extraction of every
+PDF, a field is flagged when
+
+  - low confidence:  its final value, or its value on some page, has a logprob confidence
+                     (utils/confidence.py) below the threshold (evaluated fields only),
+  - page conflict:   the pages disagree: two different non-false values of a scalar field,
+                     or a boolean whose final value no page supports,
+  - past error:      the evaluation found the final value wrong (annotated PDFs only).
+
+Only the pages that can change a flagged field are re-extracted: the pages where it has low
+confidence and, if the final value is uncertain, conflicting or wrong, every page where it has
+a non-false value; unparsable pages always. A field that is wrong and false on every page
+cannot be localized, so its whole document is re-extracted.
+
+    python -m extraction.reextract_planner                          # print the plan
+    python -m extraction.reextract_planner --threshold 0.9 --out data/logs/reextract_plan.json
+    python -m extraction.reextract_planner --execute --max-docs 10  # re-extract the top 10 documents
+"""
+
+import argparse
+import csv
+import json
+import os
+
+from schema.compiled import SCHEMA
+from utils.confidence import evaluated_paths
+from utils.result_store import LATEST_RUN, STORE_PATH, open_readonly
+
+CONFIDENCE_THRESHOLD = 0.8
+PAGE_LOGS_DIR = os.path.join("data", "page_logs")
+INSPECTION_URLS_PATH = os.path.join("data", "inspection_urls.csv")
+
+# Free text differs between pages by nature and its confidence is that of its least likely
+# token, so only evaluated fields are checked for conflicts and low confidence
+CONFLICT_FIELDS = evaluated_paths()
+
+
+def field_value(output: dict, path: str):
+    """
+    Value of a field path ("MoistureDamage.mentions_roof") in a page result or model output.
+    """
+    name, _, key = path.partition(".")
+    value = output.get(name)
+    if key:
+        return value.get(key) if isinstance(value, dict) else None
+    return value
+
+
+def _found(value) -> bool:
+    # The prompts use false (or null) for "not present"
+    return value not in (None, False, "")
+
+
+def _comparable(value):
+    return value.strip().lower() if isinstance(value, str) else value
+
+
+def page_conflicts(output: dict, page_results: list) -> set[str]:
+    """
+    Evaluated fields whose page-level values disagree with each other or with the final value.
+    """
+    pages = [result for result in page_results if "error" not in result]
+    conflicts = set()
+    for path in CONFLICT_FIELDS:
+        final = field_value(output, path)
+        found = {_comparable(v) for v in (field_value(result, path) for result in pages) if _found(v)}
+        if final is True or final is False:
+            if final != (True in found):
+                conflicts.add(path)
+        elif len(found) > 1:
+            conflicts.add(path)
+    return conflicts
+
+
+def evaluation_errors(sample: dict) -> set[str]:
+    """
+    Evaluated fields where the model output differs from the ground truth. Documents
+    still holding the default all-false ground truth are not annotated and give no errors.
+    """
+    from evaluation.evaluate_outputs import flatten_sample
+
+    if sample["ground_truth"] == SCHEMA.default_ground_truth():
+        return set()
+    return {field for _, field, _, pred, actual in flatten_sample(sample) if pred != actual}
+
+
+def read_page_results(store, run_id: str, pdf_id: str) -> list:
+    """
+    Page-level results of an extraction from the store, else from data/page_logs.
+    """
+    page_results = store.read_pages(run_id, pdf_id)
+    if page_results:
+        return page_results
+    path = os.path.join(PAGE_LOGS_DIR, f"{pdf_id}_pages.json")
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    return []
+
+
+def plan_document(sample: dict, page_results: list, document_confidence: dict,
+                  page_confidences: dict[int, dict], threshold: float = CONFIDENCE_THRESHOLD) -> dict:
+    """
+    Flagged fields (with their reasons) and the pages to re-extract for one document.
+    """
+    output = sample["model_output"]
+    reasons, low_pages = {}, {}
+    for path in CONFLICT_FIELDS:
+        low_pages[path] = {i for i, conf in page_confidences.items() if conf.get(path, 1.0) < threshold}
+        final = document_confidence.get(path)
+        if low_pages[path] or (final is not None and final < threshold):
+            reasons.setdefault(path, []).append("low confidence")
+    for path in page_conflicts(output, page_results):
+        reasons.setdefault(path, []).append("page conflict")
+    errors = evaluation_errors(sample)
+    for path in errors:
+        reasons.setdefault(path, []).append("past error")
+
+    pages = {i for i, result in enumerate(page_results) if "error" in result}
+    whole_document = False
+    for path in reasons:
+        candidates = set(low_pages.get(path, ()))
+        final = document_confidence.get(path)
+        # An uncertain, conflicting or wrong final value is re-read from every page that reports the field
+        if path in errors or "page conflict" in reasons[path] or (final is not None and final < threshold):
+            candidates |= {i for i, result in enumerate(page_results) if _found(field_value(result, path))}
+        if not candidates and path in errors:
+            whole_document = True
+        pages |= candidates
+    if whole_document:
+        pages = set(range(len(page_results)))
+
+    return {
+        "pdf_id": sample["pdf_id"],
+        "fields": {path: reasons[path] for path in sorted(reasons)},
+        "pages": sorted(pages),
+        "num_pages": len(page_results),
+    }
+
+
+def build_plan(store, threshold: float = CONFIDENCE_THRESHOLD) -> dict:
+    """
+    Re-extraction plan over the latest extraction of every PDF in the store: the documents
+    with pages to re-extract, most flagged fields first, and the page-call totals.
+    """
+    runs = store.latest_runs()
+    documents, total_pages = [], 0
+    for sample in store.load_samples(LATEST_RUN):
+        run_id = runs[sample["pdf_id"]]
+        page_results = read_page_results(store, run_id, sample["pdf_id"])
+        document_confidence, page_confidences, score = store.read_confidences(run_id, sample["pdf_id"])
+        total_pages += len(page_results)
+
+        document = plan_document(sample, page_results, document_confidence, page_confidences, threshold)
+        if document["pages"]:
+            documents.append({**document, "run_id": run_id, "confidence": score})
+
+    documents.sort(key=lambda d: (-len(d["fields"]), d["confidence"] if d["confidence"] is not None else 1.0, d["pdf_id"]))
+    planned_pages = sum(len(d["pages"]) for d in documents)
+    return {
+        "threshold": threshold,
+        "documents": documents,
+        "total_documents": len(runs),
+        "total_pages": total_pages,
+        "planned_pages": planned_pages,
+    }
+
+
+def print_plan(plan: dict, limit: int = 20):
+    print(f"🔁 Re-extraction plan (confidence threshold {plan['threshold']})")
+    for document in plan["documents"][:limit]:
+        reasons = sorted({reason for field_reasons in document["fields"].values() for reason in field_reasons})
+        score = f"{document['confidence']:.3f}" if document["confidence"] is not None else "  –  "
+        print(
+            f"   {document['pdf_id']:<12} confidence {score}  {len(document['fields']):>2} fields ({', '.join(reasons)})  "
+            f"pages {len(document['pages'])}/{document['num_pages']}: {[i+1 for i in document['pages']]}"
+        )
+    if len(plan["documents"]) > limit:
+        print(f"   … {len(plan['documents']) - limit} more documents")
+    total = plan["total_pages"]
+    share = plan["planned_pages"] / total * 100 if total else 0.0
+    print(
+        f"📄 {len(plan['documents'])}/{plan['total_documents']} documents, {plan['planned_pages']}/{total} page calls "
+        f"({share:.1f} % of a full re-extraction pass)"
+    )
+
+
+def load_urls(inspection_urls_path: str = INSPECTION_URLS_PATH) -> dict:
+    with open(inspection_urls_path, mode="r", encoding="utf-8-sig") as csvfile:
+        return {row["id"]: row["url"] for row in csv.DictReader(csvfile)}
+
+
+def execute_plan(plan: dict, store, max_docs: int | None = None,
+                 inspection_urls_path: str = INSPECTION_URLS_PATH):
+    """
+    Re-extracts the planned pages of the first max_docs documents as one batch and saves
+    their new outputs like a regular extraction. Returns the finished run.
+    """
+    from extraction import extraction_script as es
+    from utils.helpers import normalize_model_output
+    from utils.tracing import span
+
+    urls = load_urls(inspection_urls_path)
+    for document in plan["documents"][:max_docs]:
+        pdf_id = document["pdf_id"]
+        if pdf_id not in urls:
+            print(f"No URL for PDF {pdf_id} in {inspection_urls_path} — skipping.")
+            continue
+        page_results = read_page_results(store, document["run_id"], pdf_id)
+        _, page_confidences, _ = store.read_confidences(document["run_id"], pdf_id)
+
+        print(f"\nRe-extracting PDF ID: {pdf_id} ({', '.join(document['fields'])})")
+        with span("pdf", pdf_id=pdf_id):
+            model_output = es.reextract_pages(pdf_id, urls[pdf_id], document["pages"], page_results, page_confidences)
+            if model_output:
+                with span("save_evaluation", pdf_id=pdf_id):
+                    es.save_evaluation_json(pdf_id, normalize_model_output(model_output))
+        if not model_output:
+            print(f"❌ Re-extraction failed for ID {pdf_id}")
+    return es.finish_batch()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Plan (and run) selective page re-extraction")
+    parser.add_argument("--db", default=STORE_PATH)
+    parser.add_argument("--threshold", type=float, default=CONFIDENCE_THRESHOLD,
+                        help="Fields with a confidence below this are re-extracted")
+    parser.add_argument("--out", help="Write the plan as JSON")
+    parser.add_argument("--execute", action="store_true", help="Re-extract the planned pages")
+    parser.add_argument("--max-docs", type=int, help="Only plan/execute the first N documents")
+    parser.add_argument("--csv", default=INSPECTION_URLS_PATH, help="PDF ids and URLs")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        parser.error(f"{args.db} not found (build it with: python -m cli index import)")
+
+    with open_readonly(args.db) as store:
+        plan = build_plan(store, args.threshold)
+        if args.max_docs is not None:
+            plan["documents"] = plan["documents"][:args.max_docs]
+            plan["planned_pages"] = sum(len(d["pages"]) for d in plan["documents"])
+        print_plan(plan)
+
+        if args.out:
+            os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+            with open(args.out, "w", encoding="utf-8") as f:
+                json.dump(plan, f, indent=2, ensure_ascii=False)
+            print(f"📝 Plan written to {args.out}")
+
+        if args.execute:
+            execute_plan(plan, store, inspection_urls_path=args.csv)
+
+
+if __name__ == "__main__":
+    main()
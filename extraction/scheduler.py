@@ -0,0 +1,271 @@
+"""
+extraction/scheduler.py
+Budget-aware batch runs: estimate what each PDF will cost before extracting it,
+order the candidates and skip those that would push a batch past a dollar or
+wall-clock budget.
+"""
+
+import csv
+import json
+import os
+import time
+import requests
+from extraction import extraction_script as es
+from utils.cost_estimator import CostEstimator
+from utils.result_store import STORE_PATH, open_readonly
+from utils.helpers import (
+    APPENDIX_FILTER_PROMPT,
+    SYNTHESIS_PROMPT_PREFIX,
+    get_page_texts_from_pdf,
+    is_text_page,
+    load_image_pdf_ids,
+)
+
+PROBE_CACHE_PATH = "data/logs/pdf_probe_cache.json"
+RENDER_DPI = 200
+
+# Starting guess for wall time per page; replaced by the running average once PDFs finish
+DEFAULT_SECONDS_PER_PAGE = 8.0
+
+
+def build_estimator(model: str = es.MODEL_NAME) -> CostEstimator:
+    """
+    Cost estimator for the current prompts, calibrated on data/logs/per_pdf_costs.
+    """
+    estimator = CostEstimator(model, APPENDIX_FILTER_PROMPT, es.PAGE_EXTRACTION_PROMPT, SYNTHESIS_PROMPT_PREFIX)
+    return estimator.calibrate()
+
+
+def probe_pdf(url: str) -> dict | None:
+    """
+    Downloads a PDF and reads what the estimator needs: page count, page size at
+    RENDER_DPI and the text-layer length of pages that will be sent as text.
+    """
+    try:
+        response = requests.get(url, timeout=30)
+        response.raise_for_status()
+        page_texts = get_page_texts_from_pdf(response.content)
+    except Exception as error:
+        print(f"Could not probe PDF: {error}")
+        return None
+
+    import fitz
+
+    with fitz.open("pdf", stream=response.content) as doc:
+        rect = doc[0].rect if len(doc) else None
+
+    page_size = (
+        (round(rect.width / 72 * RENDER_DPI), round(rect.height / 72 * RENDER_DPI)) if rect else None
+    )
+    return {
+        "num_pages": len(page_texts),
+        "page_size": page_size,
+        "text_page_chars": {str(i): len(t) for i, t in enumerate(page_texts) if is_text_page(t)},
+    }
+
+
+def load_probe_cache(path: str = PROBE_CACHE_PATH) -> dict:
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+
+def save_probe_cache(cache: dict, path: str = PROBE_CACHE_PATH) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(cache, f)
+
+
+def default_pdf_value(pdf_id: str, store=None, runs: dict | None = None) -> float:
+    """
+    Expected gain of extracting a PDF, for ordering by value: 1.0 for PDFs without an
+    evaluation file yet. For re-extractions, the share of evaluated fields the last
+    evaluation got wrong (annotated PDFs), else how unsure the model was about its
+    output (1 - the document confidence in the result store), else 0.0.
+    """
+    from extraction.reextract_planner import evaluation_errors
+    from schema.compiled import SCHEMA
+
+    path = os.path.join("data/evaluation", f"{pdf_id}.json")
+    if not os.path.exists(path):
+        return 1.0
+    with open(path, encoding="utf-8") as f:
+        sample = json.load(f)
+    if sample.get("ground_truth") and sample["ground_truth"] != SCHEMA.default_ground_truth():
+        return len(evaluation_errors(sample)) / len(SCHEMA.field_paths)
+    if store is not None and runs and pdf_id in runs:
+        _, _, score = store.read_confidences(runs[pdf_id], pdf_id)
+        if score is not None:
+            return 1.0 - score
+    return 0.0
+
+
+def plan_batch(inspection_urls_path: str, estimator: CostEstimator, max_candidates: int,
+               order: str = "cheapest", value_fn=None, skip: bool = True,
+               reextract_already_extracted_only: bool = False) -> list[dict]:
+    """
+    Probes up to max_candidates PDFs (cached in PROBE_CACHE_PATH), estimates each one
+    and returns them in run order: "cheapest" first, or highest "value" first
+    (ties broken by estimated cost; default_pdf_value unless value_fn is given).
+
+    Value order ranks re-extractions, so it needs skip=False: with skip every candidate
+    is a new PDF and they are all worth the same.
+    """
+    if order not in ("cheapest", "value"):
+        raise ValueError(f"Unknown order '{order}' (expected 'cheapest' or 'value')")
+    if order == "value" and skip:
+        raise ValueError("order='value' ranks already extracted PDFs against new ones; pass skip=False")
+
+    store = runs = None
+    if value_fn is None:
+        if order == "value" and os.path.exists(STORE_PATH):
+            store = open_readonly(STORE_PATH)
+            runs = store.latest_runs()
+        value_fn = lambda pdf_id: default_pdf_value(pdf_id, store, runs)
+
+    image_pdf_ids = load_image_pdf_ids() if reextract_already_extracted_only else set()
+    probe_cache = load_probe_cache()
+    candidates = []
+
+    with open(inspection_urls_path, mode="r", encoding="utf-8-sig") as csvfile:
+        for row in csv.DictReader(csvfile):
+            if len(candidates) >= max_candidates:
+                break
+
+            pdf_id, url = row["id"], row["url"]
+            if image_pdf_ids and pdf_id not in image_pdf_ids:
+                continue
+            if skip and os.path.exists(os.path.join("data/evaluation", f"{pdf_id}.json")):
+                continue
+            if any(c["pdf_id"] == pdf_id for c in candidates):
+                continue
+
+            if pdf_id not in probe_cache:
+                print(f"🔎 Probing PDF {pdf_id}...")
+                probe_cache[pdf_id] = probe_pdf(url)
+            probe = probe_cache[pdf_id]
+            if not probe or probe["num_pages"] < 4:
+                continue
+
+            estimate = estimator.estimate(
+                probe["num_pages"],
+                page_size=tuple(probe["page_size"]),
+                text_page_chars={int(i): n for i, n in probe["text_page_chars"].items()},
+            )
+            candidates.append({
+                "pdf_id": pdf_id,
+                "url": url,
+                "num_pages": probe["num_pages"],
+                "estimate": estimate,
+                "value": value_fn(pdf_id),
+            })
+
+    save_probe_cache(probe_cache)
+    if store is not None:
+        store.close()
+
+    if order == "cheapest":
+        candidates.sort(key=lambda c: c["estimate"]["cost_usd"])
+    else:
+        candidates.sort(key=lambda c: (-c["value"], c["estimate"]["cost_usd"]))
+    return candidates
+
+
+def run_budgeted_batch(inspection_urls_path: str, budget_usd: float | None = None,
+                       time_budget_s: float | None = None, order: str = "cheapest",
+                       max_candidates: int = 50, skip: bool = True,
+                       reextract_already_extracted_only: bool = False,
+                       safety_margin: float = 1.1) -> list[dict]:
+    """
+    Runs extraction over the planned candidates in order, skipping every PDF whose
+    estimate (times safety_margin) would push actual spend past budget_usd, or whose
+    expected duration would pass time_budget_s. Logs estimated vs actual cost per PDF
+    next to the batch's per_pdf_costs.csv and returns those rows.
+    """
+    estimator = build_estimator()
+    print(
+        f"📐 Cost estimator calibrated on {estimator.calibration_rows} historical page-by-page PDFs "
+        f"(prompt x{estimator.prompt_factor:.2f}, completion x{estimator.completion_factor:.2f}; "
+        f"image pages only, text pages use the same factors)"
+    )
+    candidates = plan_batch(
+        inspection_urls_path, estimator, max_candidates, order,
+        skip=skip, reextract_already_extracted_only=reextract_already_extracted_only,
+    )
+
+    spent_usd = 0.0
+    seconds_per_page = DEFAULT_SECONDS_PER_PAGE
+    pages_done = seconds_done = 0.0
+    start = time.monotonic()
+    report = []
+
+    for candidate in candidates:
+        pdf_id = candidate["pdf_id"]
+        estimated_cost = candidate["estimate"]["cost_usd"]
+
+        # Skip rather than stop: in value order a cheaper PDF further down may still fit
+        if budget_usd is not None and spent_usd + estimated_cost * safety_margin > budget_usd:
+            print(f"⏭️ Skipping PDF {pdf_id} (~${estimated_cost:.4f}): it would exceed the ${budget_usd:.2f} budget.")
+            continue
+        elapsed = time.monotonic() - start
+        expected_seconds = candidate["num_pages"] * seconds_per_page
+        if time_budget_s is not None and elapsed + expected_seconds * safety_margin > time_budget_s:
+            print(f"⏭️ Skipping PDF {pdf_id} (~{expected_seconds:.0f}s): it would exceed the {time_budget_s:.0f}s time budget.")
+            continue
+
+        # Spend of the run before and after, so failed or skipped PDFs count what they used too
+        run = es.get_run_context()
+        cost_before, prompt_before = run.cost(), run.tokens["prompt"]
+        pdf_start = time.monotonic()
+        es.process_single_pdf(pdf_id, candidate["url"], skip=False)
+        pdf_seconds = time.monotonic() - pdf_start
+
+        actual_cost = run.cost() - cost_before
+        spent_usd += actual_cost
+        pages_done += candidate["num_pages"]
+        seconds_done += pdf_seconds
+        seconds_per_page = seconds_done / pages_done
+
+        report.append({
+            "pdf_id": pdf_id,
+            "num_pages": candidate["num_pages"],
+            "estimated_prompt_tokens": candidate["estimate"]["prompt"],
+            "actual_prompt_tokens": run.tokens["prompt"] - prompt_before,
+            "estimated_cost_usd": round(estimated_cost, 6),
+            "actual_cost_usd": round(actual_cost, 6),
+            "seconds": round(pdf_seconds, 1),
+        })
+
+    run = es.finish_batch()
+    log_estimates(report, os.path.join(run.batch_dir, "estimated_vs_actual.csv"))
+
+    estimated_total = sum(r["estimated_cost_usd"] for r in report)
+    actual_total = sum(r["actual_cost_usd"] for r in report)
+    print(f"📐 Estimated vs actual: ${estimated_total:.4f} est. / ${actual_total:.4f} actual over {len(report)} PDFs")
+    if budget_usd is not None:
+        print(f"💵 Budget used: ${actual_total:.4f} of ${budget_usd:.2f}")
+    return report
+
+
+def log_estimates(rows: list[dict], csv_path: str) -> None:
+    """
+    Writes the estimated vs actual cost rows of a budgeted batch.
+    """
+    if not rows:
+        return
+    os.makedirs(os.path.dirname(csv_path), exist_ok=True)
+    with open(csv_path, mode="w", newline="", encoding="utf-8") as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    print("💵 Running budgeted batch extraction...")
+    run_budgeted_batch(
+        os.path.join("data", "inspection_urls.csv"),
+        budget_usd=2.00,
+        order="cheapest",
+        max_candidates=50,
+    )
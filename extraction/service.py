@@ -0,0 +1,334 @@
+"""
+extraction/service.py
+Long-running local HTTP service around the extraction pipeline. A warm process keeps
+the OpenAI client, the pooled download session, the page hash index and the result
+store open between requests.
+
+    python -m extraction.service --port 8080
+
+    POST /extract            {"pdf_id": "3626545"}                  URL looked up in inspection_urls.csv
+                             {"url": "https://...", "pdf_id": "..."} pdf_id optional
+                             {"pdf_id": "...", "refresh": true}     ignore cached results
+    POST /extract?pdf_id=... raw PDF body (Content-Type: application/pdf), pdf_id optional
+    GET  /metrics            queue depth, in-flight requests, request counts and latencies (Prometheus)
+    GET  /health
+
+Identical requests that arrive while one is being extracted wait for that extraction
+instead of starting their own, and repeats are answered from the in-process LRU cache
+or, across restarts, from the result store. A url that differs from the one the CSV
+lists for the pdf_id is rejected (409) rather than mixed up with that document, and so
+is an upload whose pdf_id names a listed document or another document's output.
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from extraction import extraction_script as es
+from utils.helpers import normalize_model_output
+from utils.tracing import span
+
+INSPECTION_URLS_PATH = os.path.join("data", "inspection_urls.csv")
+EVALUATION_FOLDER = os.path.join("data", "evaluation")
+# Token and cost accounting is per run and thread-safe (utils/run_context.py), so more workers
+# only trade API rate limits for latency; one at a time stays the default
+SERVICE_WORKERS = 1
+REQUEST_TIMEOUT_S = 1800
+CACHE_SIZE = 512  # results kept in memory, least recently used evicted first
+MAX_UPLOAD_BYTES = 200 * 1024 * 1024
+
+
+class ExtractionFailed(Exception):
+    pass
+
+
+class ConflictingUrl(Exception):
+    pass
+
+
+class ConflictingUpload(Exception):
+    pass
+
+
+def load_inspection_urls(path: str = INSPECTION_URLS_PATH) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path, mode="r", encoding="utf-8-sig") as csvfile:
+        return {row["id"]: row["url"] for row in csv.DictReader(csvfile)}
+
+
+class ExtractionService:
+    """
+    Queue of extractions with in-flight coalescing and an LRU result cache.
+    Requests are keyed by pdf_id and the URL it is extracted from, or by content hash for uploads.
+    """
+
+    def __init__(self, workers: int = SERVICE_WORKERS, urls_path: str = INSPECTION_URLS_PATH,
+                 cache_size: int = CACHE_SIZE):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="extract")
+        self.urls = load_inspection_urls(urls_path)
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.inflight = {}
+        self.uploads = {}  # caller-supplied upload pdf_id -> sha1 of the body it was claimed with
+        self.queued = 0
+        self.running = 0
+        self.requests = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def resolve(self, pdf_id: str | None, url: str | None) -> tuple[str, str, str]:
+        """
+        (key, pdf_id, url) of a JSON request. A pdf_id from inspection_urls.csv is only ever
+        extracted from its own URL: a different url raises ConflictingUrl instead of answering
+        with, or overwriting, the other document's output.
+        """
+        known_url = self.urls.get(str(pdf_id)) if pdf_id is not None else None
+        if known_url is not None and url is not None and url != known_url:
+            raise ConflictingUrl(f"pdf_id {pdf_id} is {known_url} in {INSPECTION_URLS_PATH}, not {url}")
+        url = url or known_url
+        url_hash = hashlib.sha1(url.encode("utf-8")).hexdigest()[:12]
+        pdf_id = str(pdf_id) if pdf_id is not None else f"url_{url_hash}"
+        return f"id:{pdf_id}:url:{url_hash}", pdf_id, url
+
+    def resolve_upload(self, pdf_id: str | None, digest: str) -> tuple[str, str]:
+        """
+        (key, pdf_id) of an uploaded PDF. Without a pdf_id it is named after the content hash.
+        A caller-supplied pdf_id is claimed for one body: it raises ConflictingUpload if it is
+        listed in inspection_urls.csv, was uploaded with a different body, or already has an
+        evaluation file this service did not write, so an upload cannot overwrite another
+        document's output and store history.
+        """
+        if pdf_id is None:
+            pdf_id = f"upload_{digest[:12]}"
+        else:
+            with self._lock:
+                claimed = self.uploads.get(pdf_id)
+                if pdf_id in self.urls:
+                    raise ConflictingUpload(f"pdf_id {pdf_id} is listed in {INSPECTION_URLS_PATH}")
+                if claimed is not None and claimed != digest:
+                    raise ConflictingUpload(f"pdf_id {pdf_id} was uploaded with a different PDF")
+                if claimed is None and os.path.exists(os.path.join(EVALUATION_FOLDER, f"{pdf_id}.json")):
+                    raise ConflictingUpload(f"pdf_id {pdf_id} already has an evaluation file")
+                self.uploads[pdf_id] = digest
+        return f"sha1:{digest}:id:{pdf_id}", pdf_id
+
+    def submit(self, key: str, pdf_id: str, url: str | None = None, pdf_bytes: bytes | None = None,
+               refresh: bool = False) -> tuple[Future, str]:
+        """
+        Returns a future for the normalized output and where it comes from:
+        "cache", "store", "coalesced" (joins a running extraction) or "extracted".
+        """
+        with self._lock:
+            pending = self._pending(key, refresh)
+        if pending is not None:
+            return pending
+
+        # The store is keyed by pdf_id only, so it answers only for the pdf_id's own URL.
+        # It is read without holding the lock; the cache and in-flight requests are checked
+        # again below since another request for the key may have started meanwhile.
+        stored = None
+        if not refresh and pdf_bytes is None and es.RESULT_STORE and self.urls.get(pdf_id) == url:
+            stored = es.get_result_store().latest_output(pdf_id)
+
+        with self._lock:
+            pending = self._pending(key, refresh)
+            if pending is not None:
+                return pending
+            if stored is not None:
+                self._cache(key, stored)
+                return self._resolved(stored), "store"
+
+            future = self.executor.submit(self._extract, pdf_id, url, pdf_bytes)
+            self.inflight[key] = future
+            self.queued += 1
+        future.add_done_callback(lambda f: self._finish(key, f))
+        return future, "extracted"
+
+    def _pending(self, key: str, refresh: bool) -> tuple[Future, str] | None:
+        # Called with self._lock held
+        if not refresh and key in self.cache:
+            self.cache.move_to_end(key)
+            return self._resolved(self.cache[key]), "cache"
+        if key in self.inflight:
+            return self.inflight[key], "coalesced"
+        return None
+
+    @staticmethod
+    def _resolved(value) -> Future:
+        future = Future()
+        future.set_result(value)
+        return future
+
+    def _extract(self, pdf_id: str, url: str | None, pdf_bytes: bytes | None) -> dict:
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+        try:
+            print(f"\nExtracting fields from PDF ID: {pdf_id} ({'upload' if pdf_bytes is not None else url})")
+            with span("pdf", pdf_id=pdf_id):
+                if pdf_bytes is not None:
+                    model_output = es.extract_fields_from_pdf_bytes(pdf_id, pdf_bytes)
+                else:
+                    model_output = es.extract_fields_from_pdf_multipage(pdf_id, url)
+                if not model_output:
+                    raise ExtractionFailed(f"Extraction failed or empty for ID {pdf_id}")
+                with span("save_evaluation", pdf_id=pdf_id):
+                    normalized_output = normalize_model_output(model_output)
+                    es.save_evaluation_json(pdf_id, normalized_output, EVALUATION_FOLDER)
+            return normalized_output
+        finally:
+            with self._lock:
+                self.running -= 1
+
+    def _cache(self, key: str, value: dict):
+        # Called with self._lock held
+        self.cache[key] = value
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def _finish(self, key: str, future: Future):
+        with self._lock:
+            self.inflight.pop(key, None)
+            if future.exception() is None:
+                self._cache(key, future.result())
+
+    def record(self, source: str):
+        with self._lock:
+            self.requests[source] += 1
+
+    def render_metrics(self) -> str:
+        with self._lock:
+            lines = [
+                "# HELP extraction_service_queue_depth Extractions waiting for a worker.",
+                "# TYPE extraction_service_queue_depth gauge",
+                f"extraction_service_queue_depth {self.queued}",
+                "# HELP extraction_service_running Extractions in progress.",
+                "# TYPE extraction_service_running gauge",
+                f"extraction_service_running {self.running}",
+                "# HELP extraction_service_cached_results Results held in the in-process cache.",
+                "# TYPE extraction_service_cached_results gauge",
+                f"extraction_service_cached_results {len(self.cache)}",
+                "# HELP extraction_service_requests_total Requests by where the answer came from.",
+                "# TYPE extraction_service_requests_total counter",
+            ]
+            lines += [f'extraction_service_requests_total{{source="{s}"}} {n}' for s, n in sorted(self.requests.items())]
+        # Request latencies are the "service_request" spans; pipeline stages follow
+        return "\n".join(lines) + "\n" + es.tracing.get_tracer().render_prometheus()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+
+def make_server(service: ExtractionService, host: str = "127.0.0.1", port: int = 8080) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status: int, payload, content_type: str = "application/json"):
+            body = payload.encode("utf-8") if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            path = urlparse(self.path).path.rstrip("/")
+            if path == "/metrics":
+                self._send(200, service.render_metrics(), "text/plain; version=0.0.4")
+            elif path == "/health":
+                self._send(200, {"status": "ok", "queued": service.queued, "running": service.running})
+            else:
+                self._send(404, {"error": f"Unknown path {self.path}"})
+
+        def do_POST(self):
+            parsed = urlparse(self.path)
+            if parsed.path.rstrip("/") != "/extract":
+                self._send(404, {"error": f"Unknown path {self.path}"})
+                return
+
+            length = int(self.headers.get("Content-Length", 0))
+            if length > MAX_UPLOAD_BYTES:
+                self._send(413, {"error": f"Body larger than {MAX_UPLOAD_BYTES} bytes"})
+                return
+            body = self.rfile.read(length)
+            query = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+
+            start = time.perf_counter()
+            with span("service_request") as s:
+                status, payload = self._handle(body, query)
+                s.set(call_type=payload.get("source", "error"))
+            payload["elapsed_s"] = round(time.perf_counter() - start, 3)
+            self._send(status, payload)
+
+        def _handle(self, body: bytes, query: dict) -> tuple[int, dict]:
+            if self.headers.get("Content-Type", "").startswith("application/pdf"):
+                digest = hashlib.sha1(body).hexdigest()
+                try:
+                    key, pdf_id = service.resolve_upload(query.get("pdf_id") or None, digest)
+                except ConflictingUpload as error:
+                    return 409, {"pdf_id": query.get("pdf_id"), "error": str(error)}
+                url, pdf_bytes = None, body
+                refresh = query.get("refresh") in ("1", "true")
+            else:
+                try:
+                    request = json.loads(body or b"{}")
+                except json.JSONDecodeError as error:
+                    return 400, {"error": f"Invalid JSON: {error}"}
+                pdf_id, url, pdf_bytes = request.get("pdf_id"), request.get("url"), None
+                refresh = bool(request.get("refresh"))
+                if pdf_id is None and url is None:
+                    return 400, {"error": "Give a pdf_id, a url or a PDF body"}
+                if url is None and str(pdf_id) not in service.urls:
+                    return 404, {"error": f"pdf_id {pdf_id} not in {INSPECTION_URLS_PATH}"}
+                try:
+                    key, pdf_id, url = service.resolve(pdf_id, url)
+                except ConflictingUrl as error:
+                    return 409, {"pdf_id": str(pdf_id), "error": str(error)}
+
+            future, source = service.submit(key, pdf_id, url, pdf_bytes, refresh)
+            service.record(source)
+            try:
+                model_output = future.result(timeout=REQUEST_TIMEOUT_S)
+            except TimeoutError:
+                return 504, {"pdf_id": pdf_id, "source": source, "error": "Extraction still running"}
+            except Exception as error:
+                return 502, {"pdf_id": pdf_id, "source": source, "error": str(error)}
+            return 200, {"pdf_id": pdf_id, "source": source, "model_output": model_output}
+
+        def log_message(self, format, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local HTTP extraction service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=SERVICE_WORKERS, help="Concurrent extractions")
+    parser.add_argument("--urls", default=INSPECTION_URLS_PATH)
+    args = parser.parse_args()
+
+    service = ExtractionService(args.workers, args.urls)
+    server = make_server(service, args.host, args.port)
+    print(f"🛰️ Extraction service on http://{args.host}:{args.port} "
+          f"({len(service.urls)} known PDF URLs, {args.workers} worker(s), batch {es.get_run_context().batch_id})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+        es.finish_batch()
+
+
+if __name__ == "__main__":
+    main()
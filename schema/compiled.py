@@ -0,0 +1,164 @@
+"""
+schema/compiled.py
+Compiles schema/schema.py once into the structures every consumer needs:
+prompt snippets, JSON templates, a normalizer/validator, a JSON Schema for
+structured outputs and the flattened field index used by the evaluator.
+"""
+
+from dataclasses import dataclass, field
+from schema.schema import FIELDS, FIELD_DEFINITIONS, SUBFIELDS, SCALAR_TYPES, UNEVALUATED_FIELDS
+
+_PYTHON_TYPES = {
+    "string": str,
+    "boolean": bool,
+    "null": type(None),
+}
+
+
+@dataclass(frozen=True)
+class FieldPath:
+    """
+    One evaluated leaf of the schema, e.g. "MoistureDamage.mentions_roof".
+    For object fields `aggregate` is the parent field whose counts also include this leaf.
+    """
+    path: str
+    field: str
+    subkey: str | None = None
+
+    @property
+    def aggregate(self) -> str | None:
+        return self.field if self.subkey is not None else None
+
+
+@dataclass(frozen=True)
+class CompiledSchema:
+    fields: tuple
+    definitions: dict
+    subfields: dict
+    scalar_types: dict
+    evaluated_fields: tuple
+    field_paths: tuple
+    field_lines: str
+    json_template: str
+    json_schema: dict
+    _scalar_checks: dict = field(repr=False)
+
+    @property
+    def response_format(self) -> dict:
+        """
+        The `response_format` argument for chat completions in structured-output mode.
+        """
+        return {
+            "type": "json_schema",
+            "json_schema": {
+                "name": "inspection_report_fields",
+                "strict": True,
+                "schema": self.json_schema,
+            },
+        }
+
+    def default_ground_truth(self) -> dict:
+        """
+        A fresh ground truth skeleton with every evaluated value set to False.
+        """
+        return {
+            name: dict.fromkeys(self.subfields[name], False) if name in self.subfields else False
+            for name in self.evaluated_fields
+        }
+
+    def normalize(self, output: dict) -> dict:
+        """
+        Ensures an output contains every field, with object fields holding exactly
+        their schema keys. Missing values become None; unknown keys are dropped.
+        """
+        normalized = {}
+        for name in self.fields:
+            value = output.get(name)
+            keys = self.subfields.get(name)
+            if keys is None:
+                normalized[name] = value
+            elif isinstance(value, dict):
+                normalized[name] = {k: value.get(k) for k in keys}
+            else:
+                normalized[name] = dict.fromkeys(keys)
+        return normalized
+
+    def validate(self, output) -> list[str]:
+        """
+        Checks an output against the schema. Returns a list of problems (empty if valid).
+        """
+        if not isinstance(output, dict):
+            return [f"expected a JSON object, got {type(output).__name__}"]
+
+        errors = []
+        for name in self.fields:
+            if name not in output:
+                errors.append(f"missing field '{name}'")
+                continue
+            value = output[name]
+            keys = self.subfields.get(name)
+            if keys is None:
+                if not isinstance(value, self._scalar_checks[name]):
+                    errors.append(f"'{name}' has type {type(value).__name__}")
+            elif not isinstance(value, dict):
+                errors.append(f"'{name}' should be an object")
+            else:
+                for key in keys:
+                    if not isinstance(value.get(key), bool):
+                        errors.append(f"'{name}.{key}' should be true/false")
+        return errors
+
+
+def _json_schema(fields, subfields, scalar_types) -> dict:
+    properties = {}
+    for name in fields:
+        if name in subfields:
+            properties[name] = {
+                "type": "object",
+                "properties": {key: {"type": "boolean"} for key in subfields[name]},
+                "required": list(subfields[name]),
+                "additionalProperties": False,
+            }
+        else:
+            properties[name] = {"type": list(scalar_types[name])}
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(fields),
+        "additionalProperties": False,
+    }
+
+
+def compile_schema(fields=FIELDS, definitions=FIELD_DEFINITIONS, subfields=SUBFIELDS,
+                   scalar_types=SCALAR_TYPES, unevaluated=UNEVALUATED_FIELDS) -> CompiledSchema:
+    for name in fields:
+        if name not in definitions:
+            raise ValueError(f"Field '{name}' has no definition in FIELD_DEFINITIONS")
+        if name not in subfields and name not in scalar_types:
+            raise ValueError(f"Field '{name}' needs either SUBFIELDS or SCALAR_TYPES")
+
+    evaluated = tuple(name for name in fields if name not in unevaluated)
+    paths = []
+    for name in evaluated:
+        if name in subfields:
+            paths.extend(FieldPath(f"{name}.{key}", name, key) for key in subfields[name])
+        else:
+            paths.append(FieldPath(name, name))
+
+    return CompiledSchema(
+        fields=tuple(fields),
+        definitions=dict(definitions),
+        subfields={name: tuple(keys) for name, keys in subfields.items()},
+        scalar_types={name: tuple(types) for name, types in scalar_types.items()},
+        evaluated_fields=evaluated,
+        field_paths=tuple(paths),
+        field_lines="\n".join(f'- "{key}": {definitions[key]}' for key in fields),
+        json_template="{\n" + ",\n".join(f'  "{key}": null' for key in fields) + "\n}",
+        json_schema=_json_schema(fields, subfields, scalar_types),
+        _scalar_checks={
+            name: tuple(_PYTHON_TYPES[t] for t in types) for name, types in scalar_types.items()
+        },
+    )
+
+
+SCHEMA = compile_schema()
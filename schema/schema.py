@@ -45,3 +45,28 @@ FIELD_DEFINITIONS = {
         "This should capture the high-level impression from the inspection report."
     )
 } 
+
+
+# Keys of the object-type fields. Every key holds a boolean.
+SUBFIELDS = {
+    "MoistureDamage": [
+        "mentions_garage",
+        "mentions_källare",
+        "mentions_roof",
+        "mentions_balcony",
+        "mentions_bjälklag",
+        "mentions_facade"
+    ],
+    "RenovationNeeds": ["roof", "garage", "facade", "balcony", "källare", "bjälklag"],
+    "AsbestosPresence": ["Measured", "presence"]
+}
+
+# JSON types allowed for the scalar fields (false = not found)
+SCALAR_TYPES = {
+    "CadastralDesignation": ["string", "boolean"],
+    "InspectionDate": ["string", "boolean"],
+    "SummaryInsights": ["string", "null"]
+}
+
+# Fields kept in model_output but never scored against ground truth
+UNEVALUATED_FIELDS = ["SummaryInsights"]
@@ -1,7 +1,8 @@
 import os
-from openai import OpenAI, RateLimitError
+from utils.transport import create_client
 
-client = OpenAI()
+# Live by default; set EXTRACTION_TRANSPORT=replay (or server) to check the offline transports
+client = create_client()
 
 response = client.chat.completions.create(
     model="gpt-4o",          # or "gpt-4o" if you have access
@@ -9,4 +10,4 @@ response = client.chat.completions.create(
 )
 
 print("Assistant:", response.choices[0].message.content)
-print("Usage:", response.usage)
\ No newline at end of file
+print("Usage:", response.usage)
@@ -0,0 +1,129 @@
+"""
+utils/confidence.py
+Field-level confidence from token logprobs. A page-level or synthesis response is a
+JSON object; every leaf value of the schema (e.g. "MoistureDamage.mentions_roof") is
+located in the raw text, and its confidence is the probability of the least likely
+token the model produced inside that value. A "true" the model hesitated over scores
+low even if the rest of the response was certain.
+"""
+
+import json
+import math
+
+from schema.compiled import SCHEMA
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+
+
+def token_logprobs(response) -> list[tuple[bytes, float]] | None:
+    """
+    (token bytes, logprob) for every output token of a chat completion, or None if
+    the response carries no logprobs.
+    """
+    logprobs = getattr(response.choices[0], "logprobs", None)
+    if logprobs is None or not logprobs.content:
+        return None
+    return [
+        (bytes(t.bytes) if t.bytes is not None else t.token.encode("utf-8"), t.logprob)
+        for t in logprobs.content
+    ]
+
+
+def _skip_ws(raw: str, i: int) -> int:
+    while i < len(raw) and raw[i] in _WHITESPACE:
+        i += 1
+    return i
+
+
+def value_spans(raw: str) -> dict[str, tuple[int, int]]:
+    """
+    Character span of every top-level value and of the values one level down
+    (object fields), keyed by field path. Returns {} if raw holds no JSON object.
+    """
+    start = raw.find("{")
+    if start == -1:
+        return {}
+    spans = {}
+
+    def walk(i: int, prefix: str, depth: int) -> int:
+        # raw[i] == "{"; returns the index after the matching "}"
+        i = _skip_ws(raw, i + 1)
+        if raw[i] == "}":
+            return i + 1
+        while True:
+            key, i = json.decoder.scanstring(raw, i + 1)
+            i = _skip_ws(raw, _skip_ws(raw, i) + 1)  # past ":"
+            path = f"{prefix}{key}"
+            if raw[i] == "{" and depth == 0:
+                end = walk(i, f"{path}.", depth + 1)
+            else:
+                _, end = _decoder.raw_decode(raw, i)
+            spans[path] = (i, end)
+            i = _skip_ws(raw, end)
+            if raw[i] == "}":
+                return i + 1
+            i = _skip_ws(raw, i + 1)  # past ","
+
+    try:
+        walk(start, "", 0)
+    except (ValueError, IndexError):
+        return spans
+    return spans
+
+
+def leaf_paths() -> list[str]:
+    """
+    Every leaf of the schema ("InspectionDate", "MoistureDamage.mentions_roof", ...),
+    including the fields that are not evaluated.
+    """
+    return [
+        f"{name}.{key}" if key is not None else name
+        for name in SCHEMA.fields
+        for key in SCHEMA.subfields.get(name, [None])
+    ]
+
+
+def field_confidence(raw: str, logprobs: list[tuple[bytes, float]] | None) -> dict[str, float] | None:
+    """
+    {field path: confidence in [0, 1]} for the schema leaves found in raw, or None
+    without logprobs.
+    """
+    if not logprobs:
+        return None
+
+    # Byte offsets of the tokens (logprob bytes may split multi-byte characters like å/ä/ö)
+    offsets, position = [], 0
+    for token, logprob in logprobs:
+        offsets.append((position, position + len(token), logprob))
+        position += len(token)
+
+    char_spans = value_spans(raw)
+    confidence = {}
+    for path in leaf_paths():
+        span = char_spans.get(path)
+        if span is None:
+            continue
+        start, end = len(raw[:span[0]].encode("utf-8")), len(raw[:span[1]].encode("utf-8"))
+        overlapping = [lp for t_start, t_end, lp in offsets if t_start < end and t_end > start]
+        if overlapping:
+            confidence[path] = math.exp(min(overlapping))
+    return confidence
+
+
+def evaluated_paths() -> list[str]:
+    """
+    The evaluated scalar and boolean leaves. Free text such as SummaryInsights is left out:
+    the least likely token of a whole paragraph is nearly always unlikely.
+    """
+    return [field_path.path for field_path in SCHEMA.field_paths]
+
+
+def document_confidence(confidence: dict[str, float] | None) -> float | None:
+    """
+    One score per document: the mean confidence over its evaluated fields.
+    """
+    values = [confidence[path] for path in evaluated_paths() if path in confidence] if confidence else []
+    if not values:
+        return None
+    return sum(values) / len(values)
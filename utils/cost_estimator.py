@@ -0,0 +1,136 @@
+"""
+utils/cost_estimator.py
+Predicts token usage and USD cost of extracting a PDF *before* any call is made,
+calibrated against the per-PDF cost logs of earlier batches.
+"""
+
+import csv
+import glob
+import math
+import os
+from utils.pricing import cost_usd
+
+# Image token accounting for gpt-4o / gpt-4.1 (detail=high):
+# fit in 2048x2048, scale the short side to 768, then 170 tokens per 512px tile + 85 base.
+IMAGE_BASE_TOKENS = 85
+IMAGE_TILE_TOKENS = 170
+
+# Rough characters per token for the mixed Swedish/English prompts
+CHARS_PER_TOKEN = 4
+
+# A4 at 200 DPI, the size get_images_from_pdf produces for most reports
+DEFAULT_PAGE_SIZE = (1654, 2339)
+
+# Typical completion lengths observed in data/page_logs
+APPENDIX_COMPLETION_TOKENS = 1
+PAGE_COMPLETION_TOKENS = 200
+PAGE_RESULT_TOKENS = 200        # one page-level JSON as it appears in the synthesis prompt
+SYNTHESIS_COMPLETION_TOKENS = 250
+
+HISTORY_GLOB = os.path.join("data", "logs", "per_pdf_costs", "*", "per_pdf_costs.csv")
+
+
+def image_tokens(width: int, height: int) -> int:
+    """
+    Input tokens the API charges for one image of the given pixel size.
+    """
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    tiles = math.ceil(width / 512) * math.ceil(height / 512)
+    return IMAGE_BASE_TOKENS + IMAGE_TILE_TOKENS * tiles
+
+
+def text_tokens(text_or_chars) -> int:
+    """
+    Approximate token count of a string (or of a character count).
+    """
+    chars = text_or_chars if isinstance(text_or_chars, int) else len(text_or_chars)
+    return math.ceil(chars / CHARS_PER_TOKEN)
+
+
+class CostEstimator:
+    """
+    Estimates tokens and cost per PDF from its page count, page sizes and the prompt lengths.
+
+    The raw estimate assumes every page gets both an appendix check and an extraction call.
+    calibrate() then scales prompt and completion tokens by the ratio actual/raw seen in the
+    historical per_pdf_costs CSVs for the same model, which also absorbs the pages skipped
+    after an appendix is found.
+    """
+
+    def __init__(self, model: str, appendix_prompt: str, page_prompt: str, synthesis_prompt: str):
+        self.model = model
+        self.appendix_prompt_tokens = text_tokens(appendix_prompt)
+        self.page_prompt_tokens = text_tokens(page_prompt)
+        self.synthesis_prompt_tokens = text_tokens(synthesis_prompt)
+        self.prompt_factor = 1.0
+        self.completion_factor = 1.0
+        self.calibration_rows = 0
+
+    def raw_estimate(self, num_pages: int, page_size=DEFAULT_PAGE_SIZE, text_page_chars=None) -> dict:
+        """
+        Uncalibrated token estimate. text_page_chars maps page index → text-layer length
+        for pages that will be sent as text instead of images.
+        """
+        text_page_chars = text_page_chars or {}
+        per_image = image_tokens(*page_size)
+
+        prompt = 0
+        for i in range(num_pages):
+            payload = text_tokens(text_page_chars[i]) if i in text_page_chars else per_image
+            prompt += self.appendix_prompt_tokens + payload
+            prompt += self.page_prompt_tokens + payload
+        prompt += self.synthesis_prompt_tokens + num_pages * PAGE_RESULT_TOKENS
+
+        completion = num_pages * (APPENDIX_COMPLETION_TOKENS + PAGE_COMPLETION_TOKENS)
+        completion += SYNTHESIS_COMPLETION_TOKENS
+        return {"prompt": prompt, "completion": completion, "cached": 0}
+
+    def estimate(self, num_pages: int, page_size=DEFAULT_PAGE_SIZE, text_page_chars=None) -> dict:
+        """
+        Calibrated estimate for one PDF: token counts plus `cost_usd`.
+        """
+        raw = self.raw_estimate(num_pages, page_size, text_page_chars)
+        tokens = {
+            "prompt": round(raw["prompt"] * self.prompt_factor),
+            "completion": round(raw["completion"] * self.completion_factor),
+            "cached": 0,
+        }
+        return {**tokens, "cost_usd": cost_usd(tokens, self.model)}
+
+    def calibrate(self, history_glob: str = HISTORY_GLOB) -> "CostEstimator":
+        """
+        Fits the prompt/completion scale factors on image-only (page-by-page) rows
+        for this model. Leaves the factors at 1.0 if there is no usable history.
+
+        Text-layer, hybrid and selective rows are left out: per_pdf_costs.csv does not
+        record which pages went as text, so their raw estimate cannot be rebuilt. The
+        factors are fitted on image pages and applied to text pages as they are.
+        """
+        raw_prompt = raw_completion = actual_prompt = actual_completion = 0
+        rows = 0
+        for path in glob.glob(history_glob):
+            with open(path, encoding="utf-8") as f:
+                for row in csv.DictReader(f):
+                    if row.get("model") != self.model or row.get("extraction_strategy") != "page-by-page":
+                        continue
+                    try:
+                        pages = int(row["pages_extracted"])
+                        prompt_tokens = int(row["prompt_tokens"])
+                        completion_tokens = int(row["completion_tokens"])
+                    except (KeyError, ValueError):
+                        continue
+                    raw = self.raw_estimate(pages)
+                    raw_prompt += raw["prompt"]
+                    raw_completion += raw["completion"]
+                    actual_prompt += prompt_tokens
+                    actual_completion += completion_tokens
+                    rows += 1
+
+        if rows:
+            self.prompt_factor = actual_prompt / raw_prompt
+            self.completion_factor = actual_completion / raw_completion
+        self.calibration_rows = rows
+        return self
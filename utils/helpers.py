@@ -1,53 +1,78 @@
-from openai import OpenAI, RateLimitError
+from __future__ import annotations
+
 import base64
 import io
 import time
 import random
-import requests
-import fitz
 import json
 import csv
 import os
-from pdf2image import convert_from_bytes
-from PIL import Image
-from schema.schema import FIELDS, FIELD_DEFINITIONS
-from utils.pricing import PRICES
+from typing import TYPE_CHECKING
+from schema.compiled import SCHEMA
+from utils.confidence import field_confidence, token_logprobs
+from utils.pricing import PRICES, cost_usd
+from utils.prompt_layout import build_messages
+from utils.tracing import span
+from utils.transport import create_client
 from datetime import datetime
 
+# openai, requests, fitz, pdf2image and PIL are imported where they are used, so
+# importing this module stays cheap for tools that never call the API or render pages
+if TYPE_CHECKING:
+    from PIL import Image
+
 
 # === GPT Helpers ===
-client = OpenAI()
+# Live OpenAI client by default; EXTRACTION_TRANSPORT=record/replay/server swaps it (see utils/transport.py).
+# Built on first use; assign a client here to override it.
+client = None
+
 
-def call_openai_image_json(image: Image.Image, prompt: str, model: str, retries=5, backoff=2) -> tuple[str, dict]:
+def get_client():
+    global client
+    if client is None:
+        client = create_client()
+    return client
+
+# Minimum substantial characters for a page to go through the text-layer path
+TEXT_PAGE_MIN_CHARS = 200
+# Text blocks shorter than this (headers, page numbers, OCR noise) don't count as substantial
+SUBSTANTIAL_BLOCK_CHARS = 15
+
+def call_openai_image_json(image: Image.Image, prompt: str, model: str, retries=5, backoff=2,
+                           response_format: dict | None = None, system_prefix: str | None = None,
+                           logprobs: bool = False) -> tuple[str, dict, list | None]:
     """
     Calls the OpenAI chat completions API with a text prompt and image input.
     The prompt instructs the model to extract structured information from the image.
-    Returns the response content (expected to be JSON) and usage information.
+    If response_format is given (e.g. SCHEMA.response_format) the API enforces that JSON schema.
+    A system_prefix (utils/prompt_layout.py) is sent first as a shared, cacheable system message.
+    Returns the response content (expected to be JSON), usage information and, if logprobs
+    is set, the output token logprobs (else None).
     Retrying if rate limit error occurs.
     """
-    base64_image = encode_image(image)
+    with span("png_encode") as s:
+        base64_image = encode_image(image)
+        s.add_bytes(len(base64_image))
+    from openai import RateLimitError
+
+    extra = {"response_format": response_format} if response_format else {}
+    if logprobs:
+        extra["logprobs"] = True
     for attempt in range(retries):
         try:
-            response = client.chat.completions.create(
+            response = get_client().chat.completions.create(
                 model=model,
-                messages=[{
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": prompt},
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/png;base64,{base64_image}"
-                            },
-                        },
-                    ],
-                }],
+                messages=build_messages(
+                    prompt, image_url=f"data:image/png;base64,{base64_image}", system_prefix=system_prefix
+                ),
                 temperature=0,
                 top_p=0,
+                **extra,
             )
-            output = response.choices[0].message.content
+            output = response.choices[0].message.content or ""
             usage = response.usage
-            return output, usage
+            return output, usage, token_logprobs(response) if logprobs else None
 
         except RateLimitError as e:
             wait_time = backoff * (2 ** attempt) + random.uniform(0, 1)
@@ -57,74 +82,199 @@ def call_openai_image_json(image: Image.Image, prompt: str, model: str, retries=
             print(f"GPT call failed with error: {e}")
             break
 
-    return "", None
+    return "", None, None
 
 
-def synthesize_final_json(page_results: list, model: str, retries=5, backoff=2) -> tuple[dict, dict]:
+def call_openai_text_json(page_text: str, prompt: str, model: str, retries=5, backoff=2,
+                          response_format: dict | None = None, system_prefix: str | None = None,
+                          logprobs: bool = False) -> tuple[str, dict, list | None]:
     """
-    Given a list of page-level JSONs, ask GPT-4o to synthesize them into one coherent JSON.
-    Retries if rate-limited.
-    Returns a tuple of (result_json, usage_info).
+    Text-only counterpart of call_openai_image_json.
+    Sends the PDF's own text layer for a page instead of a rendered image,
+    which is far cheaper in tokens for born-digital pages.
+    Returns the response content (expected to be JSON), usage information and token logprobs.
+    Retrying if rate limit error occurs.
     """
-    print("Synthesizing from page-level results...")
+    from openai import RateLimitError
+
+    extra = {"response_format": response_format} if response_format else {}
+    if logprobs:
+        extra["logprobs"] = True
+    for attempt in range(retries):
+        try:
+            response = get_client().chat.completions.create(
+                model=model,
+                messages=build_messages(prompt, page_text=page_text, system_prefix=system_prefix),
+                temperature=0,
+                top_p=0,
+                **extra,
+            )
+            output = response.choices[0].message.content or ""
+            usage = response.usage
+            return output, usage, token_logprobs(response) if logprobs else None
+
+        except RateLimitError as e:
+            wait_time = backoff * (2 ** attempt) + random.uniform(0, 1)
+            print(f"Rate limit hit (attempt {attempt+1}/{retries}). Retrying in {wait_time:.1f}s...")
+            time.sleep(wait_time)
+        except Exception as e:
+            print(f"GPT call failed with error: {e}")
+            break
 
-    field_lines = [f'- "{key}": {FIELD_DEFINITIONS[key]}' for key in FIELDS]
-    json_template = "{\n" + ",\n".join([f'  "{key}": null' for key in FIELDS]) + "\n}"
-
-    prompt = (
-        "You are given a list of partial JSON outputs extracted from different pages of a housing inspection report.\n"
-        "Each JSON may contain correct or incorrect values, or have missing fields.\n"
-        "Your job is to reason through them and return a single, best-version JSON object.\n\n"
-        "Instructions:\n"
-        "- For all fields, use the most complete and accurate value.\n"
-        "- If a field is missing in all pages, return a reasonable default.\n"
-        "- **Always include 'SummaryInsights', even if no insights are found.**\n"
-        "- Return in exactly the JSON format shown below.\n\n"
-        "Field definitions:\n"
-        + "\n".join(field_lines) +
-        "\n\nReturn the final merged JSON:\n"
-        "```json\n" + json_template + "\n```\n"
-        f"Here is the list of page-level JSONs:\n\n"
+    return "", None, None
+
+
+# Static part of the synthesis prompt, built once from the compiled schema
+SYNTHESIS_INSTRUCTIONS = (
+    "You are given a list of partial JSON outputs extracted from different pages of a housing inspection report.\n"
+    "Each JSON may contain correct or incorrect values, or have missing fields.\n"
+    "Your job is to reason through them and return a single, best-version JSON object.\n\n"
+    "Instructions:\n"
+    "- For all fields, use the most complete and accurate value.\n"
+    "- If a field is missing in all pages, return a reasonable default.\n"
+    "- **Always include 'SummaryInsights', even if no insights are found.**\n"
+    "- Return in exactly the JSON format shown below.\n\n"
+    "Field definitions:\n"
+    + SCHEMA.field_lines +
+    "\n\nReturn the final merged JSON:\n"
+    "```json\n" + SCHEMA.json_template + "\n```\n"
+)
+SYNTHESIS_LIST_HEADER = "Here is the list of page-level JSONs:\n\n"
+SYNTHESIS_PROMPT_PREFIX = SYNTHESIS_INSTRUCTIONS + SYNTHESIS_LIST_HEADER
+
+
+def build_synthesis_prompt(page_results: list, head: str = SYNTHESIS_PROMPT_PREFIX) -> str:
+    """
+    Full synthesis prompt: the static head followed by the page-level JSONs.
+    """
+    return (
+        head +
         f"{json.dumps(page_results, indent=2, ensure_ascii=False)}\n\n"
         "Now return the final merged JSON object:"
     )
 
+
+def synthesize_final_json(page_results: list, model: str, retries=5, backoff=2,
+                          response_format: dict | None = None, head: str = SYNTHESIS_PROMPT_PREFIX,
+                          system_prefix: str | None = None, logprobs: bool = False) -> tuple[dict, dict, dict | None]:
+    """
+    Given a list of page-level JSONs, ask GPT-4o to synthesize them into one coherent JSON.
+    With a shared system_prefix holding the instructions, head is just the task line and list header.
+    Retries if rate-limited.
+    Returns a tuple of (result_json, usage_info, field confidences); result_json is {} if the
+    response was unusable, the confidences are None unless logprobs is set.
+    """
+    print("Synthesizing from page-level results...")
+
+    prompt = build_synthesis_prompt(page_results, head)
+
+    from openai import RateLimitError
+
+    extra = {"response_format": response_format} if response_format else {}
+    if logprobs:
+        extra["logprobs"] = True
     for attempt in range(retries):
         try:
-            response = client.chat.completions.create(
+            response = get_client().chat.completions.create(
                 model=model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0
+                messages=build_messages(prompt, system_prefix=system_prefix),
+                temperature=0,
+                **extra,
             )
 
-            output = response.choices[0].message.content
+            output = response.choices[0].message.content or ""
             usage = response.usage
-            if output.startswith("```json"):
-                output = output.strip("```json").strip("```").strip()
+            result, _ = parse_model_json(output)
+            if result is None:
+                print("Could not decode JSON in final synthesis.")
+                return {}, usage, None
 
-            return json.loads(output), usage
+            confidence = field_confidence(output, token_logprobs(response)) if logprobs else None
+            return result, usage, confidence
 
         except RateLimitError as e:
             wait_time = backoff * (2 ** attempt) + random.uniform(0, 1)
             print(f"Rate limit hit in synthesis (attempt {attempt+1}/{retries}). Retrying in {wait_time:.1f}s...")
             time.sleep(wait_time)
-        except json.JSONDecodeError:
-            print("Could not decode JSON in final synthesis.")
-            return {}
         except Exception as e:
             print(f"GPT call failed in synthesis step: {e}")
             break
 
-    return {}
+    return {}, None, None
+
+
+def parse_model_json(raw: str) -> tuple[dict | None, bool]:
+    """
+    Parses a page-level or synthesis response and checks it against the compiled schema.
+    Returns (result, repaired). result is None if nothing usable could be recovered.
+    repaired is True if the response needed local fixing first: stripping code fences
+    or surrounding text, or filling in fields that were missing or malformed.
+    """
+    repaired = False
+    try:
+        result = json.loads(raw)
+    except (json.JSONDecodeError, TypeError):
+        start, end = raw.find("{"), raw.rfind("}")
+        if start == -1 or end <= start:
+            return None, False
+        try:
+            result = json.loads(raw[start:end + 1])
+        except json.JSONDecodeError:
+            return None, False
+        repaired = True
+
+    if not isinstance(result, dict):
+        return None, False
+    if SCHEMA.validate(result):
+        result = SCHEMA.normalize(result)
+        repaired = True
+    return result, repaired
 
 
 # === Image Utilities ===
-def get_images_from_pdf(pdf_bytes, dpi=200):
+def get_images_from_pdf(pdf_bytes, dpi=200, first_page=None, last_page=None):
     """
     Converts PDF bytes to a list of PIL Image objects using pdf2image.
+    first_page/last_page (1-based, inclusive) limit rendering to a page range.
     """
+    from pdf2image import convert_from_bytes
+
     POPPLER_PATH = r'C:/Program Files (x86)/poppler-24.08.0/Library/bin'
-    return convert_from_bytes(pdf_bytes, dpi=dpi, poppler_path=POPPLER_PATH)
+    return convert_from_bytes(
+        pdf_bytes, dpi=dpi, first_page=first_page, last_page=last_page, poppler_path=POPPLER_PATH
+    )
+
+
+def get_page_texts_from_pdf(pdf_bytes) -> list[str]:
+    """
+    Returns the full text layer of every page using PyMuPDF, one string per page with
+    the text blocks separated by blank lines. Short blocks (dates, table cells, a
+    property designation) are kept: they are often the values being extracted.
+    """
+    import fitz
+
+    page_texts = []
+    with fitz.open("pdf", stream=io.BytesIO(pdf_bytes)) as doc:
+        for page in doc:
+            blocks = [block[4].strip() for block in page.get_text("blocks")]
+            page_texts.append("\n\n".join(text for text in blocks if text))
+    return page_texts
+
+
+def substantial_chars(page_text: str) -> int:
+    """
+    Characters in the page's substantial blocks (SUBSTANTIAL_BLOCK_CHARS+, as in is_text_pdf),
+    so headers, page numbers and OCR noise on scanned pages don't count as text.
+    """
+    return sum(len(block) for block in page_text.split("\n\n") if len(block.strip()) >= SUBSTANTIAL_BLOCK_CHARS)
+
+
+def is_text_page(page_text: str, min_chars=TEXT_PAGE_MIN_CHARS) -> bool:
+    """
+    Decides per page whether the text layer is rich enough to send as text.
+    Pages below the threshold (scans, drawings, photos) are sent as images.
+    """
+    return substantial_chars(page_text) >= min_chars
 
 def encode_image(image: Image.Image) -> str:
     """
@@ -140,6 +290,9 @@ def is_text_pdf(url: str, min_chars=3500) -> bool:
     Determines if a PDF is text-based by counting meaningful visible characters.
     Returns True only if enough visible text is found (e.g., 200+ characters total).
     """
+    import fitz
+    import requests
+
     try:
         response = requests.get(url, timeout=10)
         response.raise_for_status()
@@ -152,7 +305,7 @@ def is_text_pdf(url: str, min_chars=3500) -> bool:
             blocks = page.get_text("blocks")
             for block in blocks:
                 text = block[4].strip()
-                if len(text) >= 15:  # Only count substantial lines
+                if len(text) >= SUBSTANTIAL_BLOCK_CHARS:  # Only count substantial lines
                     total_visible_chars += len(text)
 
             # Early exit if already clearly text-based
@@ -165,95 +318,59 @@ def is_text_pdf(url: str, min_chars=3500) -> bool:
     return False  # Default: treat as image-based if uncertain
 
 
-def is_appendix_page_gpt(image: Image.Image, model: str) -> tuple[bool, dict]:
-    appendix_filter_prompt = (
-        "You're reviewing a page from a Swedish housing inspection report. "
-        "Your task is to determine whether this page is an *appendix* or *general conditions section*, typically found at the end of the document.\n"
-        "Note that if it says the technical report itself is an appendix to another report then that is fine if that is explicitly mentioned."
-        "We are only interested in removing the appendix that belongs to the technical report.\n"
-        "We are interested in the inspection report regardless of it being an appendix to something else or not\n\n"
-
-        "✅ Pages that **ARE** appendices include those labeled or titled with:\n"
-        "- 'Bilaga'\n"
-        "- 'Villkor'\n"
-        "- 'Allmänna villkor'\n"
-        "- 'Appendix'\n"
-        "- 'Försäkringsvillkor'\n\n"
-
-        "❌ Pages that are **NOT** appendices include:\n"
-        "- 'Innehållsförteckning' (table of contents)\n"
-        "- Regular report content like summaries, diagrams, measurements\n\n"
-
-        "Respond strictly with one word:\n"
-        "- 'yes' → if the page clearly **is** an appendix\n"
-        "- 'no' → for all other pages, even if uncertain"
-    )
+APPENDIX_FILTER_PROMPT = (
+    "You're reviewing a page from a Swedish housing inspection report. "
+    "Your task is to determine whether this page is an *appendix* or *general conditions section*, typically found at the end of the document.\n"
+    "Note that if it says the technical report itself is an appendix to another report then that is fine if that is explicitly mentioned."
+    "We are only interested in removing the appendix that belongs to the technical report.\n"
+    "We are interested in the inspection report regardless of it being an appendix to something else or not\n\n"
+
+    "✅ Pages that **ARE** appendices include those labeled or titled with:\n"
+    "- 'Bilaga'\n"
+    "- 'Villkor'\n"
+    "- 'Allmänna villkor'\n"
+    "- 'Appendix'\n"
+    "- 'Försäkringsvillkor'\n\n"
 
+    "❌ Pages that are **NOT** appendices include:\n"
+    "- 'Innehållsförteckning' (table of contents)\n"
+    "- Regular report content like summaries, diagrams, measurements\n\n"
 
-    raw_response, usage = call_openai_image_json(image, appendix_filter_prompt, model)
+    "Respond strictly with one word:\n"
+    "- 'yes' → if the page clearly **is** an appendix\n"
+    "- 'no' → for all other pages, even if uncertain"
+)
+
+
+def is_appendix_page_gpt(image: Image.Image, model: str) -> tuple[bool, dict]:
+    raw_response, usage, _ = call_openai_image_json(image, APPENDIX_FILTER_PROMPT, model)
     is_appendix = "yes" in raw_response.lower()
     return is_appendix, usage
 
 
-# === Normalization ===
-def normalize_model_output(output):
+def is_appendix_page_text_gpt(page_text: str, model: str) -> tuple[bool, dict]:
     """
-    Ensures model_output always contains all expected fields with proper nested structure.
+    Same appendix check as is_appendix_page_gpt, but on the page's text layer.
     """
-    def normalize_field(value, template):
-        if isinstance(template, dict):
-            return {k: value.get(k) if isinstance(value, dict) and k in value else None for k in template}
-        return value if value is not None else None
-
-    normalized = {}
-    for field in FIELDS:
-        template = json.loads(json.dumps(generate_default_ground_truth({field: FIELD_DEFINITIONS.get(field)}).get(field)))
-        normalized[field] = normalize_field(output.get(field), template)
-
-    return normalized
+    raw_response, usage, _ = call_openai_text_json(page_text, APPENDIX_FILTER_PROMPT, model)
+    is_appendix = "yes" in raw_response.lower()
+    return is_appendix, usage
 
 
-def generate_default_ground_truth(model_output):
+# === Normalization ===
+def normalize_model_output(output):
     """
-    Creates a ground truth dictionary with the same structure as the model_output,
-    but with all values set to null.
+    Ensures model_output always contains all expected fields with proper nested structure.
     """
-    def default_false(val):
-        if isinstance(val, dict):
-            # nested fields → all False
-            return {k: False for k in val}
-        # scalar fields → False
-        return False
+    return SCHEMA.normalize(output)
 
-    return {
-        field: default_false(model_output.get(field))
-        for field in FIELDS
-        if field != "SummaryInsights"  # Skip ground truth for SummaryInsights since we won't evaluate it
-    }
 
-def cost_usd(tokens: dict, model: str) -> float:
+def generate_default_ground_truth():
     """
-    Compute the estimated USD cost of an OpenAI call based on token counts.
-
-    Args:
-        tokens (dict): A dict with keys 'prompt', 'completion', 'cached'.
-        model (str): The AI model used.
-
-    Returns:
-        float: Estimated cost in USD.
+    Creates a ground truth dictionary with the structure of the schema,
+    with all evaluated values set to False.
     """
-    prices = PRICES[model]
-    input_tokens = tokens["prompt"] - tokens["cached"]
-    cached_tokens = tokens["cached"]
-    output_tokens = tokens["completion"]
-
-    cost = (
-        (input_tokens / 1_000_000) * prices["input"] +
-        (cached_tokens / 1_000_000) * prices["cached input"] +
-        (output_tokens / 1_000_000) * prices["output"]
-    )
-    return cost
-
+    return SCHEMA.default_ground_truth()
 
 def log_pdf_usage(
     csv_path: str,
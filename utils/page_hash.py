@@ -0,0 +1,122 @@
+"""
+utils/page_hash.py
+Perceptual-hash index of rendered pages, used to skip the appendix check for
+boilerplate pages (covers, legends, methodology, terms) that recur across
+reports from the same inspection firms. Only the classification is reused: two
+cover pages for different properties can hash a few bits apart, so a page's
+extracted fields are never taken from another PDF.
+"""
+
+import json
+import os
+import threading
+import numpy as np
+from PIL import Image
+
+# 16x16 difference hash → 256 bits. Larger than the classic 8x8, but pages sharing
+# a layout and differing only in a few words still land within a few bits.
+HASH_SIZE = 16
+HASH_BYTES = HASH_SIZE * HASH_SIZE // 8
+
+# Pages kept in the index (~150 bytes each on disk); the oldest are evicted first
+MAX_ENTRIES = 20_000
+
+# Popcount for every byte value, used for vectorized Hamming distances
+_POPCOUNT = np.array([bin(b).count("1") for b in range(256)], dtype=np.uint16)
+
+
+def page_hash(image: Image.Image, hash_size: int = HASH_SIZE) -> np.ndarray:
+    """
+    Computes a difference hash (dHash) of a page image.
+    The page is downscaled to (hash_size+1) x hash_size grayscale and each bit
+    records whether a pixel is brighter than its right-hand neighbour.
+    Returns the bits packed into a uint8 array.
+    """
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = pixels[:, 1:] > pixels[:, :-1]
+    return np.packbits(bits.ravel())
+
+
+class PageHashIndex:
+    """
+    Persistent index from page hashes to the stored appendix classification.
+    Lookups compare a hash against every stored hash at once and return the
+    closest entry within max_distance bits. Only the newest max_entries pages
+    are kept, and the file is rewritten by save() only if pages were added.
+    """
+
+    def __init__(self, path: str, max_distance: int = 6, max_entries: int = MAX_ENTRIES):
+        self.path = path
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self.entries = []
+        self.hashes = np.empty((0, HASH_BYTES), dtype=np.uint8)
+        self.dirty = False
+        # PDFs may be extracted from several threads (extraction service)
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.entries = json.load(f)[-max_entries:]
+            if self.entries:
+                self.hashes = np.array(
+                    [np.frombuffer(bytes.fromhex(e["hash"]), dtype=np.uint8) for e in self.entries]
+                )
+
+    def reset_stats(self):
+        self.stats = {"lookups": 0, "hits": 0, "tokens_saved": 0}
+
+    def lookup(self, h: np.ndarray) -> dict | None:
+        """
+        Returns the nearest stored entry within max_distance, or None.
+        Hits are counted together with the tokens the stored entry originally cost.
+        """
+        with self._lock:
+            self.stats["lookups"] += 1
+            if not self.entries:
+                return None
+
+            distances = _POPCOUNT[np.bitwise_xor(self.hashes, h)].sum(axis=1)
+            best = int(np.argmin(distances))
+            if distances[best] > self.max_distance:
+                return None
+
+            entry = self.entries[best]
+            self.stats["hits"] += 1
+            self.stats["tokens_saved"] += entry["appendix_tokens"]
+            return entry
+
+    def add(self, h: np.ndarray, pdf_id: str, page: int, is_appendix: bool, appendix_tokens: int):
+        with self._lock:
+            self.entries.append({
+                "hash": h.tobytes().hex(),
+                "pdf_id": pdf_id,
+                "page": page,
+                "is_appendix": is_appendix,
+                "appendix_tokens": appendix_tokens,
+            })
+            self.hashes = np.vstack([self.hashes, h[np.newaxis, :]])
+            if len(self.entries) > self.max_entries:
+                evicted = len(self.entries) - self.max_entries
+                self.entries = self.entries[evicted:]
+                self.hashes = self.hashes[evicted:]
+            self.dirty = True
+
+    def save(self):
+        """
+        Writes the index if pages were added since it was loaded or last saved.
+        """
+        with self._lock:
+            if not self.dirty:
+                return
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self.dirty = False
+
+    def hit_rate(self) -> float:
+        return self.stats["hits"] / self.stats["lookups"] if self.stats["lookups"] else 0.0
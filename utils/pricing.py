@@ -19,3 +19,27 @@ PRICES = {
         "output": 40.00
     }
 }
+
+
+def cost_usd(tokens: dict, model: str) -> float:
+    """
+    Compute the estimated USD cost of an OpenAI call based on token counts.
+
+    Args:
+        tokens (dict): A dict with keys 'prompt', 'completion', 'cached'.
+        model (str): The AI model used.
+
+    Returns:
+        float: Estimated cost in USD.
+    """
+    prices = PRICES[model]
+    input_tokens = tokens["prompt"] - tokens["cached"]
+    cached_tokens = tokens["cached"]
+    output_tokens = tokens["completion"]
+
+    cost = (
+        (input_tokens / 1_000_000) * prices["input"] +
+        (cached_tokens / 1_000_000) * prices["cached input"] +
+        (output_tokens / 1_000_000) * prices["output"]
+    )
+    return cost
@@ -0,0 +1,64 @@
+"""
+utils/prompt_layout.py
+Request layout for provider-side prompt caching. The API reuses the longest prompt
+prefix it has seen recently (OpenAI: prompts of 1024+ tokens, matched in 128-token
+steps) and bills those tokens at the cached-input price. Calls that share a prefix
+therefore start with one system message holding all of their static instructions,
+built once per process; the user message names the task and carries what varies
+(page text, page image, page-level JSONs) at the end.
+"""
+
+import re
+
+CACHE_MIN_TOKENS = 1024
+CACHE_BLOCK_TOKENS = 128
+
+TASK_LINE_PATTERN = re.compile(r"^Task: (\w+)")
+
+
+def task_line(call_type: str) -> str:
+    """
+    First line of the user message, telling the model which section of the shared prefix applies.
+    """
+    return f"Task: {call_type}"
+
+
+def build_prefix(tasks: dict[str, str]) -> str:
+    """
+    Shared system message: the full static instructions of every task, each under its task line.
+    """
+    names = " or ".join(f"'{task_line(name)}'" for name in tasks)
+    return (
+        "You work on Swedish housing inspection reports. "
+        f"Each request starts with {names}: follow only the instructions of that task.\n"
+        + "".join(f"\n## {task_line(name)}\n\n{instructions.strip()}\n" for name, instructions in tasks.items())
+    )
+
+
+def build_messages(prompt: str, page_text: str | None = None, image_url: str | None = None,
+                   system_prefix: str | None = None) -> list[dict]:
+    """
+    Chat messages for one call. Without a system_prefix this is the single user message
+    the pipeline has always sent (prompt, then page text or image).
+    """
+    text = prompt if page_text is None else prompt + "\n\nPage text:\n\"\"\"\n" + page_text + "\n\"\"\""
+    if image_url is None:
+        user = {"role": "user", "content": text}
+    else:
+        user = {"role": "user", "content": [
+            {"type": "text", "text": text},
+            {"type": "image_url", "image_url": {"url": image_url}},
+        ]}
+    if system_prefix is None:
+        return [user]
+    return [{"role": "system", "content": system_prefix}, user]
+
+
+def cacheable_tokens(prefix_tokens: int) -> int:
+    """
+    Tokens of a matching prefix the provider can bill as cached: none below
+    CACHE_MIN_TOKENS, otherwise rounded down to a whole CACHE_BLOCK_TOKENS step.
+    """
+    if prefix_tokens < CACHE_MIN_TOKENS:
+        return 0
+    return CACHE_MIN_TOKENS + (prefix_tokens - CACHE_MIN_TOKENS) // CACHE_BLOCK_TOKENS * CACHE_BLOCK_TOKENS
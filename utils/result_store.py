@@ -0,0 +1,439 @@
+"""
+utils/result_store.py
+Consolidated SQLite store for extraction results, alongside the per-PDF JSON files
+(which stay the source of truth, since ground truth is annotated there):
+
+    documents     one row per (run_id, pdf_id): the final model output
+    pages         one row per (run_id, pdf_id, page): the page-level results
+    field_values  one row per (run_id, pdf_id, field path): flattened values for analysis
+    confidences   one row per (run_id, pdf_id, page, field path): logprob confidence of a
+                  page-level or (page -1) the final value, plus the document score
+    annotations   one row per pdf_id: the current ground truth, independent of runs
+
+Extraction appends under its batch id, so every batch's outputs are kept rather than
+overwritten. Analysis opens the database read-only with memory-mapped I/O.
+
+    python -m utils.result_store import                       # data/evaluation, data/page_logs, data/baseline_*
+    python -m utils.result_store export --run latest --out data/evaluation --pages-out data/page_logs
+    python -m utils.result_store runs
+"""
+
+import argparse
+import glob
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+from schema.compiled import SCHEMA
+
+STORE_PATH = os.path.join("data", "results.sqlite")
+MMAP_SIZE = 512 * 1024 * 1024
+CURRENT_RUN = "current"  # run id for the outputs imported from data/evaluation and data/page_logs
+LATEST_RUN = "latest"    # pseudo run: the most recent document per pdf_id across all runs
+DOCUMENT_PAGE = -1       # confidences of the synthesized (final) values
+DOCUMENT_SCORE = "*"     # field name of the document-level confidence score
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id      TEXT PRIMARY KEY,
+    created_at  TEXT NOT NULL,
+    source      TEXT,
+    notes       TEXT
+);
+CREATE TABLE IF NOT EXISTS documents (
+    run_id        TEXT NOT NULL,
+    pdf_id        TEXT NOT NULL,
+    model_output  TEXT NOT NULL,
+    ground_truth  TEXT,              -- snapshot, only where it differs from annotations
+    created_at    TEXT NOT NULL,
+    PRIMARY KEY (run_id, pdf_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS documents_pdf ON documents (pdf_id, created_at);
+CREATE TABLE IF NOT EXISTS pages (
+    run_id  TEXT NOT NULL,
+    pdf_id  TEXT NOT NULL,
+    page    INTEGER NOT NULL,
+    result  TEXT NOT NULL,
+    PRIMARY KEY (run_id, pdf_id, page)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS field_values (
+    run_id  TEXT NOT NULL,
+    pdf_id  TEXT NOT NULL,
+    field   TEXT NOT NULL,
+    value,
+    PRIMARY KEY (run_id, pdf_id, field)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS field_values_field ON field_values (field, run_id);
+CREATE TABLE IF NOT EXISTS confidences (
+    run_id      TEXT NOT NULL,
+    pdf_id      TEXT NOT NULL,
+    page        INTEGER NOT NULL,
+    field       TEXT NOT NULL,
+    confidence  REAL NOT NULL,
+    PRIMARY KEY (run_id, pdf_id, page, field)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS annotations (
+    pdf_id        TEXT PRIMARY KEY,
+    ground_truth  TEXT NOT NULL,
+    updated_at    TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE VIEW IF NOT EXISTS latest_documents AS
+    SELECT run_id, pdf_id, model_output, ground_truth, created_at FROM (
+        SELECT *, ROW_NUMBER() OVER (PARTITION BY pdf_id ORDER BY created_at DESC, run_id DESC) AS rn
+        FROM documents
+    ) WHERE rn = 1;
+"""
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, ensure_ascii=False)
+
+
+def flatten_fields(output: dict) -> list[tuple[str, object]]:
+    """
+    (field path, value) pairs of a model output, following the compiled schema.
+    Booleans are stored as 0/1 and non-scalar values as JSON text.
+    """
+    pairs = []
+    for name in SCHEMA.fields:
+        value = output.get(name)
+        if name in SCHEMA.subfields and isinstance(value, dict):
+            pairs.extend((f"{name}.{key}", _scalar(value.get(key))) for key in SCHEMA.subfields[name])
+        else:
+            pairs.append((name, _scalar(value)))
+    return pairs
+
+
+def _file_time(path: str) -> str:
+    return datetime.fromtimestamp(os.path.getmtime(path)).isoformat(timespec="microseconds")
+
+
+def _scalar(value):
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return _dumps(value)
+
+
+class ResultStore:
+    """
+    Thin wrapper around one SQLite connection. Writes are serialized by a lock so
+    the store can be shared between extraction threads.
+    """
+
+    def __init__(self, path: str = STORE_PATH, readonly: bool = False):
+        self.path = path
+        self._lock = threading.Lock()
+        if readonly:
+            self.conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self.conn = sqlite3.connect(path, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.executescript(SCHEMA_SQL)
+        self.conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # === Writing ===
+
+    def ensure_run(self, run_id: str, source: str | None = None, notes: str | None = None):
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO runs (run_id, created_at, source, notes) VALUES (?, ?, ?, ?)",
+                (run_id, datetime.now().isoformat(timespec="seconds"), source, notes),
+            )
+
+    def _write_document(self, run_id: str, pdf_id: str, model_output: dict,
+                        ground_truth_snapshot: dict | None, created_at: str):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO documents (run_id, pdf_id, model_output, ground_truth, created_at) VALUES (?, ?, ?, ?, ?)",
+            (run_id, pdf_id, _dumps(model_output),
+             None if ground_truth_snapshot is None else _dumps(ground_truth_snapshot), created_at),
+        )
+        self.conn.execute("DELETE FROM field_values WHERE run_id = ? AND pdf_id = ?", (run_id, pdf_id))
+        self.conn.executemany(
+            "INSERT INTO field_values (run_id, pdf_id, field, value) VALUES (?, ?, ?, ?)",
+            [(run_id, pdf_id, field, value) for field, value in flatten_fields(model_output)],
+        )
+
+    def _write_pages(self, run_id: str, pdf_id: str, page_results: list):
+        self.conn.execute("DELETE FROM pages WHERE run_id = ? AND pdf_id = ?", (run_id, pdf_id))
+        self.conn.executemany(
+            "INSERT INTO pages (run_id, pdf_id, page, result) VALUES (?, ?, ?, ?)",
+            [(run_id, pdf_id, i, _dumps(result)) for i, result in enumerate(page_results)],
+        )
+
+    def append_document(self, run_id: str, pdf_id: str, model_output: dict):
+        with self._lock, self.conn:
+            self._write_document(run_id, str(pdf_id), model_output, None, datetime.now().isoformat(timespec="microseconds"))
+
+    def append_pages(self, run_id: str, pdf_id: str, page_results: list):
+        with self._lock, self.conn:
+            self._write_pages(run_id, str(pdf_id), page_results)
+
+    def append_confidences(self, run_id: str, pdf_id: str, page_confidences: list[dict | None],
+                           document: dict | None, document_score: float | None):
+        """
+        Replaces the stored confidences of one extraction: per page (None for pages without
+        logprobs, e.g. reused or unparsable ones), of the final values and the document score.
+        """
+        rows = [(page, field, c) for page, conf in enumerate(page_confidences) for field, c in (conf or {}).items()]
+        rows += [(DOCUMENT_PAGE, field, c) for field, c in (document or {}).items()]
+        if document_score is not None:
+            rows.append((DOCUMENT_PAGE, DOCUMENT_SCORE, document_score))
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM confidences WHERE run_id = ? AND pdf_id = ?", (run_id, str(pdf_id)))
+            self.conn.executemany(
+                "INSERT INTO confidences (run_id, pdf_id, page, field, confidence) VALUES (?, ?, ?, ?, ?)",
+                [(run_id, str(pdf_id), page, field, c) for page, field, c in rows],
+            )
+
+    def set_annotation(self, pdf_id: str, ground_truth: dict):
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO annotations (pdf_id, ground_truth, updated_at) VALUES (?, ?, ?)",
+                (str(pdf_id), _dumps(ground_truth), datetime.now().isoformat(timespec="seconds")),
+            )
+
+    # === Import / export of the JSON layout ===
+
+    def import_evaluation_folder(self, folder: str, run_id: str, authoritative: bool = False) -> int:
+        """
+        Imports {pdf_id}.json evaluation files as documents of run_id. With authoritative,
+        their ground truth replaces the annotations; otherwise it only fills in missing
+        annotations and is kept as a per-document snapshot where it differs.
+        """
+        paths = sorted(glob.glob(os.path.join(folder, "*.json")))
+        # Documents are dated by file mtime, i.e. when that output was written
+        mtimes = {path: _file_time(path) for path in paths}
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO runs (run_id, created_at, source) VALUES (?, ?, ?)",
+                (run_id, min(mtimes.values(), default=datetime.now().isoformat(timespec="microseconds")), folder),
+            )
+            annotations = dict(self.conn.execute("SELECT pdf_id, ground_truth FROM annotations"))
+            for path in paths:
+                created_at = mtimes[path]
+                with open(path, encoding="utf-8") as f:
+                    sample = json.load(f)
+                pdf_id = str(sample.get("pdf_id", os.path.basename(path)[:-len(".json")]))
+                truth = sample.get("ground_truth")
+                truth_json = None if truth is None else _dumps(truth)
+
+                snapshot = None
+                if truth_json is not None and (authoritative or pdf_id not in annotations):
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO annotations (pdf_id, ground_truth, updated_at) VALUES (?, ?, ?)",
+                        (pdf_id, truth_json, created_at),
+                    )
+                    annotations[pdf_id] = truth_json
+                elif truth_json != annotations.get(pdf_id):
+                    snapshot = truth
+                self._write_document(run_id, pdf_id, sample["model_output"], snapshot, created_at)
+        return len(paths)
+
+    def import_page_logs(self, folder: str, run_id: str) -> int:
+        paths = sorted(glob.glob(os.path.join(folder, "*_pages.json")))
+        with self._lock, self.conn:
+            for path in paths:
+                with open(path, encoding="utf-8") as f:
+                    self._write_pages(run_id, os.path.basename(path)[:-len("_pages.json")], json.load(f))
+        return len(paths)
+
+    def import_data_dir(self, data_dir: str = "data") -> dict:
+        """
+        Imports the existing layout: data/evaluation and data/page_logs as CURRENT_RUN
+        (their ground truth is authoritative), then every data/baseline_* folder as a run
+        named after the folder.
+        """
+        self.conn.execute("PRAGMA synchronous=OFF")
+        counts = {}
+        try:
+            counts[CURRENT_RUN] = self.import_evaluation_folder(os.path.join(data_dir, "evaluation"), CURRENT_RUN, authoritative=True)
+            counts["pages"] = self.import_page_logs(os.path.join(data_dir, "page_logs"), CURRENT_RUN)
+            for folder in sorted(glob.glob(os.path.join(data_dir, "baseline_*"))):
+                counts[os.path.basename(folder)] = self.import_evaluation_folder(folder, os.path.basename(folder))
+        finally:
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+        return counts
+
+    def _documents_query(self, run_id: str) -> tuple[str, tuple]:
+        if run_id == LATEST_RUN:
+            return "SELECT d.run_id, d.pdf_id, d.model_output, COALESCE(d.ground_truth, a.ground_truth) " \
+                   "FROM latest_documents d LEFT JOIN annotations a USING (pdf_id) ORDER BY d.pdf_id", ()
+        return "SELECT d.run_id, d.pdf_id, d.model_output, COALESCE(d.ground_truth, a.ground_truth) " \
+               "FROM documents d LEFT JOIN annotations a USING (pdf_id) WHERE d.run_id = ? ORDER BY d.pdf_id", (run_id,)
+
+    def load_samples(self, run_id: str = LATEST_RUN) -> list[dict]:
+        """
+        Evaluation samples ({"pdf_id", "model_output", "ground_truth"}) of one run, as
+        they would be read from an evaluation folder. Missing annotations become the
+        default all-false ground truth, like save_evaluation_json writes them.
+        """
+        samples = []
+        query, params = self._documents_query(run_id)
+        for _, pdf_id, model_output, ground_truth in self.conn.execute(query, params):
+            samples.append({
+                "pdf_id": pdf_id,
+                "model_output": json.loads(model_output),
+                "ground_truth": json.loads(ground_truth) if ground_truth else SCHEMA.default_ground_truth(),
+            })
+        return samples
+
+    def latest_output(self, pdf_id: str) -> dict | None:
+        """
+        Most recent model output stored for pdf_id across all runs, or None.
+        """
+        row = self.conn.execute(
+            "SELECT model_output FROM documents WHERE pdf_id = ? ORDER BY created_at DESC, run_id DESC LIMIT 1",
+            (str(pdf_id),),
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def latest_runs(self) -> dict[str, str]:
+        """
+        {pdf_id: run_id of its most recent document}.
+        """
+        return dict(self.conn.execute("SELECT pdf_id, run_id FROM latest_documents"))
+
+    def read_pages(self, run_id: str, pdf_id: str) -> list:
+        """
+        Page-level results of one extraction, in page order ([] if none were stored).
+        """
+        rows = self.conn.execute(
+            "SELECT result FROM pages WHERE run_id = ? AND pdf_id = ? ORDER BY page", (run_id, str(pdf_id))
+        ).fetchall()
+        return [json.loads(r) for (r,) in rows]
+
+    def read_confidences(self, run_id: str, pdf_id: str) -> tuple[dict, dict[int, dict], float | None]:
+        """
+        Confidences of one extraction: ({field: final value confidence}, {page: {field: confidence}},
+        document score), all empty/None if the extraction stored none.
+        """
+        document, pages, score = {}, {}, None
+        for page, field, c in self.conn.execute(
+            "SELECT page, field, confidence FROM confidences WHERE run_id = ? AND pdf_id = ?", (run_id, str(pdf_id))
+        ):
+            if page != DOCUMENT_PAGE:
+                pages.setdefault(page, {})[field] = c
+            elif field == DOCUMENT_SCORE:
+                score = c
+            else:
+                document[field] = c
+        return document, pages, score
+
+    def export_run(self, run_id: str, out_dir: str, pages_out_dir: str | None = None) -> int:
+        """
+        Writes a run back to the per-PDF JSON layout (same formatting as the pipeline).
+        """
+        os.makedirs(out_dir, exist_ok=True)
+        samples = self.load_samples(run_id)
+        for sample in samples:
+            with open(os.path.join(out_dir, f"{sample['pdf_id']}.json"), "w", encoding="utf-8") as f:
+                json.dump(sample, f, indent=2, ensure_ascii=False)
+
+        if pages_out_dir:
+            os.makedirs(pages_out_dir, exist_ok=True)
+            if run_id == LATEST_RUN:
+                # Pages of the latest document, or of the last run that logged pages for that PDF
+                pdf_runs = dict(self.conn.execute(
+                    "SELECT p.pdf_id, COALESCE(l.run_id, MAX(p.run_id)) FROM pages p "
+                    "LEFT JOIN latest_documents l USING (pdf_id) GROUP BY p.pdf_id"
+                ))
+            else:
+                pdf_runs = dict(self.conn.execute("SELECT DISTINCT pdf_id, run_id FROM pages WHERE run_id = ?", (run_id,)))
+            for pdf_id, page_run in pdf_runs.items():
+                rows = self.conn.execute(
+                    "SELECT result FROM pages WHERE run_id = ? AND pdf_id = ? ORDER BY page", (page_run, pdf_id)
+                ).fetchall()
+                if rows:
+                    with open(os.path.join(pages_out_dir, f"{pdf_id}_pages.json"), "w", encoding="utf-8") as f:
+                        json.dump([json.loads(r) for (r,) in rows], f, indent=2, ensure_ascii=False)
+        return len(samples)
+
+    # === Analysis ===
+
+    def runs(self) -> list[dict]:
+        rows = self.conn.execute(
+            "SELECT r.run_id, r.created_at, r.source, COUNT(d.pdf_id) FROM runs r "
+            "LEFT JOIN documents d USING (run_id) GROUP BY r.run_id ORDER BY r.created_at"
+        ).fetchall()
+        return [{"run_id": r, "created_at": c, "source": s, "documents": n} for r, c, s, n in rows]
+
+    def read_documents(self, run_id: str | None = None):
+        """
+        Documents as a DataFrame (JSON columns left as text).
+        """
+        import pandas as pd
+
+        if run_id is None:
+            return pd.read_sql_query("SELECT * FROM documents", self.conn)
+        query, params = self._documents_query(run_id)
+        return pd.read_sql_query(query, self.conn, params=params).set_axis(
+            ["run_id", "pdf_id", "model_output", "ground_truth"], axis=1
+        )
+
+    def read_fields(self, run_id: str):
+        """
+        Wide DataFrame of one run's flattened field values: one row per pdf_id, one
+        column per field path.
+        """
+        import pandas as pd
+
+        long = pd.read_sql_query(
+            "SELECT pdf_id, field, value FROM field_values WHERE run_id = ?", self.conn, params=(run_id,)
+        )
+        return long.pivot(index="pdf_id", columns="field", values="value")
+
+
+def open_readonly(path: str = STORE_PATH) -> ResultStore:
+    """
+    Read-only, memory-mapped connection for analysis scripts.
+    """
+    return ResultStore(path, readonly=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Consolidated result store")
+    parser.add_argument("--db", default=STORE_PATH)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_import = sub.add_parser("import", help="Import data/evaluation, data/page_logs and data/baseline_*")
+    p_import.add_argument("--data-dir", default="data")
+
+    p_export = sub.add_parser("export", help="Write a run back to the per-PDF JSON layout")
+    p_export.add_argument("--run", default=LATEST_RUN)
+    p_export.add_argument("--out", required=True)
+    p_export.add_argument("--pages-out")
+
+    sub.add_parser("runs", help="List runs")
+    args = parser.parse_args()
+
+    if args.command == "import":
+        with ResultStore(args.db) as store:
+            counts = store.import_data_dir(args.data_dir)
+        for run_id, n in counts.items():
+            print(f"📥 {run_id:<28} {n} files")
+        print(f"✅ Imported into {args.db}")
+    elif args.command == "export":
+        with open_readonly(args.db) as store:
+            n = store.export_run(args.run, args.out, args.pages_out)
+        print(f"📤 Exported {n} documents of run '{args.run}' to {args.out}")
+    else:
+        with open_readonly(args.db) as store:
+            for run in store.runs():
+                print(f"{run['created_at']}  {run['run_id']:<28} {run['documents']:>6} docs  {run['source'] or ''}")
+
+
+if __name__ == "__main__":
+    main()
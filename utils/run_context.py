@@ -0,0 +1,239 @@
+"""
+utils/run_context.py
+Token and cost accounting for one extraction run (a batch). Every API call is
+recorded on the meter of the PDF it belongs to and added to the run's totals per
+call type and per model; each finished PDF is streamed as one row to the batch's
+per_pdf_costs.csv, and the batch summary row is written when the run ends.
+
+All counters are updated under the run's lock, so PDFs can be extracted from
+several threads at once without losing or double-counting tokens.
+"""
+
+import csv
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime
+
+from utils.helpers import log_batch_summary, log_pdf_usage
+from utils.pricing import PRICES, cost_usd
+from utils.run_registry import BATCH_SUMMARY_CSV, PER_PDF_COSTS_DIR
+
+PARSE_STATS = ("page_repaired", "page_retries", "page_failures", "synthesis_retries", "synthesis_failures")
+
+# Batch ids handed out in this process, so two runs started in the same minute don't share one
+_used_batch_ids = set()
+_ids_lock = threading.Lock()
+
+
+def _tokens() -> dict:
+    return {"prompt": 0, "completion": 0, "cached": 0}
+
+
+def usage_tokens(usage) -> dict:
+    """
+    {"prompt", "completion", "cached"} token counts of an API usage object.
+    """
+    return {
+        "prompt": usage.prompt_tokens,
+        "completion": usage.completion_tokens,
+        "cached": usage.prompt_tokens_details.cached_tokens,
+    }
+
+
+def _add(total: dict, tokens: dict):
+    for key, n in tokens.items():
+        total[key] += n
+
+
+def new_batch_id(start_time: datetime, costs_dir: str = PER_PDF_COSTS_DIR) -> str:
+    """
+    batch_YYYY-MM-DD_HHMM, with a _2, _3, ... suffix if that batch already exists.
+    """
+    base = start_time.strftime("batch_%Y-%m-%d_%H%M")
+    with _ids_lock:
+        batch_id, n = base, 1
+        while batch_id in _used_batch_ids or os.path.exists(os.path.join(costs_dir, batch_id)):
+            n += 1
+            batch_id = f"{base}_{n}"
+        _used_batch_ids.add(batch_id)
+    return batch_id
+
+
+class PdfMeter:
+    """
+    Token totals of one PDF while it is being extracted. Each extraction gets its own
+    meter, so a PDF extracted twice in a run is counted twice, not merged.
+    """
+
+    def __init__(self, run: "RunContext", pdf_id: str, model: str):
+        self.run = run
+        self.pdf_id = pdf_id
+        self.model = model
+        self.by_model = defaultdict(_tokens)
+
+    def add(self, call_type: str, usage, model: str | None = None) -> dict:
+        """
+        Records one API call and returns its token counts (calls without usage count as zero).
+        """
+        if usage is None:
+            return _tokens()
+        tokens = usage_tokens(usage)
+        model = model or self.model
+        with self.run._lock:
+            _add(self.by_model[model], tokens)
+            _add(self.run.call_tokens[call_type], tokens)
+            _add(self.run.model_tokens[model], tokens)
+            self.run.calls[call_type] += 1
+        return tokens
+
+    @property
+    def tokens(self) -> dict:
+        total = _tokens()
+        with self.run._lock:
+            for tokens in self.by_model.values():
+                _add(total, tokens)
+        return total
+
+    def cost(self) -> float:
+        with self.run._lock:
+            return sum(cost_usd(tokens, model=model) for model, tokens in self.by_model.items())
+
+
+class RunContext:
+    """
+    Counters, log paths and timing of one batch.
+    """
+
+    def __init__(self, model: str, batch_id: str | None = None, costs_dir: str = PER_PDF_COSTS_DIR,
+                 summary_csv: str = BATCH_SUMMARY_CSV):
+        self.model = model
+        self.start_time = datetime.now()
+        self.batch_id = batch_id or new_batch_id(self.start_time, costs_dir)
+        # The batch folder is created by the first write into it (per-PDF costs, trace or metrics)
+        self.batch_dir = os.path.join(costs_dir, self.batch_id)
+        self.pdf_csv = os.path.join(self.batch_dir, "per_pdf_costs.csv")
+        self.call_csv = os.path.join(self.batch_dir, "call_types.csv")
+        self.summary_csv = summary_csv
+
+        self._lock = threading.Lock()
+        self.call_tokens = defaultdict(_tokens)
+        self.model_tokens = defaultdict(_tokens)
+        self.calls = defaultdict(int)
+        self.parse_stats = dict.fromkeys(PARSE_STATS, 0)
+        self.pdf_costs = {}
+        self.num_pdfs = 0
+        self.pages = 0
+
+    def start_pdf(self, pdf_id: str) -> PdfMeter:
+        return PdfMeter(self, pdf_id, self.model)
+
+    def count(self, stat: str, n: int = 1):
+        with self._lock:
+            self.parse_stats[stat] += n
+
+    def finish_pdf(self, meter: PdfMeter, extraction_strategy: str, pages_extracted: int) -> float:
+        """
+        Counts a fully extracted PDF and appends its row to per_pdf_costs.csv. Returns its cost.
+        """
+        tokens, cost = meter.tokens, meter.cost()
+        with self._lock:
+            self.num_pdfs += 1
+            self.pages += pages_extracted
+            self.pdf_costs[meter.pdf_id] = {**tokens, "cost_usd": cost}
+            log_pdf_usage(
+                csv_path=self.pdf_csv,
+                pdf_id=meter.pdf_id,
+                model=meter.model,
+                extraction_strategy=extraction_strategy,  # "page-by-page", "text-layer" or "hybrid"
+                prompt_tokens=tokens["prompt"],
+                completion_tokens=tokens["completion"],
+                cached_tokens=tokens["cached"],
+                total_cost_usd=cost,
+                pages_extracted=pages_extracted,
+            )
+        return cost
+
+    def pdf_cost(self, pdf_id: str) -> dict | None:
+        """
+        Tokens and cost of the last finished extraction of pdf_id in this run.
+        """
+        with self._lock:
+            return self.pdf_costs.get(pdf_id)
+
+    @property
+    def tokens(self) -> dict:
+        """
+        Tokens of every recorded call, including PDFs that did not finish.
+        """
+        total = _tokens()
+        with self._lock:
+            for tokens in self.model_tokens.values():
+                _add(total, tokens)
+        return total
+
+    def cost(self) -> float:
+        with self._lock:
+            return sum(cost_usd(tokens, model=model) for model, tokens in self.model_tokens.items())
+
+    def call_costs(self) -> dict:
+        """
+        {call_type: {"calls", "prompt", "completion", "cached", "cache_hit_ratio", "cached_savings_usd"}}
+        for this run. The savings are the cached prompt tokens at the full minus the cached input price.
+        """
+        prices = PRICES[self.model]
+        discount = (prices["input"] - prices["cached input"]) / 1_000_000
+        with self._lock:
+            return {
+                call_type: {
+                    "calls": self.calls[call_type],
+                    **tokens,
+                    "cache_hit_ratio": tokens["cached"] / tokens["prompt"] if tokens["prompt"] else 0.0,
+                    "cached_savings_usd": tokens["cached"] * discount,
+                }
+                for call_type, tokens in sorted(self.call_tokens.items())
+            }
+
+    def write_call_costs(self, latency_s: dict | None = None) -> dict:
+        """
+        Writes call_costs() to the batch's call_types.csv, with the mean API latency per
+        call type if given, and returns the rows.
+        """
+        rows = self.call_costs()
+        latency_s = latency_s or {}
+        if not rows:
+            return rows
+        os.makedirs(self.batch_dir, exist_ok=True)
+        with open(self.call_csv, mode="w", newline="", encoding="utf-8") as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=["call_type", *next(iter(rows.values())), "mean_latency_s"])
+            writer.writeheader()
+            for call_type, row in rows.items():
+                writer.writerow({
+                    "call_type": call_type,
+                    **row,
+                    "cache_hit_ratio": round(row["cache_hit_ratio"], 4),
+                    "cached_savings_usd": round(row["cached_savings_usd"], 6),
+                    "mean_latency_s": round(latency_s[call_type], 3) if call_type in latency_s else "",
+                })
+        return rows
+
+    def elapsed_s(self) -> float:
+        return (datetime.now() - self.start_time).total_seconds()
+
+    def write_summary(self, extraction_strategy: str = "multipage") -> float:
+        """
+        Appends the batch summary row and returns the batch cost.
+        """
+        tokens, cost = self.tokens, self.cost()
+        log_batch_summary(
+            csv_path=self.summary_csv,
+            batch_id=self.batch_id,
+            model=self.model,
+            extraction_strategy=extraction_strategy,
+            num_pdfs=self.num_pdfs,
+            prompt_tokens=tokens["prompt"],
+            completion_tokens=tokens["completion"],
+            cached_tokens=tokens["cached"],
+            total_cost_usd=cost,
+        )
+        return cost
@@ -0,0 +1,399 @@
+"""
+utils/run_registry.py
+Append-only registry of extraction batches and evaluation runs, in one indexed
+SQLite file. Each batch is recorded once with its configuration (model, strategy,
+DPI, prompt hashes), token/cost totals and latency; every evaluation appends a row
+with its metrics, linked to the batch it scored.
+
+    runs         one row per batch_id: config, cost and latency totals
+    evaluations  one row per evaluation: metrics, optionally linked to a run_id
+    evaluation_intervals  bootstrap confidence intervals of an evaluation, per field and overall
+    run_metrics  view: each run with its most recent evaluation and derived cost metrics
+
+    python -m utils.run_registry import                 # backfill from the CSV logs
+    python -m utils.run_registry evaluate --run <batch_id>
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sqlite3
+from datetime import datetime
+
+REGISTRY_PATH = os.path.join("data", "logs", "run_registry.sqlite")
+BATCH_SUMMARY_CSV = os.path.join("data", "logs", "batch_summaries.csv")
+EVALUATION_LOG_CSV = os.path.join("data", "logs", "evaluation_log.csv")
+PER_PDF_COSTS_DIR = os.path.join("data", "logs", "per_pdf_costs")
+
+METRIC_COLUMNS = ["tp", "fp", "fn", "accuracy", "precision", "recall", "f1_score"]
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id               TEXT PRIMARY KEY,
+    created_at           TEXT NOT NULL,
+    model                TEXT,
+    extraction_strategy  TEXT,
+    dpi                  INTEGER,
+    prompt_hashes        TEXT,     -- JSON {prompt name: short sha1}
+    config               TEXT,     -- JSON of the remaining settings
+    num_pdfs             INTEGER,
+    pages                INTEGER,
+    prompt_tokens        INTEGER,
+    completion_tokens    INTEGER,
+    cached_tokens        INTEGER,
+    cost_usd             REAL,
+    elapsed_s            REAL,
+    api_calls            INTEGER,
+    api_s                REAL
+);
+CREATE INDEX IF NOT EXISTS runs_created ON runs (created_at);
+CREATE TABLE IF NOT EXISTS evaluations (
+    eval_id       INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id        TEXT,
+    evaluated_at  TEXT NOT NULL,
+    run_name      TEXT,
+    notes         TEXT,
+    source        TEXT,
+    num_docs      INTEGER,
+    tp            INTEGER,
+    fp            INTEGER,
+    fn            INTEGER,
+    accuracy      REAL,
+    precision     REAL,
+    recall        REAL,
+    f1_score      REAL
+);
+CREATE INDEX IF NOT EXISTS evaluations_run ON evaluations (run_id, evaluated_at);
+CREATE INDEX IF NOT EXISTS evaluations_time ON evaluations (evaluated_at);
+CREATE UNIQUE INDEX IF NOT EXISTS evaluations_logged ON evaluations (evaluated_at, run_name);
+CREATE INDEX IF NOT EXISTS evaluations_f1 ON evaluations (f1_score);
+CREATE TABLE IF NOT EXISTS evaluation_intervals (
+    eval_id    INTEGER NOT NULL,
+    field      TEXT NOT NULL,     -- field path, or 'overall'
+    metric     TEXT NOT NULL,
+    estimate   REAL,
+    low        REAL,
+    high       REAL,
+    level      REAL,
+    resamples  INTEGER,
+    PRIMARY KEY (eval_id, field, metric)
+) WITHOUT ROWID;
+CREATE VIEW IF NOT EXISTS run_metrics AS
+    SELECT r.*, e.evaluated_at, e.run_name, e.num_docs, e.tp, e.fp, e.fn,
+           e.accuracy, e.precision, e.recall, e.f1_score,
+           r.cost_usd / NULLIF(r.num_pdfs, 0) AS cost_per_pdf,
+           -- cost per PDF over correct fields per evaluated document, so the ratio holds
+           -- even when the evaluation covered more documents than this batch produced
+           (r.cost_usd / NULLIF(r.num_pdfs, 0)) / NULLIF(CAST(e.tp AS REAL) / NULLIF(e.num_docs, 0), 0)
+               AS cost_per_correct_field,
+           e.f1_score / NULLIF(r.cost_usd / NULLIF(r.num_pdfs, 0), 0) AS f1_per_usd
+    FROM runs r
+    JOIN evaluations e ON e.eval_id = (
+        SELECT eval_id FROM evaluations WHERE run_id = r.run_id ORDER BY evaluated_at DESC, eval_id DESC LIMIT 1
+    );
+"""
+
+
+def prompt_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
+
+
+def pages_from_costs_csv(path: str) -> int | None:
+    """
+    Total pages_extracted in a batch's per_pdf_costs.csv, None if the file is missing.
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, newline="", encoding="utf-8") as f:
+        return sum(int(row.get("pages_extracted") or 0) for row in csv.DictReader(f))
+
+
+def _float(value):
+    return None if value in (None, "") else float(value)
+
+
+def _int(value):
+    return None if value in (None, "") else int(float(value))
+
+
+class RunRegistry:
+    """
+    Thin wrapper around the registry database. Rows are only ever inserted. A new
+    database is backfilled from the CSV logs when it is created (counts in self.imported).
+    """
+
+    def __init__(self, path: str = REGISTRY_PATH, readonly: bool = False):
+        self.path = path
+        self.imported = None
+        created = False
+        if readonly:
+            self.conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        else:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self.conn = sqlite3.connect(path)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            created = not self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'runs'").fetchone()
+            self.conn.executescript(SCHEMA_SQL)
+        self.conn.row_factory = sqlite3.Row
+        if created:
+            self.imported = self.import_csv_logs()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # === Writing ===
+
+    def record_batch(self, run_id: str, model: str, extraction_strategy: str, dpi: int | None = None,
+                     prompt_hashes: dict | None = None, config: dict | None = None, num_pdfs: int = 0,
+                     pages: int | None = None, tokens: dict | None = None, cost_usd: float = 0.0,
+                     elapsed_s: float | None = None, api_calls: int | None = None, api_s: float | None = None,
+                     created_at: str | None = None) -> bool:
+        """
+        Records a finished batch. Returns False if run_id was already registered.
+        """
+        tokens = tokens or {}
+        with self.conn:
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO runs (run_id, created_at, model, extraction_strategy, dpi, prompt_hashes, "
+                "config, num_pdfs, pages, prompt_tokens, completion_tokens, cached_tokens, cost_usd, elapsed_s, "
+                "api_calls, api_s) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    run_id, created_at or datetime.now().isoformat(timespec="seconds"), model, extraction_strategy,
+                    dpi, json.dumps(prompt_hashes or {}, sort_keys=True), json.dumps(config or {}, sort_keys=True),
+                    num_pdfs, pages, tokens.get("prompt"), tokens.get("completion"), tokens.get("cached"),
+                    round(cost_usd, 6), elapsed_s, api_calls, api_s,
+                ),
+            )
+        return cursor.rowcount == 1
+
+    def record_evaluation(self, summary: dict, run_id: str | None = None, run_name: str = "", notes: str = "",
+                          source: str | None = None, num_docs: int | None = None,
+                          evaluated_at: str | None = None, intervals: dict | None = None,
+                          level: float | None = None, resamples: int | None = None) -> int | None:
+        """
+        Appends an evaluation (a compute_summary_stats dict) and returns its eval_id, or None
+        if an evaluation with the same evaluated_at and run_name is already recorded.
+        intervals ({field: {metric: {"estimate", "low", "high"}}}, see evaluation/bootstrap.py)
+        are stored alongside it.
+        """
+        with self.conn:
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO evaluations (run_id, evaluated_at, run_name, notes, source, num_docs, "
+                "tp, fp, fn, accuracy, precision, recall, f1_score) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    run_id, evaluated_at or datetime.now().isoformat(), run_name, notes, source, num_docs,
+                    *(summary.get(col) for col in METRIC_COLUMNS),
+                ),
+            )
+            if cursor.rowcount != 1:
+                return None
+            self.conn.executemany(
+                "INSERT INTO evaluation_intervals (eval_id, field, metric, estimate, low, high, level, resamples) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (cursor.lastrowid, field, metric, i["estimate"], i["low"], i["high"], level, resamples)
+                    for field, field_intervals in (intervals or {}).items()
+                    for metric, i in field_intervals.items()
+                ],
+            )
+        return cursor.lastrowid
+
+    # === Queries ===
+
+    def latest_run_id(self) -> str | None:
+        row = self.conn.execute("SELECT run_id FROM runs ORDER BY created_at DESC LIMIT 1").fetchone()
+        return row["run_id"] if row else None
+
+    def get_run(self, run_id: str) -> dict | None:
+        row = self.conn.execute("SELECT * FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+        return dict(row) if row else None
+
+    def recent_evaluations(self, limit: int = 10) -> list[dict]:
+        """
+        The last evaluations, oldest first, with the bounds of their overall F1 interval (or None).
+        """
+        if not self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'evaluation_intervals'").fetchone():
+            # Registry written before intervals were recorded, opened read-only
+            rows = self.conn.execute(
+                "SELECT *, NULL AS f1_low, NULL AS f1_high FROM "
+                "(SELECT * FROM evaluations ORDER BY evaluated_at DESC LIMIT ?) ORDER BY evaluated_at",
+                (limit,),
+            )
+            return [dict(row) for row in rows]
+        rows = self.conn.execute(
+            "SELECT e.*, i.low AS f1_low, i.high AS f1_high FROM "
+            "(SELECT * FROM evaluations ORDER BY evaluated_at DESC LIMIT ?) e "
+            "LEFT JOIN evaluation_intervals i ON i.eval_id = e.eval_id AND i.field = 'overall' AND i.metric = 'f1_score' "
+            "ORDER BY e.evaluated_at",
+            (limit,),
+        )
+        return [dict(row) for row in rows]
+
+    def evaluation_intervals(self, eval_id: int) -> dict:
+        """
+        {field: {metric: {"estimate", "low", "high"}}} stored with an evaluation.
+        """
+        intervals = {}
+        for row in self.conn.execute(
+            "SELECT field, metric, estimate, low, high FROM evaluation_intervals WHERE eval_id = ?", (eval_id,)
+        ):
+            intervals.setdefault(row["field"], {})[row["metric"]] = {
+                "estimate": row["estimate"], "low": row["low"], "high": row["high"],
+            }
+        return intervals
+
+    def best_evaluation(self) -> dict | None:
+        row = self.conn.execute(
+            "SELECT * FROM evaluations WHERE f1_score IS NOT NULL ORDER BY f1_score DESC, evaluated_at DESC LIMIT 1"
+        ).fetchone()
+        return dict(row) if row else None
+
+    def mean_metrics_since(self, since: str) -> dict | None:
+        row = self.conn.execute(
+            "SELECT COUNT(*) AS n, AVG(accuracy) AS accuracy, AVG(precision) AS precision, "
+            "AVG(recall) AS recall, AVG(f1_score) AS f1_score FROM evaluations WHERE evaluated_at >= ?",
+            (since,),
+        ).fetchone()
+        return dict(row) if row["n"] else None
+
+    def f1_history(self) -> list[tuple[str, float]]:
+        return [tuple(row) for row in self.conn.execute(
+            "SELECT evaluated_at, f1_score FROM evaluations WHERE f1_score IS NOT NULL ORDER BY evaluated_at"
+        )]
+
+    def run_metrics(self, limit: int | None = None) -> list[dict]:
+        """
+        Evaluated runs, most recent first, with cost_per_pdf, cost_per_correct_field and f1_per_usd.
+        """
+        query = "SELECT * FROM run_metrics ORDER BY created_at DESC"
+        params = ()
+        if limit:
+            query += " LIMIT ?"
+            params = (limit,)
+        return [dict(row) for row in self.conn.execute(query, params)]
+
+    # === Backfill ===
+
+    def import_csv_logs(self, batch_csv: str = BATCH_SUMMARY_CSV, evaluation_csv: str = EVALUATION_LOG_CSV,
+                        costs_dir: str = PER_PDF_COSTS_DIR) -> dict:
+        """
+        Imports batch_summaries.csv and evaluation_log.csv. Batches already registered are
+        skipped, and so are evaluations already recorded with the same timestamp and run
+        name. Imported evaluations are not linked to a batch.
+        """
+        counts = {"runs": 0, "evaluations": 0}
+        if os.path.exists(batch_csv):
+            with open(batch_csv, newline="", encoding="utf-8") as f:
+                for row in csv.DictReader(f):
+                    created_at = datetime.strptime(row["timestamp"], "%Y-%m-%d %H:%M:%S").isoformat()
+                    counts["runs"] += self.record_batch(
+                        run_id=row["batch_id"],
+                        model=row["model"],
+                        extraction_strategy=row["extraction_strategy"],
+                        num_pdfs=_int(row["num_pdfs"]),
+                        pages=pages_from_costs_csv(os.path.join(costs_dir, row["batch_id"], "per_pdf_costs.csv")),
+                        tokens={
+                            "prompt": _int(row["prompt_tokens"]),
+                            "completion": _int(row["completion_tokens"]),
+                            "cached": _int(row["cached_tokens"]),
+                        },
+                        cost_usd=_float(row["total_cost_usd"]) or 0.0,
+                        created_at=created_at,
+                    )
+
+        if os.path.exists(evaluation_csv):
+            with open(evaluation_csv, newline="", encoding="utf-8") as f:
+                for row in csv.DictReader(f):
+                    summary = {
+                        "tp": _int(row.get("true_positives")),
+                        "fp": _int(row.get("false_positives")),
+                        "fn": _int(row.get("false_negatives")),
+                        **{col: _float(row.get(col)) for col in ("accuracy", "precision", "recall", "f1_score")},
+                    }
+                    eval_id = self.record_evaluation(
+                        summary, run_name=row.get("run_name", ""), notes=row.get("notes", ""),
+                        source=evaluation_csv, evaluated_at=row["timestamp"],
+                    )
+                    counts["evaluations"] += eval_id is not None
+        return counts
+
+
+def open_registry(path: str = REGISTRY_PATH) -> RunRegistry:
+    """
+    Read-only connection for reporting. A missing registry is created from the CSV logs;
+    exits with a hint if there are none either.
+    """
+    if not os.path.exists(path):
+        if not (os.path.exists(BATCH_SUMMARY_CSV) or os.path.exists(EVALUATION_LOG_CSV)):
+            raise SystemExit(f"❌  No run registry at {path} and no CSV logs to backfill it from")
+        RunRegistry(path).close()
+    return RunRegistry(path, readonly=True)
+
+
+def evaluate_run(run_id: str, registry_path: str = REGISTRY_PATH, run_name: str = "", notes: str = "") -> dict:
+    """
+    Scores only the documents a batch wrote to the result store and records the
+    evaluation against that batch.
+    """
+    from evaluation.bootstrap import BOOTSTRAP_RESAMPLES, CONFIDENCE_LEVEL, bootstrap_intervals, count_matrix
+    from evaluation.evaluate_outputs import (
+        compute_summary_stats,
+        counts_to_results,
+        document_counts,
+        field_counts,
+        samples_to_table,
+        score_table,
+    )
+    from utils.result_store import open_readonly
+
+    with open_readonly() as store:
+        samples = store.load_samples(run_id)
+    if not samples:
+        raise SystemExit(f"❌  No documents for run {run_id} in the result store")
+    scored = score_table(samples_to_table(samples))
+    summary = compute_summary_stats(counts_to_results(field_counts(scored)))
+    _, fields, counts = count_matrix(document_counts(scored))
+    intervals = bootstrap_intervals(counts, fields)
+    with RunRegistry(registry_path) as registry:
+        registry.record_evaluation(summary, run_id=run_id, run_name=run_name or run_id, notes=notes,
+                                   source="result_store", num_docs=len(samples), intervals=intervals,
+                                   level=CONFIDENCE_LEVEL, resamples=BOOTSTRAP_RESAMPLES)
+    return {**summary, "intervals": intervals}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run registry: batch config, cost and evaluation metrics")
+    parser.add_argument("--db", default=REGISTRY_PATH)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("import", help="Backfill from batch_summaries.csv and evaluation_log.csv")
+    p_eval = sub.add_parser("evaluate", help="Score one batch's documents from the result store")
+    p_eval.add_argument("--run", help="Batch id (default: the latest registered batch)")
+    p_eval.add_argument("--name", default="")
+    p_eval.add_argument("--notes", default="")
+    args = parser.parse_args()
+
+    if args.command == "import":
+        with RunRegistry(args.db) as registry:
+            counts = registry.imported or registry.import_csv_logs()
+        print(f"📥 Imported {counts['runs']} batches and {counts['evaluations']} evaluations into {args.db}")
+    else:
+        run_id = args.run
+        if run_id is None:
+            with open_registry(args.db) as registry:
+                run_id = registry.latest_run_id()
+        summary = evaluate_run(run_id, args.db, args.name, args.notes)
+        f1 = summary["intervals"]["overall"]["f1_score"]
+        print(f"✅ {run_id}: F1 {summary['f1_score']:.4f} [{f1['low']:.4f}, {f1['high']:.4f}] "
+              f"(tp {summary['tp']}, fp {summary['fp']}, fn {summary['fn']})")
+
+
+if __name__ == "__main__":
+    main()
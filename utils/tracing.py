@@ -0,0 +1,288 @@
+"""
+utils/tracing.py
+Lightweight tracing for the extraction pipeline: spans with wall time, CPU time,
+bytes and peak RSS, written to a JSONL trace and aggregated into latency
+histograms that can be exported in Prometheus text format.
+
+Summarise a trace with:
+    python -m utils.tracing data/logs/per_pdf_costs/<batch_id>/trace.jsonl
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Histogram bucket upper bounds in seconds
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, float("inf"))
+
+
+def peak_rss_mb() -> float | None:
+    """
+    Peak resident set size of this process in MB, or None where it can't be read.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+class Span:
+    def __init__(self, stage: str, labels: dict):
+        self.stage = stage
+        self.labels = labels
+        self.bytes = 0
+
+    def add_bytes(self, n: int):
+        self.bytes += n
+
+    def set(self, **labels):
+        self.labels.update(labels)
+
+
+def _histograms() -> defaultdict:
+    return defaultdict(lambda: {
+        "buckets": [0] * len(LATENCY_BUCKETS), "count": 0, "sum": 0.0, "cpu": 0.0, "bytes": 0,
+    })
+
+
+class Tracer:
+    """
+    Collects finished spans. Each span is appended to trace_path (if set) as one JSON line
+    and added to the in-memory histograms for its (stage, call_type): histograms since the
+    tracer was created (Prometheus counters, never reset) and batch_histograms since the
+    trace file was last switched.
+    """
+
+    def __init__(self, trace_path: str | None = None):
+        self.trace_path = trace_path
+        self._file = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.histograms = _histograms()
+        self.batch_histograms = _histograms()
+
+    @contextmanager
+    def span(self, stage: str, **labels):
+        stack = self._local.__dict__.setdefault("stack", [])
+        parent = stack[-1].stage if stack else None
+        current = Span(stage, labels)
+        stack.append(current)
+        wall_start, cpu_start = time.perf_counter(), time.thread_time()
+        try:
+            yield current
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.thread_time() - cpu_start
+            stack.pop()
+            self._record(current, parent, wall, cpu)
+
+    def _record(self, span: Span, parent: str | None, wall: float, cpu: float):
+        record = {
+            "ts": datetime.now().isoformat(timespec="milliseconds"),
+            "stage": span.stage,
+            "parent": parent,
+            **span.labels,
+            "wall_s": round(wall, 6),
+            "cpu_s": round(cpu, 6),
+            "bytes": span.bytes,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+        key = (span.stage, span.labels.get("call_type", ""))
+
+        with self._lock:
+            for hist in (self.histograms[key], self.batch_histograms[key]):
+                for i, bound in enumerate(LATENCY_BUCKETS):
+                    if wall <= bound:
+                        hist["buckets"][i] += 1
+                        break
+                hist["count"] += 1
+                hist["sum"] += wall
+                hist["cpu"] += cpu
+                hist["bytes"] += span.bytes
+
+            if self.trace_path:
+                if self._file is None:
+                    os.makedirs(os.path.dirname(self.trace_path) or ".", exist_ok=True)
+                    self._file = open(self.trace_path, "a", encoding="utf-8")
+                self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+                self._file.flush()
+
+    def render_prometheus(self, batch: bool = False) -> str:
+        """
+        The aggregated histograms (with batch, only those of the current trace file) in
+        Prometheus text exposition format.
+        """
+        lines = [
+            "# HELP extraction_stage_seconds Wall time per extraction stage.",
+            "# TYPE extraction_stage_seconds histogram",
+        ]
+        with self._lock:
+            items = sorted((self.batch_histograms if batch else self.histograms).items())
+            for (stage, call_type), hist in items:
+                labels = f'stage="{stage}",call_type="{call_type}"'
+                cumulative = 0
+                for bound, n in zip(LATENCY_BUCKETS, hist["buckets"]):
+                    cumulative += n
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    lines.append(f'extraction_stage_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+                lines.append(f"extraction_stage_seconds_sum{{{labels}}} {hist['sum']:.6f}")
+                lines.append(f"extraction_stage_seconds_count{{{labels}}} {hist['count']}")
+
+            lines += [
+                "# HELP extraction_stage_cpu_seconds_total CPU time per extraction stage.",
+                "# TYPE extraction_stage_cpu_seconds_total counter",
+            ]
+            for (stage, call_type), hist in items:
+                lines.append(f'extraction_stage_cpu_seconds_total{{stage="{stage}",call_type="{call_type}"}} {hist["cpu"]:.6f}')
+
+            lines += [
+                "# HELP extraction_stage_bytes_total Bytes handled per extraction stage.",
+                "# TYPE extraction_stage_bytes_total counter",
+            ]
+            for (stage, call_type), hist in items:
+                lines.append(f'extraction_stage_bytes_total{{stage="{stage}",call_type="{call_type}"}} {hist["bytes"]}')
+
+        rss = peak_rss_mb()
+        if rss is not None:
+            lines += [
+                "# HELP process_peak_rss_bytes Peak resident set size of the extraction process.",
+                "# TYPE process_peak_rss_bytes gauge",
+                f"process_peak_rss_bytes {int(rss * 1024 * 1024)}",
+            ]
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str, batch: bool = False):
+        """
+        Writes render_prometheus(batch) to path.
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.render_prometheus(batch))
+
+    def switch(self, trace_path: str | None):
+        """
+        Closes the current trace file and starts the next batch on trace_path. Spans still
+        open in other threads are written to the new file when they finish.
+        """
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self.trace_path = trace_path
+            self.batch_histograms = _histograms()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+# === Process-wide tracer ===
+_tracer = Tracer()
+
+
+def configure(trace_path: str | None) -> Tracer:
+    """
+    Points the process-wide tracer at a JSONL file and starts its batch histograms.
+    The file is only created when the first span finishes.
+    """
+    _tracer.switch(trace_path)
+    return _tracer
+
+
+def get_tracer() -> Tracer:
+    return _tracer
+
+
+def span(stage: str, **labels):
+    """
+    Times a block on the process-wide tracer:
+
+        with span("download", pdf_id=pdf_id) as s:
+            ...
+            s.add_bytes(len(content))
+    """
+    return _tracer.span(stage, **labels)
+
+
+# === Summary ===
+def percentile(sorted_values: list, q: float) -> float:
+    """
+    Linear-interpolated percentile (q in 0..100) of an already sorted list.
+    """
+    if not sorted_values:
+        return float("nan")
+    pos = (len(sorted_values) - 1) * q / 100
+    lower = int(pos)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (pos - lower)
+
+
+def summarize_trace(paths: list[str]) -> list[dict]:
+    """
+    Reads JSONL traces and returns p50/p95/p99 wall time per (stage, call_type).
+    """
+    walls = defaultdict(list)
+    cpu = defaultdict(float)
+    nbytes = defaultdict(int)
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                key = (record["stage"], record.get("call_type", ""))
+                walls[key].append(record["wall_s"])
+                cpu[key] += record.get("cpu_s", 0.0)
+                nbytes[key] += record.get("bytes", 0)
+
+    rows = []
+    for key, values in walls.items():
+        values.sort()
+        rows.append({
+            "stage": key[0],
+            "call_type": key[1],
+            "count": len(values),
+            "total_s": sum(values),
+            "p50_s": percentile(values, 50),
+            "p95_s": percentile(values, 95),
+            "p99_s": percentile(values, 99),
+            "cpu_s": cpu[key],
+            "bytes": nbytes[key],
+        })
+    return sorted(rows, key=lambda r: r["total_s"], reverse=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarise extraction traces (p50/p95/p99 per stage)")
+    parser.add_argument("traces", nargs="+", help="trace.jsonl file(s)")
+    args = parser.parse_args()
+
+    rows = summarize_trace(args.traces)
+    if not rows:
+        print("⚠️ No spans found in trace.")
+        return
+
+    print(f"\n⏱️  {'stage':<16} {'call_type':<10} {'count':>6} {'total s':>9} {'p50 s':>8} {'p95 s':>8} {'p99 s':>8} {'cpu s':>8} {'MB':>8}")
+    for r in rows:
+        print(
+            f"    {r['stage']:<16} {r['call_type']:<10} {r['count']:>6} {r['total_s']:>9.2f} "
+            f"{r['p50_s']:>8.3f} {r['p95_s']:>8.3f} {r['p99_s']:>8.3f} {r['cpu_s']:>8.2f} {r['bytes'] / 1e6:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
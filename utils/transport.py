@@ -0,0 +1,468 @@
+"""
+utils/transport.py
+Pluggable transport under the GPT helpers, so the pipeline can run without live API calls.
+
+Modes (EXTRACTION_TRANSPORT):
+  live    – the real OpenAI client (default)
+  record  – live calls, with every request/response appended to a JSONL cassette
+  replay  – responses served from the cassette, falling back to answers seeded from
+            data/page_logs and data/evaluation; with injected latency and 429s
+  server  – an OpenAI client pointed at the local mock server started with
+            `python -m utils.transport serve`, which serves the same replay answers
+
+Other settings: EXTRACTION_CASSETTE, REPLAY_LATENCY_S, REPLAY_429_RATE, REPLAY_SEED,
+MOCK_SERVER_URL.
+"""
+
+import argparse
+import base64
+import glob
+import hashlib
+import json
+import math
+import os
+import random
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+from utils.prompt_layout import CACHE_BLOCK_TOKENS, TASK_LINE_PATTERN, cacheable_tokens
+
+DEFAULT_CASSETTE = os.path.join("data", "logs", "cassettes", "cassette.jsonl")
+DEFAULT_SERVER_URL = "http://127.0.0.1:8765/v1"
+CONTEXT_HEADER = "X-Replay-Context"
+
+_context = threading.local()
+
+
+def set_context(pdf_id: str | None = None, page: int | None = None) -> None:
+    """
+    Tells the transport which PDF/page the next call belongs to. Only recording and
+    replay use it (to label cassette entries and pick seeded answers); live calls ignore it.
+    """
+    _context.pdf_id = pdf_id
+    _context.page = page
+
+
+def get_context() -> dict:
+    return {"pdf_id": getattr(_context, "pdf_id", None), "page": getattr(_context, "page", None)}
+
+
+# === Request inspection ===
+def request_key(request: dict) -> str:
+    """
+    Stable hash of everything that determines a response (model, messages, format).
+    """
+    relevant = {k: request.get(k) for k in ("model", "messages", "response_format")}
+    return hashlib.sha256(json.dumps(relevant, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def _message_parts(message: dict) -> tuple[str, list[str]]:
+    content = message["content"]
+    if isinstance(content, str):
+        return content, []
+    text = "".join(part.get("text", "") for part in content if part.get("type") == "text")
+    images = [
+        part["image_url"]["url"].split(",", 1)[-1]
+        for part in content if part.get("type") == "image_url"
+    ]
+    return text, images
+
+
+def _request_parts(request: dict) -> tuple[str, list[str]]:
+    """
+    Returns (prompt text, base64 images) of a chat request, over all of its messages.
+    """
+    texts, images = [], []
+    for message in request["messages"]:
+        text, message_images = _message_parts(message)
+        texts.append(text)
+        images += message_images
+    return "\n".join(texts), images
+
+
+def classify_request(request: dict) -> str:
+    """
+    Which pipeline call a request is: "appendix", "page", "synthesis" or "other".
+    Requests with a shared system prefix name their task on the first line of the last message.
+    """
+    task = TASK_LINE_PATTERN.match(_message_parts(request["messages"][-1])[0])
+    if task and task.group(1) in ("appendix", "page", "synthesis"):
+        return task.group(1)
+
+    text, _ = _request_parts(request)
+    if "Respond strictly with one word" in text:
+        return "appendix"
+    if "list of page-level JSONs" in text:
+        return "synthesis"
+    if "housing inspection report" in text:
+        return "page"
+    return "other"
+
+
+def _png_size(b64_png: str) -> tuple[int, int] | None:
+    header = base64.b64decode(b64_png[:44])
+    if header[:8] != b"\x89PNG\r\n\x1a\n":
+        return None
+    return struct.unpack(">II", header[16:24])
+
+
+def estimate_usage(request: dict, content: str, cached_tokens: int = 0) -> dict:
+    """
+    Plausible token usage for a replayed response, using the cost estimator's formulas.
+    """
+    from utils.cost_estimator import image_tokens, text_tokens
+
+    text, images = _request_parts(request)
+    prompt_tokens = text_tokens(text)
+    for image in images:
+        size = _png_size(image)
+        prompt_tokens += image_tokens(*size) if size else 0
+    completion_tokens = max(1, text_tokens(content))
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "prompt_tokens_details": {"cached_tokens": min(cached_tokens, prompt_tokens)},
+    }
+
+
+def synthetic_logprobs(content: str) -> dict:
+    """
+    Deterministic stand-in for the logprobs of a replayed response: the content split into
+    token-sized chunks, most of them near-certain and a few hesitant, so confidence
+    scoring and the re-extraction planner have something realistic to work on offline.
+    """
+    from utils.cost_estimator import CHARS_PER_TOKEN
+
+    tokens = []
+    for start in range(0, len(content), CHARS_PER_TOKEN):
+        token = content[start:start + CHARS_PER_TOKEN]
+        digest = hashlib.md5(f"{start}:{content}".encode("utf-8")).digest()
+        r = int.from_bytes(digest[:8], "big") / 2 ** 64
+        logprob = math.log(1 - 0.6 * r ** 400)
+        tokens.append({"token": token, "bytes": list(token.encode("utf-8")), "logprob": logprob, "top_logprobs": []})
+    return {"content": tokens, "refusal": None}
+
+
+def completion_payload(model: str, content: str, usage: dict, logprobs: dict | None = None) -> dict:
+    """
+    A chat.completion response body as the API returns it.
+    """
+    return {
+        "id": "chatcmpl-replay-" + hashlib.md5(content.encode("utf-8")).hexdigest()[:12],
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "logprobs": logprobs,
+            "finish_reason": "stop",
+        }],
+        "usage": usage,
+    }
+
+
+class PromptCache:
+    """
+    Simulated provider-side prompt cache: remembers every prompt prefix at 128-token
+    boundaries and reports the longest one seen before as cached (from 1024 tokens on),
+    so replayed runs show what a prompt layout would get from the real cache.
+    """
+
+    def __init__(self):
+        self.seen = set()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _stream(request: dict) -> str:
+        # A structured-output schema is rendered ahead of the messages, so it is part of the prefix
+        parts = [request.get("model", ""), json.dumps(request.get("response_format"), sort_keys=True)]
+        for message in request["messages"]:
+            text, images = _message_parts(message)
+            parts.append(f"<{message.get('role')}>{text}")
+            parts += [f"<image {hashlib.sha1(image.encode('ascii')).hexdigest()}>" for image in images]
+        return "".join(parts)
+
+    def lookup(self, request: dict) -> int:
+        """
+        Cached prompt tokens for this request; afterwards its own prefixes count as seen.
+        """
+        from utils.cost_estimator import CHARS_PER_TOKEN
+
+        stream = self._stream(request)
+        block = CACHE_BLOCK_TOKENS * CHARS_PER_TOKEN
+        digest = hashlib.sha1()
+        keys = []
+        for end in range(block, len(stream) + 1, block):
+            digest.update(stream[end - block:end].encode("utf-8"))
+            keys.append(digest.hexdigest())
+
+        with self.lock:
+            blocks = 0
+            while blocks < len(keys) and keys[blocks] in self.seen:
+                blocks += 1
+            self.seen.update(keys)
+        return cacheable_tokens(blocks * CACHE_BLOCK_TOKENS)
+
+
+# === Replay store ===
+class ReplayStore:
+    """
+    Answers chat requests offline. Lookup order:
+      1. exact request match in the cassette,
+      2. cassette entry with the same call kind, pdf_id and page,
+      3. seeded answer built from data/page_logs (page calls, appendix yes/no)
+         and data/evaluation (synthesis). Unknown pdf_ids are mapped onto a seeded
+         PDF deterministically so synthetic IDs still get realistic answers.
+    """
+
+    def __init__(self, cassette_path: str | None = DEFAULT_CASSETTE,
+                 page_logs_dir: str = os.path.join("data", "page_logs"),
+                 evaluation_dir: str = os.path.join("data", "evaluation")):
+        self.by_key = {}
+        self.by_context = {}
+        if cassette_path and os.path.exists(cassette_path):
+            with open(cassette_path, encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    self.by_key[entry["key"]] = entry["response"]
+                    context = entry.get("context") or {}
+                    self.by_context[(entry["kind"], context.get("pdf_id"), context.get("page"))] = entry["response"]
+
+        self.page_logs = {}
+        for path in glob.glob(os.path.join(page_logs_dir, "*_pages.json")):
+            pdf_id = os.path.basename(path)[:-len("_pages.json")]
+            with open(path, encoding="utf-8") as f:
+                self.page_logs[pdf_id] = json.load(f)
+
+        self.final_outputs = {}
+        for path in glob.glob(os.path.join(evaluation_dir, "*.json")):
+            with open(path, encoding="utf-8") as f:
+                sample = json.load(f)
+            self.final_outputs[str(sample.get("pdf_id", os.path.basename(path)[:-5]))] = sample["model_output"]
+
+        self.seeded_ids = sorted(set(self.page_logs) & set(self.final_outputs))
+        self.prompt_cache = PromptCache()
+
+    def _seeded_pdf(self, pdf_id: str | None) -> str | None:
+        if pdf_id in self.page_logs:
+            return pdf_id
+        if not self.seeded_ids:
+            return None
+        digest = int(hashlib.md5(str(pdf_id).encode("utf-8")).hexdigest(), 16)
+        return self.seeded_ids[digest % len(self.seeded_ids)]
+
+    def respond(self, request: dict, context: dict | None = None) -> dict:
+        context = context or {}
+        key = request_key(request)
+        if key in self.by_key:
+            return self.by_key[key]
+
+        kind = classify_request(request)
+        pdf_id, page = context.get("pdf_id"), context.get("page")
+        if (kind, pdf_id, page) in self.by_context:
+            return self.by_context[(kind, pdf_id, page)]
+
+        seeded = self._seeded_pdf(pdf_id)
+        pages = self.page_logs.get(seeded, [])
+        page = page or 0
+        if kind == "appendix":
+            content = "yes" if page >= len(pages) else "no"
+        elif kind == "page":
+            content = json.dumps(pages[min(page, len(pages) - 1)] if pages else {}, ensure_ascii=False)
+        elif kind == "synthesis":
+            content = json.dumps(self.final_outputs.get(seeded, {}), ensure_ascii=False)
+        else:
+            content = "Hej!"
+
+        usage = estimate_usage(request, content, self.prompt_cache.lookup(request))
+        logprobs = synthetic_logprobs(content) if request.get("logprobs") else None
+        return completion_payload(request.get("model", "replay"), content, usage, logprobs)
+
+
+class FaultInjector:
+    """
+    Simulated API latency (uniform jitter around latency_s) and 429 responses.
+    """
+
+    def __init__(self, latency_s: float = 0.0, jitter: float = 0.5, rate_429: float = 0.0, seed: int | None = None):
+        self.latency_s = latency_s
+        self.jitter = jitter
+        self.rate_429 = rate_429
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def next(self) -> tuple[float, bool]:
+        """
+        Returns (seconds to wait, whether to answer 429).
+        """
+        with self.lock:
+            delay = self.latency_s * self.random.uniform(1 - self.jitter, 1 + self.jitter)
+            return max(0.0, delay), self.random.random() < self.rate_429
+
+
+# === Clients ===
+class _TransportClient:
+    """
+    Duck-types the part of the OpenAI client the helpers use: client.chat.completions.create(**kw).
+    """
+
+    def __init__(self, create):
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=create))
+
+
+def _rate_limit_error():
+    from openai import RateLimitError
+    response = SimpleNamespace(request=None, status_code=429, headers={})
+    return RateLimitError("Rate limit reached (injected by replay transport)", response=response, body=None)
+
+
+class ReplayClient(_TransportClient):
+    def __init__(self, store: ReplayStore, faults: FaultInjector):
+        self.store = store
+        self.faults = faults
+        super().__init__(self.create)
+
+    def create(self, **request):
+        from openai.types.chat import ChatCompletion
+
+        delay, throttle = self.faults.next()
+        time.sleep(delay)
+        if throttle:
+            raise _rate_limit_error()
+        return ChatCompletion.model_validate(self.store.respond(request, get_context()))
+
+
+class RecordingClient(_TransportClient):
+    def __init__(self, live_client, cassette_path: str):
+        self.live_client = live_client
+        self.cassette_path = cassette_path
+        self.lock = threading.Lock()
+        super().__init__(self.create)
+
+    def create(self, **request):
+        response = self.live_client.chat.completions.create(**request)
+        entry = {
+            "key": request_key(request),
+            "kind": classify_request(request),
+            "context": get_context(),
+            "response": response.model_dump(),
+        }
+        with self.lock:
+            os.makedirs(os.path.dirname(self.cassette_path) or ".", exist_ok=True)
+            with open(self.cassette_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        return response
+
+
+class ServerClient(_TransportClient):
+    """
+    OpenAI client against the local mock server, forwarding the replay context as a header.
+    """
+
+    def __init__(self, base_url: str):
+        from openai import OpenAI
+        # No SDK retries: injected 429s must reach the pipeline's own RateLimitError backoff
+        self.live_client = OpenAI(base_url=base_url, api_key=os.environ.get("OPENAI_API_KEY", "mock"), max_retries=0)
+        super().__init__(self.create)
+
+    def create(self, **request):
+        headers = {CONTEXT_HEADER: json.dumps(get_context())}
+        return self.live_client.chat.completions.create(**request, extra_headers=headers)
+
+
+def create_client(mode: str | None = None):
+    """
+    Builds the chat client for the configured transport mode.
+    """
+    mode = mode or os.environ.get("EXTRACTION_TRANSPORT", "live")
+    cassette = os.environ.get("EXTRACTION_CASSETTE", DEFAULT_CASSETTE)
+
+    if mode == "live":
+        from openai import OpenAI
+        return OpenAI()
+    if mode == "record":
+        from openai import OpenAI
+        return RecordingClient(OpenAI(), cassette)
+    if mode == "replay":
+        faults = FaultInjector(
+            latency_s=float(os.environ.get("REPLAY_LATENCY_S", "0")),
+            rate_429=float(os.environ.get("REPLAY_429_RATE", "0")),
+            seed=int(os.environ["REPLAY_SEED"]) if "REPLAY_SEED" in os.environ else None,
+        )
+        return ReplayClient(ReplayStore(cassette), faults)
+    if mode == "server":
+        return ServerClient(os.environ.get("MOCK_SERVER_URL", DEFAULT_SERVER_URL))
+    raise ValueError(f"Unknown EXTRACTION_TRANSPORT '{mode}' (expected live, record, replay or server)")
+
+
+# === Local mock server ===
+def make_server(store: ReplayStore, faults: FaultInjector, host: str = "127.0.0.1", port: int = 8765) -> ThreadingHTTPServer:
+    """
+    HTTP server imitating POST /v1/chat/completions with replayed answers.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status: int, payload: dict):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            if status == 429:
+                self.send_header("Retry-After", "1")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+                return
+
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            context = json.loads(self.headers.get(CONTEXT_HEADER, "{}"))
+
+            delay, throttle = faults.next()
+            time.sleep(delay)
+            if throttle:
+                self._send(429, {"error": {"message": "Rate limit reached (mock server)", "type": "rate_limit_error", "code": "rate_limit_exceeded"}})
+                return
+            self._send(200, store.respond(request, context))
+
+        def log_message(self, format, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local mock of the OpenAI chat-completions endpoint")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve = sub.add_parser("serve", help="Serve replayed responses over HTTP")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument("--cassette", default=DEFAULT_CASSETTE)
+    serve.add_argument("--latency", type=float, default=0.0, help="Mean seconds per response")
+    serve.add_argument("--rate-429", type=float, default=0.0, help="Fraction of requests answered with 429")
+    serve.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    store = ReplayStore(args.cassette)
+    server = make_server(store, FaultInjector(args.latency, rate_429=args.rate_429, seed=args.seed), args.host, args.port)
+    print(f"🧪 Mock OpenAI server on http://{args.host}:{args.port}/v1 "
+          f"({len(store.by_key)} recorded, {len(store.seeded_ids)} seeded PDFs)")
+    print(f"   Run the pipeline with EXTRACTION_TRANSPORT=server MOCK_SERVER_URL=http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()